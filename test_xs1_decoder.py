@@ -0,0 +1,1228 @@
+"""
+    Regression tests for the XS1 Decoder
+
+    Run with "python -m unittest discover" from this directory. The table
+    driven decoder is checked against the reference decode_opc decoder,
+    parse_line against the matchers it replaced, and the parallel decoders
+    against a single process, including when decoding fails.
+"""
+
+import csv
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import signal
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import unittest
+from StringIO import StringIO
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Keep the decoder's table cache out of the user's home directory
+CACHE = tempfile.mkdtemp(prefix='xs1-test-')
+os.environ['XS1_DECODER_CACHE'] = CACHE
+
+import xs1_core
+from xs1_core import (XS1Decoder, XS1FastDecoder, XS1VerifySummary,
+    XS1Memo, DecodedImage, DecodeMismatch, StaleTables, WorkerLost,
+    decode_buffer_parallel)
+from xs1_bench import DECODER_SCRIPT, xobjdump_line
+from xs1_batch import decode_file
+from xs1_cli import FORMAT_CONFLICTS
+from xs1_cache import DecodeCache, iter_decode_cached
+from xs1_cfg import XS1CFG, dump_programs
+from xs1_diff import BuildDiff, DumpFunctions
+from xs1_elf import XS1ElfCode, decode_elf
+from xs1_index import DumpIndex
+from xs1_output import XS1Writer, read_records
+from xs1_server import XS1DecodeServer, decode_remote
+from xs1_trace import InstructionMix, dump_lookup, elf_lookup
+
+
+def tearDownModule():
+    shutil.rmtree(CACHE, ignore_errors=True)
+
+
+def quiet(decoder):
+    """
+        Drop the failure reports that decoders print before raising
+    """
+    decoder.diagnostic = lambda text: None
+    return decoder
+
+
+# Words at the edges of the PFIX (0xf000-0xf7ff) and EOPR (0xf800-0xffff)
+# prefixes and of the operand packings
+EDGE_LOWS = [0x0000, 0x0001, 0x07ff, 0x0800, 0x6bff, 0x6c00, 0xefff, 0xf000,
+    0xf3ff, 0xf400, 0xf7ff, 0xf800, 0xf80f, 0xf810, 0xfb60, 0xfbff, 0xfc00,
+    0xffef, 0xfff0, 0xffff]
+EDGE_HIGHS = [0x0000, 0x001f, 0x0020, 0x07ff, 0x0800, 0x6c00, 0xf800, 0xffff]
+
+
+class FastDecoderTest(unittest.TestCase):
+    """
+        XS1FastDecoder against the reference XS1Decoder
+    """
+    @classmethod
+    def setUpClass(cls):
+        cls.ref = quiet(XS1Decoder())
+        cls.fast = quiet(XS1FastDecoder())
+
+    def decode(self, decoder, low, high, highvalid):
+        try:
+            return decoder.decode_word(low, high, highvalid, operands=True)
+        except KeyError:
+            return None
+
+    def assertSameDecode(self, low, high, highvalid):
+        self.assertEqual(self.decode(self.fast, low, high, highvalid),
+            self.decode(self.ref, low, high, highvalid),
+            '{:04x} {:04x} {}'.format(low, high, highvalid))
+
+    def test_tables(self):
+        self.assertEqual(self.fast.check_tables(long_step=251), [])
+
+    def test_edge_words(self):
+        for low in EDGE_LOWS:
+            self.assertSameDecode(low, 0, False)
+            for high in EDGE_HIGHS:
+                self.assertSameDecode(low, high, True)
+
+    def test_random_words(self):
+        rand = random.Random(7)
+        for unused in xrange(20000):
+            low = rand.choice([rand.randrange(0x10000),
+                rand.randrange(0xf000, 0x10000)])
+            self.assertSameDecode(low, rand.randrange(0x10000),
+                rand.random() < 0.5)
+
+    def test_operands(self):
+        # Built by hand from the packings: 3r and 2r operands keep their low
+        # two bits in bits 5:0 and combine their high bits in bits 10:6 (and
+        # bit 5 for 2r), and a PFIX word gives an immediate its high bits
+        pinned = [
+            # add r11, r5, r6
+            ((0x15b6, 0, False), ('ADD_3r', (11, 5, 6))),
+            # andnot r9, r7
+            ((0x2f67, 0, False), ('ANDNOT_2r', (9, 7))),
+            # ladd r1, r10, r4, r11, r2
+            ((0xf9d8, 0x073e, True), ('LADD_l5r', (1, 10, 4, 11, 2))),
+            # lmul r0, r1, r2, r3, r8, r11
+            ((0xf806, 0x0233, True), ('LMUL_l6r', (0, 1, 2, 3, 8, 11))),
+            # ldc r3, 0xb345
+            ((0xf2cd, 0x68c5, True), ('LDC_lru6', (3, 0xb345))),
+            # ldap r11, 0xaad55
+            ((0xf2ab, 0xd955, True), ('LDAPF_lu10', (0xaad55,))),
+        ]
+        for decoder in (self.ref, self.fast):
+            for words, expected in pinned:
+                self.assertEqual(self.decode(decoder, *words), expected,
+                    '{} {:04x} {:04x}'.format(type(decoder).__name__,
+                        *words[:2]))
+
+    def test_catalogue_on_first_read(self):
+        class Fresh(XS1Decoder):
+            pass
+        decoder = Fresh()
+        self.assertEqual(decoder.decode_word(0xa6dd, 0), 'MKMSK_rus')
+        self.assertNotIn('catalogue', Fresh.__dict__)
+        instruction = decoder.instruction('MKMSK_rus')
+        self.assertIs(Fresh.catalogue[instruction.id], instruction)
+        self.assertEqual(Fresh.mnemonics, self.ref.mnemonics)
+        self.assertEqual(Fresh.mnemonic_ids['MKMSK_rus'], instruction.id)
+
+    def table_class(self):
+        """
+            A subclass that shares the built tables but has no table file,
+            so use_table_file always reads or writes
+        """
+        class Tables(XS1FastDecoder):
+            table_file = None
+        return Tables
+
+    def table_path(self):
+        self.fast.build_tables()
+        return os.path.join(tempfile.mkdtemp(dir=CACHE), 'tables')
+
+    def test_table_round_trip(self):
+        path = self.table_path()
+        XS1FastDecoder.save_tables(path)
+        Tables = self.table_class()
+        for name in XS1FastDecoder.table_names:
+            setattr(Tables, name, None)
+        Tables.load_tables(path)
+        for name in XS1FastDecoder.table_names:
+            self.assertIsNot(getattr(Tables, name),
+                getattr(XS1FastDecoder, name))
+            self.assertEqual(getattr(Tables, name),
+                getattr(XS1FastDecoder, name), name)
+        self.assertEqual(Tables.mnemonics, XS1FastDecoder.mnemonics)
+        decoder = Tables()
+        for low in EDGE_LOWS + range(0, 0x10000, 97):
+            for high in EDGE_HIGHS:
+                self.assertEqual(decoder.decode_id(low, high, True),
+                    self.fast.decode_id(low, high, True))
+
+    def test_table_file_refused(self):
+        path = self.table_path()
+        with open(path, 'wb') as f:
+            f.write('not a table file\n')
+        Tables = self.table_class()
+        self.assertRaises(ValueError, Tables.use_table_file, path)
+        self.assertIsNone(Tables.table_file)
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), 'not a table file\n')
+
+    def test_table_file_rewritten(self):
+        path = self.table_path()
+        XS1FastDecoder.save_tables(path)
+        with open(path, 'rb') as f:
+            saved = f.read()
+        stale = saved.replace(XS1FastDecoder.source_hash(), '0' * 16, 1)
+        for damaged in (saved[:len(saved) // 2], stale):
+            with open(path, 'wb') as f:
+                f.write(damaged)
+            Tables = self.table_class()
+            self.assertRaises(StaleTables, Tables.load_tables, path)
+            Tables.use_table_file(path)
+            self.assertEqual(Tables.table_file, path)
+            with open(path, 'rb') as f:
+                self.assertEqual(f.read(), saved)
+
+
+@unittest.skipIf(numpy is None, 'numpy is not installed')
+class DecodeArrayTest(unittest.TestCase):
+    """
+        decode_array against a decode_buffer walk of the same words
+    """
+    @classmethod
+    def setUpClass(cls):
+        cls.decoder = XS1FastDecoder()
+
+    def expected(self, words):
+        """
+            IDs of a decode_buffer walk, 0 for the high words
+        """
+        ids = [0] * len(words)
+        image = struct.pack('<{}H'.format(len(words)), *words)
+        for offset, mid, unused in self.decoder.decode_buffer(image):
+            ids[offset / 2] = mid
+        return ids
+
+    def test_word_streams(self):
+        rand = random.Random(13)
+        for count in (0, 1, 2, 3, 10, 5000):
+            # Mostly prefix words, for long runs of them
+            words = [rand.choice([rand.randrange(0x10000),
+                    rand.randrange(0xf000, 0x10000)])
+                for unused in xrange(count)]
+            ids, mnemonics = self.decoder.decode_array(
+                numpy.array(words, dtype=numpy.uint16))
+            self.assertEqual(list(ids), self.expected(words), count)
+            self.assertIs(mnemonics, self.decoder.mnemonics)
+
+    def test_prefix_runs(self):
+        for run in xrange(1, 7):
+            for last in (0xf000, 0x0000):
+                words = [0x0000] + [0xf800] * run + [last]
+                ids = self.decoder.decode_array(
+                    numpy.array(words, dtype=numpy.uint16))[0]
+                self.assertEqual(list(ids), self.expected(words), words)
+
+    def test_pairs(self):
+        rand = random.Random(17)
+        pairs = [(rand.randrange(0xf000, 0x10000), rand.randrange(0x10000))
+            for unused in xrange(5000)]
+        ids = self.decoder.decode_array(numpy.array(
+            [low | high << 16 for low, high in pairs], dtype=numpy.uint32))[0]
+        self.assertEqual(list(ids), [self.decoder.decode_id(low, high, True)
+            for low, high in pairs])
+
+
+def random_line(rand):
+    """
+        A line of xobjdump output or hex, or something close to one
+    """
+    hexbytes = ['{:02x}'.format(rand.randrange(0x100))
+        for unused in xrange(rand.choice([1, 2, 3, 4, 4]))]
+    if rand.random() < 0.3:
+        hexbytes = [h.upper() for h in hexbytes]
+    line = rand.choice([' ', '', '\t']).join(hexbytes)
+    if rand.random() < 0.7:
+        line = '{}{}0x{:08x}:{}{}'.format(rand.choice(['', '.text', '.cp']),
+            rand.choice(['', ' ', '             ']), rand.randrange(1 << 32),
+            rand.choice(['', ' ', '\t']), line)
+        if rand.random() < 0.8:
+            line += rand.choice([':', ':  ', ': ']) + rand.choice([
+                'add (2rus)     r0, r1, 0x1', 'ldw (lru6)  r0, dp[0x4]',
+                'bl (lu10) ', 'nop', '(u6)', 'shl  (2r)'])
+    if rand.random() < 0.05:
+        line = rand.choice(['<main>:', 'Disassembly of section .text', ''])
+    return line + rand.choice(['\n', '', '  \n'])
+
+
+class ParseLineTest(unittest.TestCase):
+    """
+        parse_line against imatcher, whitematcher and nonarchmatcher, which
+        decode_line used to run one after another
+    """
+    def expected(self, decoder, line):
+        m = decoder.imatcher.match(line)
+        if not m:
+            return None
+        address = int(m.group(3), 16) if m.group(3) else None
+        h = decoder.whitematcher.sub('', m.group(4))
+        length = len(h) / 2
+        low = int(h[2:4] + h[:2], 16)
+        high = int(h[6:8] + h[4:6], 16) if length == 4 else 0
+        span = None
+        if address is not None:
+            n = decoder.nonarchmatcher.match(line)
+            if n:
+                span = n.span(5)
+        return address, low, high, length, span
+
+    def test_random_lines(self):
+        decoder = XS1Decoder()
+        rand = random.Random(11)
+        for unused in xrange(20000):
+            line = random_line(rand)
+            self.assertEqual(decoder.parse_line(line),
+                self.expected(decoder, line), repr(line))
+
+
+def baseline_check(instr, encoding, decoded):
+    """
+        The string slicing check of the original verify_decode
+    """
+    m = [instr, '(' + encoding + ')']
+    d = decoded.split('_')
+    return bool(
+        ( m[0] == d[0][:len(m[0])] or
+         ( m[0][0] == 'B' and d[0][0] == 'B' ) or
+         ( m[0] == 'INIT' and d[0][:5] == 'TINIT') or
+         ( m[0] == 'SET' and d[0][:4] == 'TSET') or
+         ( m[0] == 'CRC32' and d[0][:3] == 'CRC' ) ) and
+        ( m[1][1:-1] == d[1] or
+         ( m[1][1:-1] == 'r2r' and d[1] == '2r' ) or
+         ( m[1][1:-1] == 'lr2r' and d[1] == 'l2r' ) ) )
+
+
+class VerifyTest(unittest.TestCase):
+    """
+        check_annotation and its alias tables against the original check,
+        and XS1VerifySummary
+    """
+    def test_aliases(self):
+        decoder = XS1Decoder()
+        catalogue = [i for i in decoder.catalogue[1:] if i.encoding]
+        # xobjdump's names for every instruction, the aliased ones and some
+        # shorter and longer names
+        instrs = set(i.instr for i in catalogue)
+        instrs.update(['INIT', 'SET', 'CRC32', 'CRC8', 'B', 'BL', 'BU', 'BT',
+            'LD', 'ST', 'T', 'TINITX', 'SETC', 'XOR', 'ZEXTX'])
+        checked = 0
+        for d in catalogue:
+            # The instruction's own encoding, the aliased ones, a longer
+            # name and a different one
+            encodings = [d.encoding, 'r2r', 'lr2r', d.encoding + 'x',
+                '3r' if d.encoding != '3r' else '2r']
+            for instr in instrs:
+                for encoding in encodings:
+                    self.assertEqual(
+                        decoder.check_annotation(instr, encoding, d.name),
+                        baseline_check(instr, encoding, d.name),
+                        (instr, encoding, d.name))
+                    checked += 1
+        self.assertGreater(checked, 150000)
+
+    def test_alias_cases(self):
+        decoder = XS1Decoder()
+        for instr, encoding, decoded, ok in (
+                ('INIT', '2r', 'TINITPC_2r', True),
+                ('INIT', 'lr2r', 'TINITLR_l2r', True),
+                ('SET', 'r2r', 'TSETMR_2r', True),
+                ('SET', 'r2r', 'TSETR_3r', False),
+                ('SET', 'r2r', 'SETPSC_2r', True),
+                ('CRC32', 'l3r', 'CRC_l3r', True),
+                ('CRC32', 'l4r', 'CRC8_l4r', True),
+                ('BRFT', 'ru6', 'BRBF_ru6', True),
+                ('BRFT', 'lru6', 'BRBF_ru6', False),
+                ('BL', 'lu10', 'BLACP_lu10', True),
+                ('CLZ', 'lr2r', 'CLZ_l2r', True),
+                ('CLZ', 'l2r', 'CLZ_l2r', True),
+                ('ADD', 'r2r', 'ADD_3r', False)):
+            self.assertEqual(decoder.check_annotation(instr, encoding,
+                decoded), ok, (instr, encoding, decoded))
+
+    def test_summary(self):
+        results = [None, (0x10, 'ADD', '3r', 'ADD_3r', True)] + [
+            (0x20 + 2 * i, 'SHL', '3r', 'ADD_3r', False) for i in xrange(10)
+        ] + [(0x40, 'LDW', 'lru6', None, False)]
+        whole = XS1VerifySummary()
+        for result in results:
+            whole.add(result)
+        merged = XS1VerifySummary()
+        for part in (results[:5], results[5:9], results[9:]):
+            summary = XS1VerifySummary()
+            for result in part:
+                summary.add(result)
+            merged.merge(summary)
+        self.assertEqual((merged.checked, merged.mismatched,
+            merged.mismatches), (whole.checked, whole.mismatched,
+            whole.mismatches))
+        self.assertEqual(whole.report().split('\n'), [
+            'checked 12, mismatches 11',
+            '    shl (3r) decoded as ADD_3r: 10 at ' + ', '.join(
+                '0x{:08x}'.format(0x20 + 2 * i) for i in xrange(8))
+                + ', ...',
+            '    ldw (lru6) decoded as nothing: 1 at 0x00000040'])
+
+
+class ParallelBufferTest(unittest.TestCase):
+    """
+        decode_buffer_parallel against a single decode_buffer walk, with
+        chunks small enough to split PFIX/EOPR pairs and runs of prefixes
+    """
+    @classmethod
+    def setUpClass(cls):
+        cls.decoder = XS1FastDecoder()
+        rand = random.Random(5)
+        # Mostly prefix words, so that chunks often start on a high word
+        # that looks like a prefix itself
+        words = [rand.choice([rand.randrange(0x10000),
+                rand.randrange(0xf000, 0x10000)])
+            for unused in xrange(3000)]
+        cls.image = struct.pack('<{}H'.format(len(words)), *words)
+        fd, cls.path = tempfile.mkstemp(dir=CACHE, suffix='.bin')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(cls.image)
+
+    def test_chunk_sizes(self):
+        expected = list(self.decoder.decode_buffer(self.image))
+        for chunk_bytes in (4, 6, 8, 10, 34, 1000):
+            self.assertEqual(list(decode_buffer_parallel(self.path, 2,
+                chunk_bytes=chunk_bytes)), expected, chunk_bytes)
+
+    def test_ranges(self):
+        for offset, end in ((2, 5000), (6, 6), (1000, 1010), (4, None)):
+            self.assertEqual(list(decode_buffer_parallel(self.path, 3,
+                    offset, end, chunk_bytes=6)),
+                list(self.decoder.decode_buffer(self.image, offset, end)),
+                (offset, end))
+
+
+def killed_task(number, victim):
+    """
+        Pool task that dies, as a worker killed for lack of memory would,
+        on task victim
+    """
+    if number == victim:
+        os.kill(os.getpid(), signal.SIGKILL)
+    return number
+
+
+class ParallelFailureTest(unittest.TestCase):
+    """
+        --jobs on a dump with an xobjdump mismatch part way through, which
+        must stop with the output and exit status of a single process
+        rather than hang with chunks still in flight
+    """
+    timeout = 120
+
+    @classmethod
+    def setUpClass(cls):
+        decoder = XS1FastDecoder()
+        rand = random.Random(3)
+        words = [w for w in rand.sample(xrange(0xf000), 2000)
+            if decoder.decode_id(w)]
+        fd, cls.path = tempfile.mkstemp(dir=CACHE, suffix='.dump')
+        with os.fdopen(fd, 'w') as f:
+            for i in xrange(30000):
+                word = rand.choice(words)
+                name = decoder.mnemonics[decoder.decode_id(word)]
+                if i == 20000:
+                    # xobjdump and the decoder disagree about this one
+                    name = 'SHL_2r' if name != 'SHL_2r' else 'ADD_3r'
+                f.write(xobjdump_line(0x10000 + 2 * i, [word], name))
+
+    def run_cli(self, *args):
+        """
+            Exit status, standard output and error of the command line on
+            the dump, killing it and its workers if it runs too long
+        """
+        with open(self.path) as stdin:
+            proc = subprocess.Popen([sys.executable, DECODER_SCRIPT]
+                    + list(args), stdin=stdin, stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE, preexec_fn=os.setsid)
+        timer = threading.Timer(self.timeout, os.killpg,
+            (proc.pid, signal.SIGKILL))
+        timer.start()
+        try:
+            out, err = proc.communicate()
+        finally:
+            timer.cancel()
+        self.assertNotEqual(proc.returncode, -signal.SIGKILL,
+            '{} hung'.format(' '.join(args)))
+        return proc.returncode, out, err
+
+    def test_mismatch(self):
+        for mode in (['--xobjdump-sub'], ['--xobjdump-merge', ' # ']):
+            status, out, err = self.run_cli(*mode)
+            self.assertEqual(status, 1)
+            self.assertIn('DecodeMismatch', err)
+            for jobs in ('2', '3', '4'):
+                self.assertEqual(self.run_cli('--jobs', jobs, *mode)[:2],
+                    (status, out), (mode, jobs))
+
+    def test_verify(self):
+        status, out, err = self.run_cli('--verify')
+        self.assertEqual(status, 1)
+        self.assertEqual(out.split('\n')[0], 'checked 30000, mismatches 1')
+        for jobs in ('2', '4'):
+            self.assertEqual(self.run_cli('--verify', '--jobs', jobs)[:2],
+                (status, out), jobs)
+
+    def map_killed(self, victim, stop=None):
+        """
+            Results of _map_ordered over tasks 0-39 until task stop, with
+            'lost' for WorkerLost, failing rather than hanging if it does
+        """
+        results = []
+        def run():
+            ordered = xs1_core._map_ordered(multiprocessing.Pool(2),
+                killed_task, ((i, victim) for i in xrange(40)), 2)
+            try:
+                for unused, number in ordered:
+                    results.append(number)
+                    if number == stop:
+                        break
+            except WorkerLost:
+                results.append('lost')
+            finally:
+                ordered.close()
+        thread = threading.Thread(target=run)
+        thread.daemon = True
+        thread.start()
+        thread.join(self.timeout)
+        self.assertFalse(thread.is_alive(), 'worker {} hung'.format(victim))
+        return results
+
+    def test_worker_killed(self):
+        self.assertEqual(self.map_killed(5), range(5) + ['lost'])
+        self.assertEqual(self.map_killed(0), ['lost'])
+        # Stopped while the lost task is still in flight
+        self.assertEqual(self.map_killed(4, stop=3), range(4))
+
+
+def short_word(decoder, name):
+    """
+        The first 16-bit word that decodes as name
+    """
+    return decoder.short_table.index(decoder.mnemonic_ids[name])
+
+
+def encode(decoder, name, *operands):
+    """
+        The first 16-bit word that decodes as name with operands
+    """
+    mid = decoder.mnemonic_ids[name]
+    return next(w for w, i in enumerate(decoder.short_table) if i == mid
+        and decoder.decode_operands(name, w) == operands)
+
+
+def xcore_elf(address, words):
+    """
+        A minimal XCore ELF image with one .text section of words at address
+    """
+    text = struct.pack('<{}H'.format(len(words)), *words)
+    names = '\0.text\0.shstrtab\0'
+    shoff = 52 + len(text) + len(names)
+    header = struct.pack('<16sHHIIIIIHHHHHH', '\x7fELF\x01\x01\x01',
+        2, 0xcb, 1, address, 0, shoff, 0, 52, 0, 0, 40, 3, 2)
+    sections = struct.pack('<10I', *[0] * 10) + struct.pack('<10I',
+        1, 1, 6, address, 52, len(text), 0, 0, 2, 0) + struct.pack('<10I',
+        7, 3, 0, 0, 52 + len(text), len(names), 0, 0, 1, 0)
+    return header + text + names + sections
+
+
+class TraceTest(unittest.TestCase):
+    """
+        Instruction mix of a trace of two tiles that run different code at
+        the same addresses
+    """
+    trace = [
+        'tile[0]@0- -A-.----00010000 (_start + 0) : and r0, r1, r2 @10\n',
+        'tile[1]@0- -A-.----00010000 (_start + 0) : ldc r0, 0x1 @11\n',
+        'tile[1]@2- -A-.----00010000 (_start + 0) : ldc r0, 0x1 @12\n',
+        'not an instruction\n',
+    ]
+
+    @classmethod
+    def setUpClass(cls):
+        cls.decoder = XS1FastDecoder()
+        cls.words = [short_word(cls.decoder, name)
+            for name in ('AND_3r', 'LDC_ru6')]
+
+    def counts(self, mix):
+        """
+            Executed mnemonics of each thread
+        """
+        mnemonics = self.decoder.mnemonics
+        return dict((key, dict((mnemonics[mid], count)
+                for mid, count in enumerate(counts) if count))
+            for key, counts in mix.threads.items())
+
+    def check(self, lookup_id):
+        mix = InstructionMix(lookup_id, self.decoder.catalogue)
+        mix.add_trace(self.trace)
+        self.assertEqual(self.counts(mix), {
+            ('tile[0]', 0): {'AND_3r': 1},
+            ('tile[1]', 0): {'LDC_ru6': 1},
+            ('tile[1]', 2): {'LDC_ru6': 1}})
+        self.assertEqual((mix.lines, mix.unmatched, len(mix.memo)), (4, 1, 2))
+
+    def test_dump(self):
+        dump = []
+        for tile, word in enumerate(self.words):
+            dump += ['Loadable {} for tile[{}] (node "0", tile {}):\n'.format(
+                    tile + 1, tile, tile), '<_start>:\n', xobjdump_line(
+                0x10000, [word], self.decoder.mnemonics[
+                    self.decoder.decode_id(word)])]
+        self.check(dump_lookup(dump, self.decoder))
+
+    def test_elf(self):
+        fd, path = tempfile.mkstemp(dir=CACHE, suffix='.xe')
+        with os.fdopen(fd, 'wb') as f:
+            f.write('XMOS\0\0\0\0')
+            for word in self.words:
+                f.write(xcore_elf(0x10000, [word]))
+        code = XS1ElfCode(path, self.decoder)
+        try:
+            self.check(elf_lookup(code))
+        finally:
+            code.close()
+
+    def test_elf_errors(self):
+        directory = tempfile.mkdtemp(dir=CACHE)
+        empty = os.path.join(directory, 'empty.xe')
+        text = os.path.join(directory, 'text.xe')
+        open(empty, 'wb').close()
+        with open(text, 'wb') as f:
+            f.write('not an ELF\n')
+        missing = os.path.join(directory, 'missing.xe')
+        for path, error in ((empty, ValueError), (text, ValueError),
+                (missing, IOError)):
+            self.assertRaises(error, decode_elf, path, self.decoder)
+            self.assertRaises(error, XS1ElfCode, path, self.decoder)
+            for args in (['--elf', path], ['--trace', '-', '--elf', path]):
+                proc = subprocess.Popen([sys.executable, DECODER_SCRIPT]
+                    + args, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                    stderr=subprocess.PIPE)
+                out, err = proc.communicate('')
+                self.assertEqual(proc.returncode, 1)
+                self.assertTrue(err.startswith('--elf: '), err)
+                self.assertNotIn('Traceback', err)
+
+
+class CacheTest(unittest.TestCase):
+    """
+        iter_decode_cached against decode_line, cold and warm, after a
+        rebuild moves the code and after an annotation changes
+    """
+    def setUp(self):
+        self.decoder = quiet(XS1FastDecoder())
+        self.cache = DecodeCache(tempfile.mkdtemp(dir=CACHE), 1 << 20)
+        words = [short_word(self.decoder, name)
+            for name in ('AND_3r', 'LDC_ru6', 'ADD_3r')]
+        self.lines = ['Disassembly of section .text:\n', '\n', '<main>:\n']
+        for i, word in enumerate(words * 3):
+            self.lines.append(xobjdump_line(0x10000 + 2 * i, [word],
+                self.decoder.mnemonics[self.decoder.decode_id(word)]))
+            if i % 4 == 3:
+                self.lines += ['\n', '<f{}>:\n'.format(i)]
+
+    def decode(self, lines, merge=None, replace=False, chunk_lines=3):
+        return list(iter_decode_cached(self.decoder, lines, self.cache,
+            merge, replace, chunk_lines))
+
+    def test_modes(self):
+        for merge, replace in ((None, False), (' # ', False), (None, True)):
+            expected = [self.decoder.decode_line(line, merge, replace)
+                for line in self.lines]
+            misses = self.cache.misses
+            self.assertEqual(self.decode(self.lines, merge, replace), expected)
+            self.assertGreater(self.cache.misses, misses)
+            hits = self.cache.hits
+            misses = self.cache.misses
+            self.assertEqual(self.decode(self.lines, merge, replace), expected)
+            self.assertEqual(self.cache.misses, misses)
+            self.assertGreater(self.cache.hits, hits)
+
+    def test_shifted(self):
+        # A rebuild with one more instruction at the start of main moves
+        # every function after it
+        word = short_word(self.decoder, 'LDC_ru6')
+        shifted = self.lines[:3] + [xobjdump_line(0x10000, [word], 'LDC_ru6')]
+        for line in self.lines[3:]:
+            if line.startswith('0x'):
+                address, rest = line.split(':', 1)
+                line = '0x{:08x}:{}'.format(int(address, 16) + 2, rest)
+            shifted.append(line)
+        for merge, replace in ((None, False), (' # ', False), (None, True)):
+            self.decode(self.lines, merge, replace, 4096)
+            hits = self.cache.hits
+            misses = self.cache.misses
+            self.assertEqual(self.decode(shifted, merge, replace, 4096),
+                [self.decoder.decode_line(line, merge, replace)
+                    for line in shifted])
+            # Only main's instructions are decoded again; the section
+            # header, the blank line, the three labels and both functions
+            # after main hit
+            self.assertEqual(self.cache.misses - misses, 1)
+            self.assertEqual(self.cache.hits - hits, 7)
+
+    def test_changed_annotation(self):
+        self.decode(self.lines, ' # ')
+        lines = list(self.lines)
+        lines[-1] = lines[-1].replace('add (3r)', 'shl (3r)')
+        results = iter_decode_cached(self.decoder, lines, self.cache, ' # ')
+        with self.assertRaises(DecodeMismatch):
+            list(results)
+
+
+class StatsTest(unittest.TestCase):
+    """
+        Stage times of enable_stats, on a clock that ticks once per reading
+        so that each timed call counts exactly 1, and nested timing shows
+    """
+    def setUp(self):
+        ticks = iter(xrange(1 << 30))
+        self.clock = xs1_core.time.time
+        xs1_core.time.time = lambda: float(next(ticks))
+
+    def tearDown(self):
+        xs1_core.time.time = self.clock
+
+    def test_verify_stages(self):
+        decoder = XS1FastDecoder()
+        stats = decoder.enable_stats()
+        word = short_word(decoder, 'ADD_3r')
+        lines = [xobjdump_line(0x10000 + 2 * i, [word], 'ADD_3r')
+            for i in xrange(10)] + ['<main>:\n']
+        results = list(decoder.iter_decode(file_handle=lines, verify=True))
+        self.assertEqual(results[-1], None)
+        self.assertTrue(all(r[4] for r in results[:-1]))
+        self.assertEqual(stats.times, {'parse': 11, 'decode': 10,
+            'verify': 20, 'output': 0})
+        self.assertEqual((stats.lines, stats.matched, stats.failures),
+            (11, 10, 0))
+
+
+class BatchFileTest(unittest.TestCase):
+    """
+        decode_file against decode_line, and on a dump that fails
+    """
+    def setUp(self):
+        self.decoder = XS1FastDecoder()
+        self.directory = tempfile.mkdtemp(dir=CACHE)
+        word = short_word(self.decoder, 'ADD_3r')
+        self.lines = ['<main>:\n'] + [xobjdump_line(0x10000 + 2 * i, [word],
+            'ADD_3r') for i in xrange(5)]
+
+    def decode(self, lines, merge=None, replace=False):
+        path = os.path.join(self.directory, 'in.dump')
+        with open(path, 'w') as f:
+            f.writelines(lines)
+        output = path + '.out'
+        reports = []
+        self.decoder.diagnostic = reports.append
+        result = decode_file(self.decoder, path, output, merge, replace)
+        self.assertEqual(reports, [])
+        text = None
+        if os.path.exists(output):
+            with open(output) as f:
+                text = f.read()
+        return result[2:4], result[6], text
+
+    def test_modes(self):
+        for merge, replace in ((None, False), (' # ', False), (None, True)):
+            expected = [self.decoder.decode_line(line, merge, replace)
+                for line in self.lines]
+            self.assertEqual(self.decode(self.lines, merge, replace),
+                ((6, 5), None, ''.join(d + '\n' for d in expected if d)))
+
+    def test_mismatch(self):
+        lines = list(self.lines)
+        lines[3] = lines[3].replace('add (3r)', 'shl (3r)')
+        counts, error, text = self.decode(lines, ' # ')
+        self.assertTrue(error.startswith('line 4: DecodeMismatch'), error)
+        self.assertEqual(text, None)
+
+
+class ServerTest(unittest.TestCase):
+    """
+        XS1DecodeServer answers as decode_line does, with null and nothing
+        printed for lines that fail
+    """
+    def test_modes(self):
+        decoder = XS1FastDecoder()
+        word = short_word(decoder, 'ADD_3r')
+        lines = ['<main>:', xobjdump_line(0x10000, [word], 'ADD_3r'),
+            xobjdump_line(0x10002, [word], 'SHL_3r'), 'ff ff']
+        path = os.path.join(tempfile.mkdtemp(dir=CACHE), 'socket')
+        server = XS1DecodeServer(path, decoder)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        stdout = sys.stdout
+        sys.stdout = printed = StringIO()
+        try:
+            for mode, merge, replace in (('default', None, False),
+                    ('merge', ' # ', False), ('sub', None, True)):
+                # The third line only fails its annotation check
+                expected = [decoder.decode_line(line, merge, replace)
+                    for line in lines[:2]] + [
+                    None if merge or replace else 'ADD_3r', None]
+                self.assertEqual(decode_remote(path, lines, mode, merge),
+                    expected, mode)
+        finally:
+            sys.stdout = stdout
+            server.shutdown()
+            server.server_close()
+            thread.join()
+        self.assertEqual(printed.getvalue(), '')
+
+
+class CFGTest(unittest.TestCase):
+    """
+        XS1CFG and dump_programs on a small hand built program
+    """
+    # main calls f and loops on itself, then returns. The block after it
+    # is reached by nothing, and f ends in a branch to g, a tail call
+    program = [
+        ('<main>:', None),
+        (0x10000, ('ADD_3r', 0, 0, 0)),
+        (0x10002, ('BLRF_u10', 6)),
+        (0x10004, ('ADD_3r', 0, 0, 0)),
+        (0x10006, ('BRBT_ru6', 0, 2)),
+        (0x10008, ('RETSP_u6', 0)),
+        (0x1000a, ('ADD_3r', 0, 0, 0)),
+        (0x1000c, ('ADD_3r', 0, 0, 0)),
+        (0x1000e, ('RETSP_u6', 0)),
+        ('<f>:', None),
+        (0x10010, ('ADD_3r', 0, 0, 0)),
+        (0x10012, ('BRFU_u6', 0)),
+        ('<g>:', None),
+        (0x10014, ('ADD_3r', 0, 0, 0)),
+        (0x10016, ('RETSP_u6', 0)),
+    ]
+
+    @classmethod
+    def setUpClass(cls):
+        cls.decoder = XS1FastDecoder()
+        cls.lines = ['\n']
+        for address, instruction in cls.program:
+            if instruction is None:
+                cls.lines.append(address + '\n')
+            else:
+                cls.lines.append(xobjdump_line(address,
+                    [encode(cls.decoder, *instruction)], instruction[0]))
+
+    def test_report(self):
+        programs = dump_programs(self.lines, self.decoder)
+        self.assertEqual(len(programs), 1)
+        tile, image, entries = programs[0]
+        self.assertEqual((tile, sorted(entries)), (None, [0x10000, 0x10010,
+            0x10014]))
+        cfg = XS1CFG(image, entries)
+        self.assertEqual([(b.start, b.end, b.successors) for b in cfg.blocks],
+            [(0x10000, 0x10004, [0x10004]),
+            (0x10004, 0x10008, [0x10004, 0x10008]),
+            (0x10008, 0x1000a, []),
+            (0x1000a, 0x10010, []),
+            (0x10010, 0x10014, [0x10014]),
+            (0x10014, 0x10018, [])])
+        self.assertEqual(cfg.report().split('\n'), [
+            '12 instructions, 6 blocks, 3 functions, 1 unreachable blocks',
+            'function 0x00010000: 3 blocks, 1 loops, 0 indirect calls, '
+                'calls 0x00010010',
+            'function 0x00010010: 1 blocks, 0 loops, 0 indirect calls, '
+                'calls 0x00010014',
+            'function 0x00010014: 1 blocks, 0 loops, 0 indirect calls, '
+                'calls -',
+            'loop 0x00010004 -> 0x00010004',
+            'unreachable 0x0001000a-0x00010010'])
+
+    def test_tiles(self):
+        # tile[1] runs only the first instruction of main
+        lines = ['tile.xe: file format elf32-xcore\n']
+        for tile, count in enumerate((len(self.lines), 3)):
+            lines.append('Loadable {} for tile[{}] (node "0", tile {}):\n'
+                .format(tile + 1, tile, tile))
+            lines += self.lines[:count]
+        programs = dump_programs(lines, self.decoder)
+        self.assertEqual([(tile, len(image), sorted(entries))
+                for tile, image, entries in programs],
+            [('tile[0]', 12, [0x10000, 0x10010, 0x10014]),
+            ('tile[1]', 1, [0x10000])])
+        self.assertEqual(XS1CFG(*programs[1][1:]).report(),
+            '1 instructions, 1 blocks, 1 functions, 0 unreachable blocks\n'
+            'function 0x00010000: 1 blocks, 0 loops, 0 indirect calls, '
+            'calls -')
+        # Both tiles in one image
+        merged = [l for l in lines if not l.startswith('Loadable')]
+        with self.assertRaises(ValueError):
+            XS1CFG(dump_programs(merged, self.decoder)[0][1])
+
+
+class DiffTest(unittest.TestCase):
+    """
+        BuildDiff of two small builds with every kind of change
+    """
+    old = [
+        ('main', ['ADD_3r', 'ADD_3r', 'LDC_ru6']),
+        ('f', ['ADD_3r', 'AND_3r', 'AND_3r', 'ADD_3r']),
+        ('gone', ['LDC_ru6']),
+        ('old_name', ['AND_3r', 'AND_3r', 'LDC_ru6']),
+        ('repeated', ['ADD_3r']),
+        ('repeated', ['LDC_ru6']),
+    ]
+    # f's label is indented, and repeated gains an occurrence first
+    new = [
+        ('main', ['ADD_3r', 'ADD_3r', 'LDC_ru6']),
+        ('  <f>', ['ADD_3r', 'AND_3r', 'LDC_ru6', 'AND_3r', 'ADD_3r']),
+        ('new_name', ['AND_3r', 'AND_3r', 'LDC_ru6']),
+        ('added', ['ADD_3r', 'LDC_ru6']),
+        ('repeated', ['AND_3r']),
+        ('repeated', ['ADD_3r']),
+        ('repeated', ['LDC_ru6']),
+    ]
+
+    @classmethod
+    def setUpClass(cls):
+        cls.decoder = XS1FastDecoder()
+        cls.paths = []
+        for build in (cls.old, cls.new):
+            fd, path = tempfile.mkstemp(dir=CACHE, suffix='.dump')
+            with os.fdopen(fd, 'w') as f:
+                f.write('\nDisassembly of section .text:\n')
+                address = 0x10000
+                for symbol, names in build:
+                    if not symbol.endswith('>'):
+                        symbol = '<{}>'.format(symbol)
+                    f.write('\n{}:\n'.format(symbol))
+                    for name in names:
+                        f.write(xobjdump_line(address,
+                            [short_word(cls.decoder, name)], name))
+                        address += 2
+            cls.paths.append(path)
+
+    def test_report(self):
+        old, new = [DumpFunctions(path, self.decoder) for path in self.paths]
+        self.assertEqual(old.groups['repeated'], ['repeated', 'repeated#2'])
+        diff = BuildDiff(old, new)
+        self.assertEqual(diff.report().split('\n'), [
+            '6 functions in {}, 7 in {}: 3 unchanged, 1 changed, 1 renamed, '
+                '2 added, 1 removed'.format(*self.paths),
+            'changed <f>: 4 -> 5 instructions, 1 inserted, 0 deleted, '
+                '0 replaced, similarity 0.889',
+            '    +1 LDC_ru6',
+            'renamed <old_name> -> <new_name>',
+            'added <added>: 2 instructions',
+            'added <repeated>: 1 instructions',
+            'removed <gone>: 1 instructions',
+            'mix +1 ADD_3r +1 AND_3r +1 LDC_ru6'])
+
+    def test_jobs(self):
+        for path in self.paths:
+            single = DumpFunctions(path, self.decoder)
+            parallel = DumpFunctions(path, self.decoder, 2, chunk_bytes=100)
+            self.assertEqual((parallel.symbols, parallel.functions),
+                (single.symbols, single.functions))
+
+
+class DumpIndexTest(unittest.TestCase):
+    """
+        DumpIndex against filtering the whole dump by address, and its
+        rebuilding when the dump changes
+    """
+    def setUp(self):
+        decoder = XS1FastDecoder()
+        word = short_word(decoder, 'ADD_3r')
+        # Two tiles at the same addresses, with labels every 16 lines
+        self.dump = []
+        for tile in xrange(2):
+            self.dump.append('Loadable {} for tile[{}]:\n'.format(tile + 1,
+                tile))
+            for i in xrange(500):
+                if i % 16 == 0:
+                    self.dump += ['\n', '<f{}>:\n'.format(i)]
+                self.dump.append(xobjdump_line(0x10000 + 2 * i, [word],
+                    'ADD_3r'))
+        self.path = os.path.join(tempfile.mkdtemp(dir=CACHE), 'a.dump')
+        self.write(self.dump)
+
+    def write(self, lines):
+        with open(self.path, 'w') as f:
+            f.writelines(lines)
+
+    def expected(self, low, high):
+        """
+            The lines with addresses from low up to high, and the lines
+            without one just before them
+        """
+        lines = []
+        pending = []
+        for line in self.dump:
+            if '0x' not in line:
+                pending.append(line)
+                continue
+            if low <= int(line.split(':')[0], 16) < high:
+                lines += pending + [line]
+            pending = []
+        return lines
+
+    def test_lines(self):
+        index = DumpIndex(self.path, block_bytes=1000)
+        self.assertTrue(index.built)
+        self.assertGreater(len(index.offsets), 10)
+        rand = random.Random(19)
+        ranges = [(0, 1 << 32), (0x10000, 0x10002), (0x10020, 0x10022),
+            (0x103e0, 0x10400), (0x20000, 0x30000)]
+        for unused in xrange(50):
+            low = rand.randrange(0xff00, 0x10500)
+            ranges.append((low, low + rand.randrange(1, 0x100)))
+        for low, high in ranges:
+            self.assertEqual(list(index.lines(low, high)),
+                self.expected(low, high), (low, high))
+
+    def test_labels(self):
+        # Every labelled address, with blocks cut at many places between
+        # the labels and their instructions
+        labelled = [int(line.split(':')[0], 16)
+            for previous, line in zip(self.dump, self.dump[1:])
+            if previous.startswith('<')]
+        for block_bytes in range(200, 1200, 37) + [1500, 4096]:
+            index = DumpIndex(self.path, '{}.{}'.format(self.path,
+                block_bytes), block_bytes)
+            for address in labelled:
+                self.assertEqual(list(index.lines(address, address + 2)),
+                    self.expected(address, address + 2),
+                    (block_bytes, address))
+
+    def test_rebuild(self):
+        self.assertTrue(DumpIndex(self.path).built)
+        self.assertFalse(DumpIndex(self.path).built)
+        # A different size
+        del self.dump[-1]
+        self.write(self.dump)
+        index = DumpIndex(self.path)
+        self.assertTrue(index.built)
+        self.assertEqual(list(index.lines(0x103e0, 0x10400)),
+            self.expected(0x103e0, 0x10400))
+        # The same size, but a different modification time
+        st = os.stat(self.path)
+        os.utime(self.path, (st.st_atime, st.st_mtime - 10))
+        self.assertTrue(DumpIndex(self.path).built)
+        self.assertFalse(DumpIndex(self.path).built)
+
+    def test_wide_address(self):
+        word = self.dump[-1].split(':')[1]
+        self.dump.append('0x100000000:{}'.format(word))
+        self.write(self.dump)
+        # Kept in memory, but not saved
+        index = DumpIndex(self.path)
+        self.assertFalse(os.path.exists(index.index_path))
+        self.assertEqual(list(index.lines(0xffffffff, 0x100000002)),
+            self.dump[-1:])
+        self.assertRaises(ValueError, index.save)
+
+
+class MemoTest(unittest.TestCase):
+    """
+        XS1Memo generations and counts, and the memos of enable_memo
+    """
+    def test_generations(self):
+        calls = []
+        memo = XS1Memo(4)
+        lookup = memo.memoize(lambda key: calls.append(key) or key.upper())
+        # Two entries per generation
+        for key in 'abcadb':
+            self.assertEqual(lookup(key, key), key.upper())
+        # c found the current generation full, which became the older one,
+        # where a was found again. d turned c and a into the older
+        # generation, so b had been dropped
+        self.assertEqual(calls, list('abcdb'))
+        self.assertEqual((memo.hits, memo.misses, len(memo)), (1, 5, 4))
+        self.assertEqual((sorted(memo.previous), sorted(memo.current)),
+            (['a', 'c'], ['b', 'd']))
+        lookup('b', 'b')
+        self.assertEqual((memo.hits, memo.misses), (2, 5))
+        self.assertEqual(memo.report(),
+            'hits 2, misses 5 (28.6% hits), entries 4')
+
+    def test_enable_memo(self):
+        decoder = XS1FastDecoder()
+        lines = [xobjdump_line(0x10000 + 2 * i, [short_word(decoder, name)],
+                name) for i, name in enumerate(['ADD_3r', 'LDC_ru6'] * 5)]
+        expected = [decoder.decode_line(line, ' # ') for line in lines]
+        words, line_memo = decoder.enable_memo(32, lines=True)
+        try:
+            self.assertEqual([decoder.decode_line(line, ' # ')
+                for line in lines], expected)
+            # Each line is new, and only the first two words are
+            self.assertEqual((line_memo.hits, line_memo.misses), (0, 10))
+            self.assertEqual((words.hits, words.misses), (8, 2))
+            self.assertEqual([decoder.decode_line(line, ' # ')
+                for line in lines], expected)
+            self.assertEqual(line_memo.hits, 10)
+        finally:
+            decoder.disable_memo()
+        self.assertNotIn('decode_line', decoder.__dict__)
+
+
+class DecodedImageTest(unittest.TestCase):
+    """
+        DecodedImage built from tup mode results and from lines
+    """
+    def setUp(self):
+        self.decoder = XS1FastDecoder()
+        self.names = ['ADD_3r', 'LDC_ru6', 'AND_3r']
+        self.lines = ['<main>:\n'] + [xobjdump_line(0x10000 + 2 * i,
+                [short_word(self.decoder, name)], name)
+            for i, name in enumerate(self.names * 2)]
+
+    def test_add(self):
+        image = DecodedImage(self.decoder)
+        # Out of order, and with a line that has no address
+        for line in self.lines[4:] + self.lines[:4] + ['dd a6']:
+            decoded = self.decoder.decode_line(line, tup=True)
+            if decoded is not None:
+                image.add(decoded)
+        self.assertEqual(list(image.names()), [(0x10000 + 2 * i, name)
+            for i, name in enumerate(self.names * 2)])
+        self.assertEqual(list(image.words), [0] * 6)
+
+    def test_index(self):
+        image = DecodedImage.from_lines(self.lines, self.decoder)
+        self.assertEqual(len(image), 6)
+        self.assertEqual([image.index(a) for a in
+            (0x10000, 0x10004, 0x1000a, 0x10001, 0xfffe, 0x1000c)],
+            [0, 2, 5, -1, -1, -1])
+        self.assertEqual(image.lookup(0x10002), 'LDC_ru6')
+        self.assertEqual(image.lookup(0x10003), None)
+        self.assertEqual(image.lookup_instruction(0x10004).encoding, '3r')
+        self.assertEqual(image.words[1], short_word(self.decoder, 'LDC_ru6'))
+
+    def test_slice(self):
+        image = DecodedImage.from_lines(self.lines, self.decoder)
+        for start, end, names in ((0x10002, 0x10006, self.names[1:]),
+                (0x10001, 0x10005, self.names[1:]),
+                (0x1000a, 0x20000, self.names[2:]),
+                (0x10006, 0x10006, []), (0, 0x10000, [])):
+            part = image.slice(start, end)
+            self.assertEqual([name for unused, name in part.names()], names,
+                (start, end))
+            self.assertEqual(zip(part.addresses, part.words),
+                [(a, w) for a, w in zip(image.addresses, image.words)
+                    if start <= a < end])
+
+
+class OutputTest(unittest.TestCase):
+    """
+        XS1Writer records in each format, read back, and the options that
+        --format refuses
+    """
+    @classmethod
+    def setUpClass(cls):
+        cls.decoder = quiet(XS1FastDecoder())
+        ldc = short_word(cls.decoder, 'LDC_ru6')
+        cls.lines = [
+            '<main>:\n',
+            xobjdump_line(0x10000, [short_word(cls.decoder, 'AND_3r')],
+                'AND_3r'),
+            xobjdump_line(0x10002, [0xf000, ldc], 'LDC_lru6'),
+            'dd a6\n',
+        ]
+        cls.records = list(cls.decoder.iter_records(cls.lines))
+
+    def write(self, fmt):
+        stream = StringIO()
+        mnemonics = self.decoder.mnemonics if fmt == 'binary' else None
+        # Small enough to flush between records
+        writer = XS1Writer(stream, fmt, mnemonics, buffer_lines=2)
+        for r in self.decoder.iter_records(self.lines):
+            writer.record(*r)
+        writer.flush()
+        return stream.getvalue()
+
+    def test_records(self):
+        self.assertEqual(self.records, [
+            (0x10000, short_word(self.decoder, 'AND_3r'), 0, 2, 'AND_3r'),
+            (0x10002, 0xf000, short_word(self.decoder, 'LDC_ru6'), 4,
+                'LDC_lru6'),
+            (None, 0xa6dd, 0, 2, 'MKMSK_rus')])
+
+    def test_jsonl(self):
+        self.assertEqual([tuple(r[key] for key in
+                ('address', 'low', 'high', 'length', 'mnemonic'))
+            for r in map(json.loads, self.write('jsonl').splitlines())],
+            self.records)
+
+    def test_csv(self):
+        rows = list(csv.reader(StringIO(self.write('csv'))))
+        self.assertEqual(rows[0], ['address', 'low', 'high', 'length',
+            'mnemonic'])
+        self.assertEqual([(int(a) if a else None, int(low), int(high),
+                int(length), mnemonic)
+            for a, low, high, length, mnemonic in rows[1:]], self.records)
+
+    def test_binary(self):
+        data = self.write('binary')
+        header, names, unused = data.split('\n', 2)
+        self.assertEqual(header, 'XS1R 1')
+        self.assertEqual(names.split(), self.decoder.mnemonics[1:])
+        self.assertEqual(list(read_records(StringIO(data))), self.records)
+        self.assertRaises(ValueError, list, read_records(StringIO(data[:-1])))
+
+    def run_cli(self, *args):
+        proc = subprocess.Popen([sys.executable, DECODER_SCRIPT] + list(args),
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE)
+        out, err = proc.communicate(''.join(self.lines))
+        return proc.returncode, out, err
+
+    def test_cli_binary(self):
+        status, out, err = self.run_cli('--format', 'binary')
+        self.assertEqual((status, err), (0, ''))
+        self.assertEqual(list(read_records(StringIO(out))), self.records)
+
+    def test_cli_conflicts(self):
+        # Arguments that get each option past its own checks
+        extra = {'--batch': ['a'], '--diff': ['a', 'b']}
+        for option in FORMAT_CONFLICTS:
+            args = [option]
+            if option in ('--cache', '--xobjdump-merge', '--elf', '--raw',
+                    '--serve', '--trace'):
+                args.append('-')
+            status, out, err = self.run_cli('--format', 'csv',
+                *args + extra.get(option, []))
+            self.assertEqual((status, out), (1, ''), option)
+            self.assertEqual(err, '--format csv is only for the default '
+                'mode, not with {}\n'.format(option))
+        status, out, err = self.run_cli('--format', 'jsonl', '--jobs', '2')
+        self.assertEqual(err, '--format jsonl is only for the default mode, '
+            'not with --jobs\n')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,233 @@
+"""
+    Batch decoding for the XS1 Decoder
+
+    Decodes many files of xobjdump output or hex in one process, or in a
+    pool of worker processes, so that interpreter start-up and table
+    building are paid once per batch rather than once per file. Each input
+    is decoded as the command line would decode it from standard input and
+    written to its own output file, next to the input or under an output
+    directory. Outputs are written to a temporary file and renamed into
+    place, so a file that fails to decode leaves no partial output.
+
+    Inputs are given as files, directories (every file below them, except
+    earlier outputs), glob patterns or @lists of paths, one per line.
+"""
+
+import glob
+import os
+import sys
+import tempfile
+import time
+
+import xs1_core
+
+
+def batch_inputs(specs, suffix):
+    """
+        Expand input specs into a list of (path, root) in the order given,
+        where root is the directory a path was found under, or None. Files
+        ending in suffix are skipped when walking directories, as they are
+        earlier outputs
+    """
+    inputs = []
+    for spec in specs:
+        if spec.startswith('@'):
+            if spec == '@-':
+                paths = sys.stdin.read().splitlines()
+            else:
+                with open(spec[1:]) as f:
+                    paths = f.read().splitlines()
+            inputs.extend((p, None) for p in paths if p.strip())
+        elif os.path.isdir(spec):
+            for directory, dirs, files in os.walk(spec):
+                dirs.sort()
+                inputs.extend((os.path.join(directory, name), spec)
+                    for name in sorted(files) if not name.endswith(suffix))
+        elif glob.has_magic(spec):
+            inputs.extend((p, None) for p in sorted(glob.glob(spec))
+                if os.path.isfile(p))
+        else:
+            inputs.append((spec, None))
+    return inputs
+
+
+def _file_mode():
+    """
+        Permissions of a new file under the current umask, which mkstemp
+        does not apply
+    """
+    umask = os.umask(0)
+    os.umask(umask)
+    return 0666 & ~umask
+
+
+def batch_outputs(inputs, suffix, output_dir=None):
+    """
+        Output path of each (path, root) input: path + suffix, or under
+        output_dir keeping the layout below root (or just the file name).
+        Raises ValueError if two inputs would share an output
+    """
+    outputs = []
+    seen = {}
+    for path, root in inputs:
+        if output_dir is None:
+            output = path + suffix
+        elif root is None:
+            output = os.path.join(output_dir, os.path.basename(path) + suffix)
+        else:
+            output = os.path.join(output_dir, os.path.relpath(path, root)
+                + suffix)
+        key = os.path.normpath(output)
+        if key in seen:
+            raise ValueError('{} and {} would both be written to {}'.format(
+                seen[key], path, output))
+        seen[key] = path
+        outputs.append(output)
+    return outputs
+
+
+def decode_file(decoder, path, output, merge=None, replace=False):
+    """
+        Decode the file at path into the file output with decode_line.
+        Returns (path, output, lines, instructions, bytes, seconds, error),
+        where error is None, or describes the line that failed and nothing
+        was written. The decoder's failure reports are dropped, as error
+        takes their place
+    """
+    start = time.time()
+    decode_line = decoder.decode_line
+    keep = merge is not None or replace
+    number = 0
+    instructions = 0
+    size = 0
+    tmp = None
+    diagnostic = decoder.__dict__.get('diagnostic')
+    decoder.diagnostic = lambda text: None
+    try:
+        size = os.path.getsize(path)
+        directory = os.path.dirname(output)
+        if directory and not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                # Another worker made it first
+                if not os.path.isdir(directory):
+                    raise
+        fd, tmp = tempfile.mkstemp(dir=directory or '.', prefix='.tmp-')
+        with os.fdopen(fd, 'w') as out:
+            write = out.write
+            with open(path) as f:
+                for number, line in enumerate(f, 1):
+                    decoded = decode_line(line, merge, replace)
+                    if keep:
+                        # Lines that are not instructions come back as they
+                        # were, and instructions never do
+                        if decoded != line.rstrip():
+                            instructions += 1
+                        write(decoded + '\n')
+                    elif decoded is not None:
+                        instructions += 1
+                        write(decoded + '\n')
+        os.chmod(tmp, _file_mode())
+        os.rename(tmp, output)
+        tmp = None
+        error = None
+    except Exception as e:
+        error = '{}: {}'.format(type(e).__name__, e)
+        if number:
+            error = 'line {}: {}'.format(number, error)
+    finally:
+        if tmp is not None:
+            os.unlink(tmp)
+        if diagnostic is None:
+            del decoder.diagnostic
+        else:
+            decoder.diagnostic = diagnostic
+    return (path, output, number, instructions, size, time.time() - start,
+        error)
+
+
+def _decode_batch_file(path, output, merge, replace, with_stats):
+    """
+        decode_file in a worker process. Returns its result and the file's
+        XS1Stats, if with_stats is set
+    """
+    decoder = xs1_core._WORKER_DECODER
+    stats = None
+    if with_stats:
+        stats = decoder.enable_stats()
+    try:
+        return decode_file(decoder, path, output, merge, replace), stats
+    finally:
+        decoder.disable_stats()
+
+
+def decode_batch(decoder, paths, outputs, jobs=1, merge=None, replace=False,
+        table_file=None, stats=None):
+    """
+        Decode each file in paths into the matching file in outputs, in a
+        pool of jobs worker processes if jobs > 1, yielding the decode_file
+        result for each in order. Worker statistics are merged into stats,
+        if given; a single process counts into decoder's own statistics
+    """
+    if jobs <= 1:
+        for path, output in zip(paths, outputs):
+            yield decode_file(decoder, path, output, merge, replace)
+        return
+    import multiprocessing
+    pool = multiprocessing.Pool(jobs, xs1_core._init_worker,
+        (type(decoder), table_file, None))
+    tasks = ((path, output, merge, replace, stats is not None)
+        for path, output in zip(paths, outputs))
+    ordered = xs1_core._map_ordered(pool, _decode_batch_file, tasks, jobs)
+    try:
+        for unused, (decoded, file_stats) in ordered:
+            if file_stats is not None:
+                stats.merge(file_stats)
+            yield decoded
+    finally:
+        ordered.close()
+
+
+class BatchSummary(object):
+    """
+        Per file and total line counts, throughput and errors of a batch
+    """
+    def __init__(self):
+        self.files = 0
+        self.errors = 0
+        self.lines = 0
+        self.instructions = 0
+        self.bytes = 0
+        self.start = time.time()
+
+    def add(self, result):
+        """
+            Count one decode_file result, returning its summary line
+        """
+        path, output, lines, instructions, size, seconds, error = result
+        self.files += 1
+        if error is not None:
+            self.errors += 1
+            return 'error {}: {}'.format(path, error)
+        self.lines += lines
+        self.instructions += instructions
+        self.bytes += size
+        return 'ok    {} -> {}: {} lines, {} instructions, {:.3f}s, {}'.format(
+            path, output, lines, instructions, seconds,
+            self.rate(size, seconds))
+
+    @staticmethod
+    def rate(size, seconds):
+        if seconds <= 0:
+            return '- MB/s'
+        return '{:.2f} MB/s'.format(size / seconds / (1 << 20))
+
+    def report(self):
+        """
+            Totals for the batch so far
+        """
+        seconds = time.time() - self.start
+        return ('{} files, {} errors, {} lines, {} instructions in {:.3f}s, '
+            '{}'.format(self.files, self.errors, self.lines,
+                self.instructions, seconds, self.rate(self.bytes, seconds)))
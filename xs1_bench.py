@@ -0,0 +1,402 @@
+#!/usr/bin/python
+
+"""
+    Benchmarks for the XS1 Decoder
+
+    Generates corpora of instruction words and synthetic xobjdump output, then
+    measures the decode rate and peak memory of decode_word, decode_bin,
+    decode_line and each CLI mode, for both the reference and table driven
+    decoders. Results can be saved and compared against a stored baseline.
+
+    Every benchmark runs in its own process so that its peak memory can be
+    reported separately. In-process benchmarks report the best of --repeat
+    runs; CLI benchmarks run once. Startup benchmarks time --startup-runs
+    cold invocations that each decode a single line.
+
+    Usage:
+        xs1_bench.py [options]
+
+    Options:
+        --corpus <dir>          Directory for the generated corpora, which are
+                                reused between runs [default: bench_corpus]
+        --sizes <list>          Comma separated line counts of the synthetic
+                                xobjdump corpora [default: 10k,1M,10M]
+        --long <n>              Number of long instruction samples
+                                [default: 100000]
+        --seed <n>              Seed for the generated corpora [default: 1]
+        --repeat <n>            Runs of each in-process benchmark [default: 3]
+        --startup-runs <n>      Invocations per startup benchmark
+                                [default: 20]
+        --only <text>           Only run benchmarks whose name contains <text>
+        --save <file>           Write the results to <file> as JSON
+        --baseline <file>       Compare the results with a previous --save
+        --tolerance <fraction>  Slowdown beyond which a result counts as a
+                                regression [default: 0.1]
+
+    Examples:
+        xs1_bench.py --sizes 10k,1M --save baseline.json
+        xs1_bench.py --sizes 10k,1M --baseline baseline.json
+"""
+
+from docopt import docopt
+from array import array
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+import traceback
+
+from xs1_core import XS1Decoder, XS1FastDecoder
+
+DECODER_SCRIPT = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'xs1_decoder.py')
+
+# CLI modes and their arguments
+CLI_MODES = [
+    ('default', []),
+    ('sub', ['--xobjdump-sub']),
+    ('merge', ['--xobjdump-merge', ' # ']),
+]
+
+# Decoder classes and the CLI arguments that select them
+DECODERS = [
+    ('ref', XS1Decoder, []),
+    ('fast', XS1FastDecoder, ['--fast']),
+]
+
+
+def parse_size(text):
+    """
+        Parse a line count such as 10k or 1M
+    """
+    scale = {'k': 10 ** 3, 'm': 10 ** 6}.get(text[-1:].lower(), 1)
+    return int(text.rstrip('kKmM')) * scale
+
+
+def xobjdump_line(address, words, decoded):
+    """
+        Format one instruction the way xobjdump -d does
+    """
+    hexbytes = ' '.join(
+        '{:02x} {:02x}'.format(w & 0xff, w >> 8) for w in words) + ':'
+    name, encoding = decoded.split('_')
+    return '             0x{:08x}: {:<12} {:<15} r0, 0x0\n'.format(
+        address, hexbytes, '{} ({})'.format(name.lower(), encoding))
+
+
+class Corpus(object):
+    """
+        Generated benchmark inputs, written to a directory and reused
+    """
+    def __init__(self, directory, long_samples, seed):
+        self.directory = directory
+        self.long_samples = long_samples
+        self.seed = seed
+        self.decoder = XS1FastDecoder()
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def short_words(self):
+        """
+            Every short instruction word that decodes
+        """
+        path = self.path('short.bin')
+        if not os.path.exists(path):
+            words = array('H', [w for w in xrange(0x10000)
+                if self.decoder.decode_id(w)])
+            with open(path, 'wb') as f:
+                words.tofile(f)
+        return path
+
+    def long_words(self):
+        """
+            A sample of PFIX and EOPR word pairs that decode, as low, high
+            pairs in one array
+        """
+        path = self.path('long-{}-{}.bin'.format(self.long_samples, self.seed))
+        if not os.path.exists(path):
+            rand = random.Random(self.seed)
+            words = array('H')
+            while len(words) < 2 * self.long_samples:
+                low = rand.randint(0xf000, 0xffff)
+                high = rand.randint(0, 0xffff)
+                mid = self.decoder.decode_id(low, high, True)
+                if mid and '_' in self.decoder.mnemonics[mid]:
+                    words.extend((low, high))
+            with open(path, 'wb') as f:
+                words.tofile(f)
+        return path
+
+    def xobjdump(self, lines):
+        """
+            Synthetic xobjdump -d output of the given number of lines, about
+            a third of them long instructions. Returns the path and the
+            number of instructions in it
+        """
+        path = self.path('xobjdump-{}-{}.txt'.format(lines, self.seed))
+        meta = path + '.json'
+        if not os.path.exists(meta):
+            rand = random.Random(self.seed)
+            short = load_words(self.short_words())
+            pairs = load_words(self.long_words())
+            mnemonics = self.decoder.mnemonics
+            decode_id = self.decoder.decode_id
+            address = 0x10000
+            count = 0
+            with open(path, 'w') as f:
+                f.write('\nDisassembly of section .text (size: 0)\n\n')
+                written = 3
+                while written < lines:
+                    if written % 64 == 3:
+                        f.write('<func{}>:\n'.format(written))
+                    elif rand.random() < 0.3:
+                        i = 2 * rand.randrange(len(pairs) / 2)
+                        words = pairs[i:i + 2]
+                        f.write(xobjdump_line(address, words,
+                            mnemonics[decode_id(words[0], words[1], True)]))
+                        address += 4
+                        count += 1
+                    else:
+                        word = short[rand.randrange(len(short))]
+                        f.write(xobjdump_line(address, [word],
+                            mnemonics[decode_id(word)]))
+                        address += 2
+                        count += 1
+                    written += 1
+            with open(meta, 'w') as f:
+                json.dump({'lines': lines, 'instructions': count}, f)
+        with open(meta) as f:
+            return path, json.load(f)['instructions']
+
+
+def load_words(path):
+    """
+        Read an array of 16-bit words written by Corpus
+    """
+    words = array('H')
+    with open(path, 'rb') as f:
+        words.fromstring(f.read())
+    return words
+
+
+def bench_decode_word(decoder_class, path, iwords):
+    """
+        decode_word over short words, or low, high pairs
+    """
+    def setup():
+        decoder = decoder_class()
+        words = load_words(path)
+        if iwords == 2:
+            pairs = zip(words[::2], words[1::2])
+        else:
+            pairs = [(w, 0) for w in words]
+        def run():
+            decode_word = decoder.decode_word
+            highvalid = iwords == 2
+            for low, high in pairs:
+                decode_word(low, high, highvalid)
+            return len(pairs)
+        return run
+    return setup
+
+
+def bench_decode_bin(decoder_class, path, iwords):
+    """
+        decode_bin over instructions packed as decode_line would read them
+    """
+    def setup():
+        decoder = decoder_class()
+        words = load_words(path)
+        if iwords == 2:
+            instrs = [(l & 0xff) << 24 | (l >> 8) << 16 | (h & 0xff) << 8
+                | h >> 8 for l, h in zip(words[::2], words[1::2])]
+        else:
+            instrs = [(w & 0xff) << 8 | w >> 8 for w in words]
+        def run():
+            decode_bin = decoder.decode_bin
+            for instr in instrs:
+                decode_bin(instr, iwords)
+            return len(instrs)
+        return run
+    return setup
+
+
+def bench_decode_line(decoder_class, path, count):
+    """
+        decode_line over xobjdump output, in the default mode
+    """
+    def setup():
+        decoder = decoder_class()
+        with open(path) as f:
+            lines = f.readlines()
+        def run():
+            decode_line = decoder.decode_line
+            for line in lines:
+                decode_line(line)
+            return count
+        return run
+    return setup
+
+
+def measure(setup, repeat):
+    """
+        Run a benchmark in a child process. Returns the item count, the best
+        time in seconds and the child's peak resident memory in KB
+    """
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        try:
+            run = setup()
+            best = None
+            for unused in xrange(repeat):
+                start = time.time()
+                count = run()
+                elapsed = time.time() - start
+                best = elapsed if best is None else min(best, elapsed)
+            os.write(write_fd, json.dumps([count, best]))
+        except:
+            # Never return into the parent's code from the child
+            traceback.print_exc()
+            os._exit(1)
+        os._exit(0)
+    os.close(write_fd)
+    with os.fdopen(read_fd) as f:
+        data = f.read()
+    unused, status, usage = os.wait4(pid, 0)
+    if status or not data:
+        raise RuntimeError('benchmark process failed')
+    count, best = json.loads(data)
+    return count, best, usage.ru_maxrss
+
+
+def measure_cli(args, path, count):
+    """
+        Run the CLI on a file, returning the instruction count, the time in
+        seconds and the peak resident memory in KB
+    """
+    with open(path) as stdin, open(os.devnull, 'w') as stdout:
+        start = time.time()
+        proc = subprocess.Popen([sys.executable, DECODER_SCRIPT] + args,
+            stdin=stdin, stdout=stdout)
+        unused, status, usage = os.wait4(proc.pid, 0)
+        elapsed = time.time() - start
+        proc.returncode = status
+    if status:
+        raise RuntimeError('{} failed on {}'.format(' '.join(args), path))
+    return count, elapsed, usage.ru_maxrss
+
+
+def measure_startup(args, runs):
+    """
+        Decode one line with runs fresh CLI processes, returning the number
+        of runs, the total time in seconds and the largest peak resident
+        memory in KB
+    """
+    peak = 0
+    elapsed = 0.0
+    for unused in xrange(runs):
+        start = time.time()
+        proc = subprocess.Popen([sys.executable, DECODER_SCRIPT] + args,
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        proc.stdin.write('dd a6\n')
+        proc.stdin.close()
+        proc.stdout.read()
+        unused, status, usage = os.wait4(proc.pid, 0)
+        elapsed += time.time() - start
+        proc.returncode = status
+        if status:
+            raise RuntimeError('{} failed'.format(' '.join(args)))
+        peak = max(peak, usage.ru_maxrss)
+    return runs, elapsed, peak
+
+
+def benchmarks(corpus, sizes):
+    """
+        Yield (name, kind, benchmark) for every benchmark. kind is 'cli' for
+        CLI runs, 'startup' for cold starts and 'lib' for in-process ones
+    """
+    for dname, unused, dargs in DECODERS:
+        yield 'startup/{}'.format(dname), 'startup', dargs
+    for dname, decoder_class, unused in DECODERS:
+        for iwords, path in ((1, corpus.short_words()),
+                (2, corpus.long_words())):
+            length = ['short', 'long'][iwords - 1]
+            yield ('decode_word/{}/{}'.format(length, dname), 'lib',
+                bench_decode_word(decoder_class, path, iwords))
+            yield ('decode_bin/{}/{}'.format(length, dname), 'lib',
+                bench_decode_bin(decoder_class, path, iwords))
+        path, count = corpus.xobjdump(sizes[0])
+        yield ('decode_line/{}/{}'.format(sizes[0], dname), 'lib',
+            bench_decode_line(decoder_class, path, count))
+    for size in sizes:
+        for mode, args in CLI_MODES:
+            for dname, unused, dargs in DECODERS:
+                yield ('cli/{}/{}/{}'.format(mode, size, dname), 'cli',
+                    (args + dargs, size))
+
+
+def compare(results, baseline, tolerance):
+    """
+        Print each result's rate relative to the baseline. Returns the names
+        of results that regressed by more than tolerance
+    """
+    regressions = []
+    for name in sorted(results):
+        if name not in baseline:
+            continue
+        ratio = results[name]['rate'] / baseline[name]['rate']
+        flag = ''
+        if ratio < 1 - tolerance:
+            flag = '  REGRESSION'
+            regressions.append(name)
+        print '{:<36} {:>7.2f}x rate {:>7.2f}x memory{}'.format(
+            name, ratio,
+            float(results[name]['peak_kb']) / baseline[name]['peak_kb'], flag)
+    return regressions
+
+
+def main(args):
+    sizes = [parse_size(s) for s in args['--sizes'].split(',')]
+    corpus = Corpus(args['--corpus'], int(args['--long']), int(args['--seed']))
+    repeat = int(args['--repeat'])
+    results = {}
+    print '{:<36} {:>10} {:>9} {:>14} {:>10}'.format(
+        'benchmark', 'count', 'seconds', 'instr/s', 'peak KB')
+    for name, kind, bench in benchmarks(corpus, sizes):
+        if args['--only'] and args['--only'] not in name:
+            continue
+        if kind == 'startup':
+            count, seconds, peak = measure_startup(
+                bench, int(args['--startup-runs']))
+        elif kind == 'cli':
+            cli_args, size = bench
+            path, count = corpus.xobjdump(size)
+            count, seconds, peak = measure_cli(cli_args, path, count)
+        else:
+            count, seconds, peak = measure(bench, repeat)
+        rate = count / max(seconds, 1e-9)
+        results[name] = {'count': count, 'seconds': seconds, 'rate': rate,
+            'peak_kb': peak}
+        print '{:<36} {:>10} {:>9.3f} {:>14.0f} {:>10}'.format(
+            name, count, seconds, rate, peak)
+        sys.stdout.flush()
+    if args['--save']:
+        with open(args['--save'], 'w') as f:
+            json.dump(results, f, indent=1, sort_keys=True)
+    if args['--baseline']:
+        with open(args['--baseline']) as f:
+            baseline = json.load(f)
+        print
+        if compare(results, baseline, float(args['--tolerance'])):
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(docopt(__doc__)))
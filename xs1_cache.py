@@ -0,0 +1,182 @@
+"""
+    Incremental decoding for the XS1 Decoder
+
+    Successive builds of a program mostly contain the same functions, though
+    usually at other addresses. This splits xobjdump output into chunks
+    after every blank line or label (anything ending in a colon, such as
+    "<main>:" or a section header) and hashes the text of each chunk with
+    the address at the start of each line removed, so that the hash covers
+    the instruction words and xobjdump's annotations. The decoded mnemonics
+    of the chunk are kept in an on-disk cache. A chunk that is unchanged
+    since an earlier run, wherever it now sits, is rendered from the cache
+    without parsing, decoding or checking any of its lines; only chunks that
+    changed go through decode_line.
+"""
+
+import hashlib
+import os
+import re
+import tempfile
+
+from xs1_core import XS1FastDecoder
+
+# Names of the cache's own files, as chunk_key makes them
+KEY = re.compile(r'^[0-9a-f]{40}$')
+# Address at the start of each line of xobjdump output, with any section
+# and indentation before it. Cases are spelled out, as re.I makes the
+# substitution about twice as slow
+ADDRESS = re.compile(r'^(?:\.\w*)?[ \t]*0[xX][0-9a-fA-F]+:', re.M)
+
+
+class DecodeCache(object):
+    """
+        Directory of decoded chunks, one file per chunk hash holding a line
+        for each of its lines, see decode_chunk. Reads refresh a file's
+        modification time, and evict() removes the least recently used
+        files beyond max_bytes. Other files in the directory are left alone
+    """
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def path(self, key):
+        return os.path.join(self.directory, key)
+
+    def get(self, key):
+        """
+            Cached lines of a chunk, or None
+        """
+        path = self.path(key)
+        try:
+            with open(path) as f:
+                names = f.read().split('\n')
+            os.utime(path, None)
+        except (IOError, OSError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return names
+
+    def put(self, key, names):
+        """
+            Store the lines of a chunk
+        """
+        fd, tmp = tempfile.mkstemp(dir=self.directory, prefix='.tmp-')
+        with os.fdopen(fd, 'w') as f:
+            f.write('\n'.join(names))
+        os.rename(tmp, self.path(key))
+
+    def evict(self):
+        """
+            Remove least recently used chunks until the cache fits in
+            max_bytes
+        """
+        entries = []
+        total = 0
+        for name in os.listdir(self.directory):
+            if not KEY.match(name):
+                continue
+            try:
+                st = os.stat(self.path(name))
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, name))
+            total += st.st_size
+        entries.sort()
+        for unused, size, name in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.unlink(self.path(name))
+            except OSError:
+                pass
+            total -= size
+
+
+def chunk_key(decoder, lines, mode):
+    """
+        Hash of the decoder, the output mode (default, merge or sub) and the
+        text of a chunk without its addresses
+    """
+    digest = hashlib.sha1('{} {} {}\n'.format(type(decoder).__name__,
+        XS1FastDecoder.source_hash(), mode))
+    digest.update(ADDRESS.sub(':', ''.join(lines)))
+    return digest.hexdigest()
+
+
+def decode_chunk(decoder, lines, cache, merge, replace):
+    """
+        Decode one chunk of lines, from the cache if possible, yielding the
+        decode_line result for each line. A line that fails raises as
+        decode_line would, after the results before it, and the chunk is
+        not cached.
+
+        The cache holds a line for each line of the chunk: empty for lines
+        that are not instructions, else the mnemonic. In the sub mode it is
+        where xobjdump's own mnemonic starts, counted back from the end of
+        the line, and the output from there on; only the address before it
+        can differ between chunks with the same key
+    """
+    checked = merge is not None or replace
+    mode = 'merge' if merge is not None else 'sub' if replace else 'default'
+    key = chunk_key(decoder, lines, mode)
+    cached = cache.get(key)
+    if cached is not None and len(cached) == len(lines):
+        for line, entry in zip(lines, cached):
+            if not entry:
+                yield line.rstrip() if checked else None
+            elif merge is not None:
+                yield line.rstrip() + merge + entry
+            elif replace:
+                start, tail = entry.split(' ', 1)
+                yield line[:len(line) - int(start)] + tail
+            else:
+                yield entry
+        return
+    cached = []
+    parse_line = decoder.parse_line
+    decode_parsed = decoder.decode_parsed
+    for line in lines:
+        parsed = parse_line(line)
+        if not parsed:
+            yield line.rstrip() if checked else None
+            cached.append('')
+            continue
+        result = decode_parsed(line, parsed, merge, replace)
+        span = parsed[4]
+        # Take what a hit needs from the rendered line rather than decode
+        # the words again
+        if merge is not None:
+            cached.append(result[len(line.rstrip()) + len(merge):])
+        elif replace:
+            cached.append('{} {}'.format(len(line) - span[0],
+                result[span[0]:]))
+        else:
+            cached.append(result)
+        yield result
+    cache.put(key, cached)
+
+
+def iter_decode_cached(decoder, file_handle, cache, merge=None,
+        replace=False, chunk_lines=4096):
+    """
+        iter_decode through a DecodeCache, yielding the decode_line result
+        for each line in input order. Chunks end after blank lines and
+        labels, or after chunk_lines lines
+    """
+    lines = []
+    for line in file_handle:
+        lines.append(line)
+        stripped = line.rstrip()
+        if len(lines) < chunk_lines and stripped and stripped[-1] != ':':
+            continue
+        for result in decode_chunk(decoder, lines, cache, merge, replace):
+            yield result
+        lines = []
+    if lines:
+        for result in decode_chunk(decoder, lines, cache, merge, replace):
+            yield result
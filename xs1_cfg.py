@@ -0,0 +1,291 @@
+"""
+    Control flow and call graphs for the XS1 Decoder
+
+    Builds basic blocks, per-function control flow graphs and the call graph
+    of a DecodedImage in linear time. Relative branches and calls are
+    resolved from their immediates (next pc +/- imm * 2) through an address
+    index; register, constant pool and table branches are indirect and have
+    no static target. Functions are the image's first instruction, the
+    targets of relative calls and any extra entries given, each owning the
+    blocks it reaches; blocks that no function reaches are unreachable.
+
+    xobjdump prints the tiles of an .xe file one after another, at the same
+    addresses, so dump_programs splits a dump into one image per tile, with
+    its labelled functions as entries.
+"""
+
+import re
+from itertools import izip
+
+from xs1_core import DecodedImage, XS1FastDecoder
+
+# Control flow kinds
+FALL, COND, JUMP, CALL, INDIRECT_JUMP, INDIRECT_CALL, RETURN, STOP = range(8)
+
+# Control flow of each instruction that changes it: (kind, direction), where
+# direction is +1 or -1 for relative forms and 0 otherwise
+CONTROL = {
+    'BRFT': (COND, 1), 'BRFF': (COND, 1),
+    'BRBT': (COND, -1), 'BRBF': (COND, -1),
+    'BRFU': (JUMP, 1), 'BRBU': (JUMP, -1),
+    'BLRF': (CALL, 1), 'BLRB': (CALL, -1),
+    'BLACP': (INDIRECT_CALL, 0), 'BLAT': (INDIRECT_CALL, 0),
+    'BLA': (INDIRECT_CALL, 0),
+    'BAU': (INDIRECT_JUMP, 0), 'BRU': (INDIRECT_JUMP, 0),
+    'RETSP': (RETURN, 0), 'KRET': (RETURN, 0), 'DRET': (RETURN, 0),
+    'WAITEU': (STOP, 0), 'FREET': (STOP, 0),
+}
+
+# Kinds that end a basic block
+TERMINATORS = (COND, JUMP, INDIRECT_JUMP, RETURN, STOP)
+
+# Start of a tile's code in xobjdump output, e.g. "Loadable 1 for tile[0]
+# (node "0", tile 0):"
+LOADABLE = re.compile(r'Loadable \d+ for ([^\s(]+)')
+
+
+def dump_programs(lines, decoder=None):
+    """
+        Split xobjdump output into the program of each tile. Returns a list
+        of (tile, DecodedImage, entries), where tile is the name from the
+        "Loadable" header (None for a dump without them) and entries are
+        the addresses of the labelled instructions
+    """
+    if decoder is None:
+        decoder = XS1FastDecoder()
+    parse_line = decoder.parse_line
+    label = decoder.labelmatcher.match
+    tiles = [(None, [], set())]
+    labelled = False
+    for line in lines:
+        m = LOADABLE.match(line)
+        if m:
+            tiles.append((m.group(1), [], set()))
+            labelled = False
+            continue
+        unused, tile_lines, entries = tiles[-1]
+        if label(line):
+            labelled = True
+            continue
+        tile_lines.append(line)
+        if labelled:
+            parsed = parse_line(line)
+            if parsed and parsed[0] is not None:
+                entries.add(parsed[0])
+                labelled = False
+    programs = [(tile, DecodedImage.from_lines(tile_lines, decoder), entries)
+        for tile, tile_lines, entries in tiles]
+    if len(programs) > 1 and not len(programs[0][1]):
+        # Only the file header comes before the first tile
+        del programs[0]
+    return programs
+
+
+class BasicBlock(object):
+    """
+        Instructions first to last (indexes into the image) from address
+        start up to end, with the start addresses of its successors, the
+        calls it makes and the entry of the function that owns it
+    """
+    __slots__ = ('start', 'end', 'first', 'last', 'successors', 'calls',
+        'indirect_calls', 'function')
+
+    def __init__(self, start, first):
+        self.start = start
+        self.end = start
+        self.first = first
+        self.last = first
+        self.successors = []
+        self.calls = []
+        self.indirect_calls = 0
+        self.function = None
+
+    def __repr__(self):
+        return '<BasicBlock 0x{:08x}-0x{:08x}>'.format(self.start, self.end)
+
+
+class XS1CFG(object):
+    """
+        Basic blocks, functions and call graph of a DecodedImage whose
+        instruction words are known, e.g. from DecodedImage.from_lines
+    """
+    def __init__(self, image, entries=()):
+        image.sort()
+        self.image = image
+        decoder = image.decoder
+        catalogue = decoder.catalogue
+        # Control flow kind, direction and length of each mnemonic ID
+        control = [(FALL, 0, 2)] + [
+            CONTROL.get(i.instr, (FALL, 0)) + (i.length,)
+            for i in catalogue[1:]]
+        addresses = image.addresses
+        position = dict(izip(addresses, xrange(len(addresses))))
+        if len(position) != len(addresses):
+            duplicate = next(a for i, a in enumerate(addresses)
+                if i and addresses[i - 1] == a)
+            raise ValueError('address 0x{:08x} appears more than once, e.g. '
+                'from several tiles, see dump_programs'.format(duplicate))
+        # Leaders, as instruction indexes, and call targets, as addresses
+        leaders = set([0]) if len(addresses) else set()
+        calls = {}
+        targets = {}
+        end = None
+        for i, (address, mid, word) in enumerate(
+                izip(addresses, image.ids, image.words)):
+            if address != end:
+                leaders.add(i)
+            kind, direction, length = control[mid]
+            end = address + length
+            if kind == FALL:
+                continue
+            target = None
+            if direction:
+                imm = decoder.decode_operands(
+                    catalogue[mid].name, word & 0xffff, word >> 16)[-1]
+                target = end + direction * imm * 2
+            if kind == CALL:
+                calls[i] = target
+                if target in position:
+                    leaders.add(position[target])
+            elif kind == INDIRECT_CALL:
+                calls[i] = None
+            elif kind in TERMINATORS:
+                leaders.add(i + 1)
+                if target is not None:
+                    targets[i] = target
+                    if target in position:
+                        leaders.add(position[target])
+        self.entries = set(addresses[:1])
+        self.entries.update(t for t in calls.values() if t in position)
+        self.entries.update(e for e in entries if e in position)
+        for e in self.entries:
+            leaders.add(position[e])
+        self.blocks = self.build_blocks(leaders, control, calls, targets)
+        self.block_at = dict((b.start, b) for b in self.blocks)
+        self.functions = {}
+        self.back_edges = []
+        for entry in sorted(self.entries):
+            self.functions[entry] = self.walk(entry)
+
+    def build_blocks(self, leaders, control, calls, targets):
+        """
+            Cut the image into basic blocks at the leaders, linking each to
+            its successors
+        """
+        addresses = self.image.addresses
+        ids = self.image.ids
+        blocks = []
+        block = None
+        for i in xrange(len(addresses)):
+            if i in leaders:
+                if block is not None:
+                    self.close_block(block, control, targets)
+                block = BasicBlock(addresses[i], i)
+                blocks.append(block)
+            block.last = i
+            block.end = addresses[i] + control[ids[i]][2]
+            if i in calls:
+                if calls[i] is None:
+                    block.indirect_calls += 1
+                else:
+                    block.calls.append(calls[i])
+        if block is not None:
+            self.close_block(block, control, targets)
+        return blocks
+
+    def close_block(self, block, control, targets):
+        """
+            Set the successors of a block from its last instruction
+        """
+        i = block.last
+        kind = control[self.image.ids[i]][0]
+        if kind in (COND, JUMP) and targets.get(i) is not None:
+            block.successors.append(targets[i])
+        # Conditional branches end a block but may still fall through
+        if kind == COND or kind not in TERMINATORS:
+            block.successors.append(block.end)
+
+    def walk(self, entry):
+        """
+            Claim the blocks reachable from a function entry that no earlier
+            function owns, recording back edges (loops) on the way. Branches
+            to another entry are tail calls and not followed
+        """
+        block_at = self.block_at
+        owned = []
+        start = block_at[entry]
+        if start.function is not None:
+            return owned
+        start.function = entry
+        owned.append(start)
+        on_stack = set([entry])
+        stack = [(start, iter(start.successors))]
+        while stack:
+            block, successors = stack[-1]
+            for target in successors:
+                succ = block_at.get(target)
+                if succ is None or (target in self.entries
+                        and target != entry):
+                    continue
+                if target in on_stack:
+                    self.back_edges.append((block.start, target))
+                elif succ.function is None:
+                    succ.function = entry
+                    owned.append(succ)
+                    on_stack.add(target)
+                    stack.append((succ, iter(succ.successors)))
+                    break
+            else:
+                stack.pop()
+                on_stack.discard(block.start)
+        owned.sort(key=lambda b: b.start)
+        return owned
+
+    def call_graph(self):
+        """
+            Callees of each function, as a dict of entry to sorted entries,
+            including branches to other entries (tail calls)
+        """
+        graph = {}
+        for entry, blocks in self.functions.items():
+            callees = set()
+            for block in blocks:
+                callees.update(c for c in block.calls if c in self.entries)
+                callees.update(s for s in block.successors
+                    if s in self.entries and s != entry)
+            graph[entry] = sorted(callees)
+        return graph
+
+    def unreachable(self):
+        """
+            Blocks that no function reaches
+        """
+        return [b for b in self.blocks if b.function is None]
+
+    def report(self):
+        """
+            Human readable summary of functions, loops, calls and unreachable
+            code
+        """
+        loops = {}
+        for source, target in self.back_edges:
+            function = self.block_at[target].function
+            loops[function] = loops.get(function, 0) + 1
+        graph = self.call_graph()
+        unreachable = self.unreachable()
+        lines = ['{} instructions, {} blocks, {} functions, {} unreachable '
+            'blocks'.format(len(self.image), len(self.blocks),
+                len(self.functions), len(unreachable))]
+        for entry in sorted(self.functions):
+            blocks = self.functions[entry]
+            lines.append('function 0x{:08x}: {} blocks, {} loops, {} indirect '
+                'calls, calls {}'.format(entry, len(blocks), loops.get(entry, 0),
+                    sum(b.indirect_calls for b in blocks),
+                    ' '.join('0x{:08x}'.format(c) for c in graph[entry])
+                    or '-'))
+        for source, target in sorted(self.back_edges):
+            lines.append('loop 0x{:08x} -> 0x{:08x}'.format(source, target))
+        for block in unreachable:
+            lines.append('unreachable 0x{:08x}-0x{:08x}'.format(
+                block.start, block.end))
+        return '\n'.join(lines)
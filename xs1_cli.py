@@ -0,0 +1,240 @@
+"""
+    Command line of the XS1 Decoder
+
+    main() runs xs1_decoder.py with the usage text of that script, which is
+    kept as small as possible so that starting the decoder does not mean
+    compiling it first: only imported modules keep their byte code.
+"""
+
+import os
+import sys
+
+from xs1_core import (XS1Decoder, XS1FastDecoder, XS1Stats, XS1VerifySummary,
+    decode_parallel, decode_buffer_parallel)
+
+# Options that select a mode other than the default one, or that the
+# default mode ignores with --format, which is only for the default mode
+FORMAT_CONFLICTS = ('--cache', '--xobjdump-sub', '--xobjdump-merge', '--elf',
+    '--raw', '--batch', '--diff', '--check-tables', '--verify', '--serve',
+    '--cfg', '--trace')
+
+
+def main(doc, argv=None):
+    """
+        Parse argv (sys.argv[1:] by default) against the usage text doc and
+        run the mode it selects
+    """
+    from docopt import docopt
+    args = docopt(doc, argv)
+    if args['--diff'] and len(args['<input>']) != 2:
+        sys.exit("--diff compares two xobjdump outputs, old and new")
+    elif args['--batch'] and not args['<input>']:
+        sys.exit("--batch needs at least one <input>")
+    elif args['<input>'] and not (args['--batch'] or args['--diff']):
+        sys.exit("<input> files are only for --batch and --diff")
+    if args['--tables']:
+        try:
+            decoder = XS1FastDecoder(table_file=args['--tables'])
+        except (IOError, ValueError) as e:
+            sys.exit("--tables: {}".format(e))
+    elif (args['--fast'] or args['--check-tables'] or args['--elf']
+            or args['--raw']
+            or args['--trace'] or args['--serve'] or args['--cfg']
+            or args['--batch'] or args['--diff']):
+        decoder = XS1FastDecoder()
+    else:
+        decoder = XS1Decoder()
+    jobs = int(args['--jobs'])
+    memo = None
+    if args['--memo']:
+        memo = (int(args['--memo']), args['--memo-lines'])
+        if jobs == 1:
+            decoder.enable_memo(*memo)
+    from xs1_output import XS1Writer
+    # Only binary records number the mnemonics, which walks decode_opc
+    mnemonics = decoder.mnemonics if args['--format'] == 'binary' else None
+    writer = XS1Writer(sys.stdout, args['--format'], mnemonics,
+        args['--line-buffered'])
+    if args['--format'] != 'text':
+        conflicts = [option for option in FORMAT_CONFLICTS if args[option]]
+        if jobs > 1:
+            conflicts.insert(0, '--jobs')
+        if conflicts:
+            sys.exit("--format {} is only for the default mode, not with "
+                "{}".format(args['--format'], ' or '.join(conflicts)))
+    out = writer.line
+    # Failure reports go through the writer too, so that they follow the
+    # output decoded before them
+    decoder.diagnostic = writer.line
+    # File iteration reads ahead, so read interactive input line by line
+    source = sys.stdin
+    if args['--line-buffered']:
+        source = iter(sys.stdin.readline, '')
+    if args['--range']:
+        from xs1_index import DumpIndex
+        if not args['--dump']:
+            sys.exit("--range needs the program, from --dump")
+        try:
+            low, high = [int(a, 0) for a in args['--range'].split(':')]
+        except ValueError:
+            sys.exit("--range takes <low>:<high>, e.g. 0x10000:0x10400")
+        source = DumpIndex(args['--dump']).lines(low, high)
+    record = writer.record
+    stats = None
+    if args['--stats']:
+        stats = XS1Stats() if jobs > 1 else decoder.enable_stats()
+        out = stats.timed('output', out)
+        record = stats.timed('output', record)
+    if jobs > 1:
+        decode = lambda merge=None, replace=False, verify=False: (
+            decode_parallel(source, jobs, merge, replace,
+                decoder_class=type(decoder), table_file=args['--tables'],
+                stats=stats, verify=verify, memo=memo,
+                diagnostic=writer.line))
+    else:
+        decode = lambda merge=None, replace=False, verify=False: (
+            decoder.iter_decode(merge, source, replace, verify=verify))
+    cache = None
+    if args['--cache']:
+        if jobs > 1 or args['--batch']:
+            sys.exit("--cache decodes standard input in a single process, "
+                "without --jobs or --batch")
+        from xs1_cache import DecodeCache, iter_decode_cached
+        cache = DecodeCache(args['--cache'], int(args['--cache-size']) << 20)
+        decode = lambda merge=None, replace=False, verify=False: (
+            decoder.iter_decode(verify=True, file_handle=source) if verify
+            else iter_decode_cached(decoder, source, cache, merge, replace))
+    try:
+        if args['--check-tables']:
+            mismatches = decoder.check_tables()
+            for m in mismatches:
+                print "{:04x} {:04x} {} expected {} found {}".format(*m)
+            print "{} mismatches".format(len(mismatches))
+            sys.exit(1 if mismatches else 0)
+        elif args['--verify']:
+            summary = XS1VerifySummary()
+            for result in decode(verify=True):
+                summary.add(result)
+            print summary.report()
+            sys.exit(1 if summary.mismatched else 0)
+        elif args['--serve']:
+            import socket
+            from xs1_server import XS1DecodeServer
+            try:
+                server = XS1DecodeServer(args['--serve'], decoder)
+            except socket.error as e:
+                sys.exit("--serve: {}".format(e))
+            try:
+                server.serve_forever()
+            except KeyboardInterrupt:
+                pass
+            finally:
+                server.server_close()
+        elif args['--cfg']:
+            from xs1_cfg import XS1CFG, dump_programs
+            if not args['--dump']:
+                sys.exit("--cfg needs the program, from --dump")
+            with open(args['--dump']) as f:
+                programs = dump_programs(f, decoder)
+            for tile, image, entries in programs:
+                try:
+                    report = XS1CFG(image, entries).report()
+                except ValueError as e:
+                    sys.exit("--cfg: {}".format(e))
+                print report if tile is None else '{}: {}'.format(tile, report)
+        elif args['--diff']:
+            from xs1_diff import DumpFunctions, BuildDiff
+            old, new = args['<input>']
+            diff = BuildDiff(
+                DumpFunctions(old, decoder, jobs, args['--tables']),
+                DumpFunctions(new, decoder, jobs, args['--tables']))
+            print diff.report()
+            sys.exit(1 if diff.changed or diff.renamed or diff.added
+                or diff.removed else 0)
+        elif args['--trace']:
+            from xs1_trace import InstructionMix, dump_lookup, elf_lookup
+            if args['--elf']:
+                from xs1_elf import XS1ElfCode
+                try:
+                    lookup_id = elf_lookup(XS1ElfCode(args['--elf'], decoder))
+                except (IOError, ValueError) as e:
+                    sys.exit("--elf: {}".format(e))
+            elif args['--dump']:
+                with open(args['--dump']) as f:
+                    lookup_id = dump_lookup(f, decoder)
+            else:
+                sys.exit("--trace needs the program, from --elf or --dump")
+            mix = InstructionMix(lookup_id, decoder.catalogue)
+            if args['--trace'] == '-':
+                mix.add_trace(sys.stdin)
+            else:
+                with open(args['--trace']) as f:
+                    mix.add_trace(f)
+            print mix.report()
+        elif args['--elf']:
+            from xs1_elf import decode_elf
+            try:
+                walk = decode_elf(args['--elf'], decoder, jobs,
+                    args['--tables'])
+            except (IOError, ValueError) as e:
+                sys.exit("--elf: {}".format(e))
+            for image, section, address, decoded in walk:
+                out("{}:{} 0x{:08x}: {}".format(
+                    image, section, address, decoded or '??'))
+        elif args['--raw']:
+            base = int(args['--base'], 0)
+            if not os.path.getsize(args['--raw']):
+                walk = ()
+            elif jobs > 1:
+                walk = decode_buffer_parallel(args['--raw'], jobs,
+                    decoder_class=type(decoder), table_file=args['--tables'])
+            else:
+                import mmap
+                with open(args['--raw'], 'rb') as f:
+                    walk = decoder.decode_buffer(
+                        mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+            for offset, mid, unused in walk:
+                out("0x{:08x}: {}".format(
+                    base + offset, decoder.mnemonics[mid] or '??'))
+        elif args['--batch']:
+            from xs1_batch import (batch_inputs, batch_outputs, decode_batch,
+                BatchSummary)
+            files = batch_inputs(args['<input>'], args['--suffix'])
+            try:
+                outputs = batch_outputs(files, args['--suffix'],
+                    args['--output-dir'])
+            except ValueError as e:
+                sys.exit(str(e))
+            summary = BatchSummary()
+            for result in decode_batch(decoder, [p for p, unused in files],
+                    outputs, jobs, args['--xobjdump-merge'],
+                    args['--xobjdump-sub'], args['--tables'], stats):
+                out(summary.add(result))
+            out(summary.report())
+            sys.exit(1 if summary.errors else 0)
+        elif args['--xobjdump-sub']:
+            for l in decode(replace=True):
+                out(l)
+        elif args['--xobjdump-merge']:
+            for l in decode(args['--xobjdump-merge']):
+                out(l)
+        elif args['--format'] != 'text':
+            for r in decoder.iter_records(source):
+                record(*r)
+        elif args['--default'] or True: #Yeah
+            for nl in decode():
+                if nl:
+                    out(nl)
+    finally:
+        writer.flush()
+        if cache is not None:
+            cache.evict()
+        if stats is not None:
+            sys.stdout.flush()
+            print >> sys.stderr, stats.report()
+            if cache is not None:
+                print >> sys.stderr, 'cache hits {}, misses {}'.format(
+                    cache.hits, cache.misses)
+            for name, recent in zip(('words', 'lines'), decoder.memos or ()):
+                print >> sys.stderr, 'memo {} {}'.format(name, recent.report())
+
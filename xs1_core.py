@@ -0,0 +1,2096 @@
+"""
+    Decoders for the XMOS XS1(b) ISA, for the XS1 Decoder
+
+    The reference decoder, XS1Decoder, the table-driven XS1FastDecoder and
+    the helpers to decode in worker processes. The command line is in
+    xs1_cli.py and xs1_decoder.py; this module holds everything else, so
+    that the interpreter keeps its byte code between runs.
+
+    Copyright (c) 2014, Steve Kerrison, All rights reserved
+    This software is freely distributable under a derivative of the
+    University of Illinois/NCSA Open Source License posted in
+    LICENSE.txt and at <http://github.xcore.com/>
+
+    Decode method from <https://github.com/rlsosborne/tool_axe/>
+    Copyright (c) 2011-2012, Richard Osborne, All rights reserved
+"""
+
+import sys
+import os
+import errno
+import re
+import struct
+import time
+import hashlib
+from array import array
+from bisect import bisect_left
+from itertools import izip
+
+def _fields_3r(value):
+    """
+        Unpack three 4-bit operands from the 3r packing of bits 10:0
+    """
+    combined = value >> 6 & 0x1f
+    if combined >= 27:
+        return None
+    return (combined / 9 << 2 | value >> 4 & 0x3,
+        combined / 3 % 3 << 2 | value >> 2 & 0x3,
+        combined % 3 << 2 | value & 0x3)
+
+def _fields_2r(value):
+    """
+        Unpack two 4-bit operands from the 2r packing of bits 10:0
+    """
+    combined = (value >> 6 & 0x1f) - 27 + (value >> 5 & 0x1) * 5
+    if not 0 <= combined < 9:
+        return None
+    return (combined / 3 << 2 | value >> 2 & 0x3,
+        combined % 3 << 2 | value & 0x3)
+
+class DecodeMismatch(Exception):
+    """
+        A decoded instruction disagrees with xobjdump's own mnemonic for it
+    """
+    def __init__(self, line, decoded, instr, encoding):
+        # Keep every argument in args so that the exception pickles, e.g.
+        # back from a decode_parallel worker
+        Exception.__init__(self, line, decoded, instr, encoding)
+        self.line = line
+        self.decoded = decoded
+        self.instr = instr
+        self.encoding = encoding
+
+    def __str__(self):
+        return '{} ({}) decoded as {}'.format(
+            self.instr, self.encoding, self.decoded)
+
+class StaleTables(ValueError):
+    """
+        A table file written by another version of the decoder, or cut
+        short, which may be written again
+    """
+
+class WorkerLost(RuntimeError):
+    """
+        A worker process of a decoding pool exited, e.g. killed for lack of
+        memory, and the task it was running will never finish
+    """
+
+class XS1Instruction(object):
+    """
+        Catalogue entry for one mnemonic, e.g. LDWSP_ru6: its ID, name,
+        instruction, encoding, length in bytes and operand count. Entries are
+        shared, so decoders can hand them out without allocating
+    """
+    __slots__ = ('id', 'name', 'instr', 'encoding', 'length', 'kinds',
+        'num_operands')
+
+    def __init__(self, mid, name, kinds):
+        self.id = mid
+        self.name = name
+        self.instr, unused, self.encoding = name.partition('_')
+        # Long encodings start with l, and ILLEGAL is only produced for EOPR
+        # long instructions
+        self.length = 4 if self.encoding[:1] in ('l', '') else 2
+        self.kinds = kinds[self.encoding]
+        self.num_operands = len(self.kinds)
+
+    def __str__(self):
+        return self.name
+
+    def __repr__(self):
+        return '<XS1Instruction {} {}>'.format(self.id, self.name)
+
+class _Catalogued(object):
+    """
+        Class attribute that numbers the mnemonics of decode_opc the first
+        time it is read, so decoders that only print names never walk the
+        tree. set_mnemonics replaces it with the plain value on the class
+        it was read from
+    """
+    def __init__(self, name):
+        self.name = name
+
+    def __get__(self, obj, cls):
+        cls.set_mnemonics(cls.mnemonic_names())
+        return getattr(cls, self.name)
+
+class XS1Decoder(object):
+    """
+        Decode xobjdump output or one instruction per line space separated hex
+        into XMOS XS1b architecture mnemonics
+    """
+    # Pattern to match instructions (required)
+    instrpattern = r'(([0-9a-f]{2}\s*){2,4})'
+    # Xobjdump pattern prefix (optional)
+    xobjpattern = r'^(\.\w*)?\s*(0x[0-9a-f]+):\s*'
+    # Non-architectural instruction format from xobjdump e.g. "add (2rus)"
+    xobjinstr = r':\s*(\w+\s*\(\w+\)\s*)'
+    # Pre compiled whitespace remover
+    whitematcher = re.compile(r'\s+', re.I)
+    # Regex
+    imatcher = re.compile('({})?{}'.format(xobjpattern, instrpattern), re.I)
+    # Replacer
+    nonarchmatcher = re.compile(
+            '{}{}{}'.format(xobjpattern, instrpattern, xobjinstr), re.I)
+    # Address matcher
+    addrmatcher = re.compile(xobjpattern, re.I)
+
+    # Verification matcher for xobjdump verif
+    verifmatcher = re.compile(r'.*?(\w+\s+\(.*?\))', re.I)
+    # xobjdump instruction names that stand for architectural ones with a
+    # different prefix
+    instr_aliases = {'INIT': 'TINIT', 'SET': 'TSET', 'CRC32': 'CRC'}
+    # Initial letters of xobjdump names that match any architectural name
+    # with the same initial, i.e. the branches
+    instr_families = ('B',)
+    # xobjdump encoding names for architectural ones
+    encoding_aliases = {'r2r': '2r', 'lr2r': 'l2r'}
+
+    # Single pass tokenizer for parse_line, equivalent to imatcher followed
+    # by the xobjinstr tail of nonarchmatcher, with each byte captured
+    linematcher = re.compile(
+        r'(?:(?:\.\w*)?\s*0x([0-9a-f]+):\s*)?'
+        r'([0-9a-f]{2})\s*([0-9a-f]{2})\s*'
+        r'(?:([0-9a-f]{2})\s*(?:([0-9a-f]{2})\s*)?)?'
+        r'(?::\s*(\w+\s*\(\w+\)\s*))?', re.I)
+    # xobjdump function label, e.g. "<main>:", capturing the symbol. Shared
+    # by the modules that split a dump into functions
+    labelpattern = r'[ \t]*<([^>\n]+)>:'
+    labelmatcher = re.compile(labelpattern)
+
+    # Decoder dictionary - recursive lambdas until we get an instruction string
+    decode_opc = {
+        0x00: lambda(x): {
+            3:  lambda(x): 'STW_2rus',
+            2:  lambda(x): {
+                    0: 'TINITPC_2r',
+                    1: 'GETST_2r',
+                }[ x['self'].bit(x['low'], 4) ],
+            1:  lambda(x): {
+                    0: 'EDU_1r',
+                    1: 'EEU_1r',
+                }[ x['self'].bit(x['low'], 4) ],
+            0:  lambda(x): {
+                    0x07ec: 'WAITEU_0r',
+                    0x07ed: 'CLRE_0r',
+                    0x07ee: 'SSYNC_0r',
+                    0x07ef: 'FREET_0r',
+                    0x07fc: 'DCALL_0r',
+                    0x07fd: 'KRET_0r',
+                    0x07fe: 'DRET_0r',
+                    0x07ff: 'SETKEP_0r',
+                    }[x['low']],
+            }[x['self'].num_operands(x['low'])](x),
+        0x01: lambda(x): {
+            3:  lambda(x): 'LDW_2rus',
+            2:  lambda(x): {
+                    0: 'TINITDP_2r',
+                    1: 'OUTT_2r',
+                    }[ x['self'].bit(x['low'], 4) ],
+            1:  lambda(x): {
+                    0: 'WAITET_1r',
+                    1: 'WAITEF_1r',
+                    }[ x['self'].bit(x['low'], 4) ],
+            0:  lambda(x): {
+                    0x0fec: lambda(x): 'LDSPC_0r',
+                    0x0fed: lambda(x): 'STPSC_0r',
+                    0x0fee: lambda(x): 'LDSSR_0r',
+                    0x0fef: lambda(x): 'STSSR_0r',
+                    0x0ffc: lambda(x): 'STSED_0r',
+                    0x0ffd: lambda(x): 'STET_0r',
+                    0x0ffe: lambda(x): 'GETED_0r',
+                    0x0fff: lambda(x): 'GETET_0r'
+                    }[x['low']](x),
+            }[x['self'].num_operands(x['low'])](x),
+        0x02: lambda(x): {
+            3:  lambda(x): 'ADD_3r',
+            2:  lambda(x): {
+                    0: 'TINITSP_2r',
+                    1: 'SETD_2r',
+                    }[ x['self'].bit(x['low'], 4) ],
+            1:  lambda(x): {
+                    0: 'FREER_1r',
+                    1: 'MJOIN_1r',
+                    }[ x['self'].bit(x['low'], 4) ],
+            0:  lambda(x): {
+                    0x17ec: lambda(x): 'DENTSP_0r',
+                    0x17ed: lambda(x): 'DRESTSP_0r',
+                    0x17ee: lambda(x): 'GETID_0r',
+                    0x17ef: lambda(x): 'GETKEP_0r',
+                    0x17fc: lambda(x): 'GETKSP_0r',
+                    0x17fd: lambda(x): 'LDSED_0r',
+                    0x17fe: lambda(x): 'LDET_0r',
+                    }[x['low']](x),
+            }[x['self'].num_operands(x['low'])](x),
+        0x03: lambda(x): {
+            3:  lambda(x): 'SUB_3r',
+            2:  lambda(x): {
+                    0: 'TINITCP_2r',
+                    1: 'TSETMR_2r',
+                    }[ x['self'].bit(x['low'], 4) ],
+            1:  lambda(x): {
+                    0: 'TSTART_1r',
+                    1: 'MSYNC_1r',
+                    }[ x['self'].bit(x['low'], 4) ],
+            }[x['self'].num_operands(x['low'])](x),
+        0x04: lambda(x): {
+            3:  lambda(x): 'SHL_3r',
+            2:  lambda(x): {
+                    1: 'EET_2r',
+                    }[ x['self'].bit(x['low'], 4) ],
+            1:  lambda(x): {
+                    0: 'BLA_1r',
+                    1: 'BAU_1r',
+                    }[ x['self'].bit(x['low'], 4) ],
+            }[x['self'].num_operands(x['low'])](x),
+        0x05: lambda(x): {
+            3:  lambda(x): 'SHR_3r',
+            2:  lambda(x): {
+                    0: 'ANDNOT_2r',
+                    1: 'EEF_2r',
+                    }[ x['self'].bit(x['low'], 4) ],
+            1:  lambda(x): {
+                    0: 'BRU_1r',
+                    1: 'SETSP_1r',
+                    }[ x['self'].bit(x['low'], 4) ],
+            }[x['self'].num_operands(x['low'])](x),
+        0x06: lambda(x): {
+            3:  lambda(x): 'EQ_3r',
+            2:  lambda(x): {
+                    0: 'SEXT_2r',
+                    1: 'SEXT_rus',
+                    }[ x['self'].bit(x['low'], 4) ],
+            1:  lambda(x): {
+                    0: 'SETDP_1r',
+                    1: 'SETCP_1r',
+                    }[ x['self'].bit(x['low'], 4) ],
+            }[x['self'].num_operands(x['low'])](x),
+        0x07: lambda(x): {
+            3:  lambda(x): 'AND_3r',
+            2:  lambda(x): {
+                    0: 'GETTS_2r',
+                    1: 'SETPT_rus',
+                    }[ x['self'].bit(x['low'], 4) ],
+            1:  lambda(x): {
+                    0: 'DGETREG_1r',
+                    1: 'SETEV_1r',
+                    }[ x['self'].bit(x['low'], 4) ],
+            }[x['self'].num_operands(x['low'])](x),
+        0x08: lambda(x): {
+            3:  lambda(x): 'OR_3r',
+            2:  lambda(x): {
+                    0: 'ZEXT_2r',
+                    1: 'ZEXT_rus',
+                    }[ x['self'].bit(x['low'], 4) ],
+            1:  lambda(x): {
+                    0: 'KCALL_1r',
+                    1: 'SETV_1r',
+                    }[ x['self'].bit(x['low'], 4) ],
+            }[x['self'].num_operands(x['low'])](x),
+        0x09: lambda(x): {
+            3:  lambda(x): 'LDW_3r',
+            2:  lambda(x): {
+                    0: 'OUTCT_2r',
+                    1: 'OUTCT_rus',
+                    }[ x['self'].bit(x['low'], 4) ],
+            1:  lambda(x): {
+                    0: 'ECALLF_1r',
+                    1: 'ECALLT_1r',
+                    }[ x['self'].bit(x['low'], 4) ],
+            }[x['self'].num_operands(x['low'])](x),
+        0x0a: lambda(x): {
+            0:  lambda(x): 'STWDP_ru6',
+            1:  lambda(x): 'STWSP_ru6',
+            }[x['self'].bit(x['low'], 10)](x),
+        0x0b: lambda(x): {
+            0:  lambda(x): 'LDWDP_ru6',
+            1:  lambda(x): 'LDWSP_ru6',
+            }[x['self'].bit(x['low'], 10)](x),
+        0x0c: lambda(x): {
+            0:  lambda(x): 'LDAWDP_ru6',
+            1:  lambda(x): 'LDAWSP_ru6',
+            }[x['self'].bit(x['low'], 10)](x),
+        0x0d: lambda(x): {
+            0:  lambda(x): 'LDC_ru6',
+            1:  lambda(x): 'LDWCP_ru6',
+            }[x['self'].bit(x['low'], 10)](x),
+        0x0e: lambda(x): {
+            True: lambda(x): {
+                0: lambda(x): 'BRFT_ru6',
+                1: lambda(x): 'BRBT_ru6',
+                }[x['self'].bit(x['low'], 10)](x),
+            False: lambda(x): {
+                0x0c: lambda(x): 'BRFU_u6',
+                0x0d: lambda(x): 'BLAT_u6',
+                0x0e: lambda(x): 'EXTDP_u6',
+                0x0f: lambda(x): 'KCALL_u6',
+                0x1c: lambda(x): 'BRBU_u6',
+                0x1d: lambda(x): 'ENTSP_u6',
+                0x1e: lambda(x): 'EXTSP_u6',
+                0x1f: lambda(x): 'RETSP_u6',
+                }[x['self'].bit_range(x['low'], 10, 6)](x),
+            }[x['self'].test_ru6(x['low'])](x),
+        0x0f: lambda(x): {
+            True: lambda(x): {
+                0: lambda(x): 'BRFF_ru6',
+                1: lambda(x): 'BRBF_ru6',
+                }[x['self'].bit(x['low'], 10)](x),
+            False: lambda(x): {
+                0x0c: lambda(x): 'CLRSR_u6',
+                0x0d: lambda(x): 'SETSR_u6',
+                0x0e: lambda(x): 'KENTSP_u6',
+                0x0f: lambda(x): 'KRESTSP_u6',
+                0x1c: lambda(x): 'GETSR_u6',
+                0x1d: lambda(x): 'LDAWCP_u6',
+                }[x['self'].bit_range(x['low'], 10, 6)](x),
+            }[x['self'].test_ru6(x['low'])](x),
+        0x10: lambda(x): {
+            3:  lambda(x): 'LD16S_3r',
+            2:  lambda(x): {
+                    0: 'GETR_rus',
+                    1: 'INCT_2r',
+                    }[ x['self'].bit(x['low'], 4) ],
+            1:  lambda(x): {
+                    0: 'CLRPT_1r',
+                    1: 'SYNCR_1r',
+                    }[ x['self'].bit(x['low'], 4) ],
+            }[x['self'].num_operands(x['low'])](x),
+        0x11: lambda(x): {
+            3:  lambda(x): 'LD8U_3r',
+            2:  lambda(x): {
+                    0: 'NOT_2r',
+                    1: 'INT_2r',
+                    }[ x['self'].bit(x['low'], 4) ],
+            }[x['self'].num_operands(x['low'])](x),
+        0x12: lambda(x): {
+            3:  lambda(x): 'ADD_2rus',
+            2:  lambda(x): {
+                    0: 'NEG_2r',
+                    1: 'ENDIN_2r',
+                    }[ x['self'].bit(x['low'], 4) ],
+            }[x['self'].num_operands(x['low'])](x),
+        0x13: lambda(x): {
+            3:  lambda(x): 'SUB_2rus',
+            }[x['self'].num_operands(x['low'])](x),
+        0x14: lambda(x): {
+            3:  lambda(x): 'SHL_2rus',
+            2:  lambda(x): {
+                    0: 'MKMSK_2r',
+                    1: 'MKMSK_rus',
+                    }[ x['self'].bit(x['low'], 4) ],
+            }[x['self'].num_operands(x['low'])](x),
+        0x15: lambda(x): {
+            3:  lambda(x): 'SHR_2rus',
+            2:  lambda(x): {
+                    0: 'OUT_2r',
+                    1: 'OUTSHR_2r',
+                    }[ x['self'].bit(x['low'], 4) ],
+            }[x['self'].num_operands(x['low'])](x),
+        0x16: lambda(x): {
+            3:  lambda(x): 'EQ_2rus',
+            2:  lambda(x): {
+                    0: 'IN_2r',
+                    1: 'INSHR_2r',
+                    }[ x['self'].bit(x['low'], 4) ],
+            }[x['self'].num_operands(x['low'])](x),
+        0x17: lambda(x): {
+            3:  lambda(x): 'TSETR_3r',
+            2:  lambda(x): {
+                    0: 'PEEK_2r',
+                    1: 'TESTCT_2r',
+                    }[ x['self'].bit(x['low'], 4) ],
+            }[x['self'].num_operands(x['low'])](x),
+        0x18: lambda(x): {
+            3:  lambda(x): 'LSS_3r',
+            2:  lambda(x): {
+                    0: 'SETPSC_2r',
+                    1: 'TESTWCT_2r',
+                    }[ x['self'].bit(x['low'], 4) ],
+            }[x['self'].num_operands(x['low'])](x),
+        0x19: lambda(x): {
+            3:  lambda(x): 'LSU_3r',
+            2:  lambda(x): {
+                    0: 'CHKCT_2r',
+                    1: 'CHKCT_rus',
+                    }[ x['self'].bit(x['low'], 4) ],
+            }[x['self'].num_operands(x['low'])](x),
+        0x1a: lambda(x): {
+            1:  lambda(x): 'BLRB_u10',
+            0:  lambda(x): 'BLRF_u10',
+            }[x['self'].bit(x['low'], 10)](x),
+        0x1b: lambda(x): {
+            1:  lambda(x): 'LDAPB_u10',
+            0:  lambda(x): 'LDAPF_u10',
+            }[x['self'].bit(x['low'], 10)](x),
+        0x1c: lambda(x): {
+            1:  lambda(x): 'LDWCPL_u10',
+            0:  lambda(x): 'BLACP_u10',
+            }[x['self'].bit(x['low'], 10)](x),
+        0x1d: lambda(x): {
+            True: lambda(x): {
+                0: lambda(x): 'SETC_ru6',
+                }[x['self'].bit(x['low'], 10)](x),
+            }[x['self'].test_ru6(x['low'])](x),
+        #Prefixed
+        0x1e: lambda(x): {
+            True:  lambda(x): {
+                0x0a: lambda(x): {
+                    0: lambda(x): 'STWDP_lru6',
+                    1: lambda(x): 'STWSP_lru6',
+                    }[x['self'].bit(x['high'], 10)](x),
+                0x0b: lambda(x): {
+                    0: lambda(x): 'LDWDP_lru6',
+                    1: lambda(x): 'LDWSP_lru6',
+                    }[x['self'].bit(x['high'], 10)](x),
+                0x0c: lambda(x): {
+                    0: lambda(x): 'LDAWDP_lru6',
+                    1: lambda(x): 'LDAWSP_lru6',
+                    }[x['self'].bit(x['high'], 10)](x),
+                0x0d: lambda(x): {
+                    0: lambda(x): 'LDC_lru6',
+                    1: lambda(x): 'LDWCP_lru6',
+                    }[x['self'].bit(x['high'], 10)](x),
+                0x0e: lambda(x): {
+                    True: lambda(x): {
+                        0: lambda(x): 'BRFT_lru6',
+                        1: lambda(x): 'BRBT_lru6',
+                        }[x['self'].bit(x['high'], 10)](x),
+                    False: lambda(x): {
+                        0x0c: lambda(x): 'BRFU_lu6',
+                        0x0d: lambda(x): 'BLAT_lu6',
+                        0x0e: lambda(x): 'EXTDP_lu6',
+                        0x0f: lambda(x): 'KCALL_lu6',
+                        0x1c: lambda(x): 'BRBU_lu6',
+                        0x1d: lambda(x): 'ENTSP_lu6',
+                        0x1e: lambda(x): 'EXTSP_lu6',
+                        0x1f: lambda(x): 'RETSP_lu6',
+                        }[x['self'].bit_range(x['high'], 10, 6)](x),
+                    }[x['self'].test_ru6(x['high'])](x),
+                0x0f: lambda(x): {
+                    True: lambda(x): {
+                        0: lambda(x): 'BRFF_lru6',
+                        1: lambda(x): 'BRBF_lru6',
+                        }[x['self'].bit(x['high'], 10)](x),
+                    False: lambda(x): {
+                        0x0c: lambda(x): 'CLRSR_lu6',
+                        0x0d: lambda(x): 'SETSR_lu6',
+                        0x0e: lambda(x): 'KENTSP_lu6',
+                        0x0f: lambda(x): 'KRESTSP_lu6',
+                        0x1c: lambda(x): 'GETSR_lu6',
+                        0x1d: lambda(x): 'LDAWCP_lu6',
+                        }[x['self'].bit_range(x['high'], 10, 6)](x),
+                    }[x['self'].test_ru6(x['high'])](x),
+                0x1a: lambda(x): {
+                    1: lambda(x): 'BLRB_lu10',
+                    0: lambda(x): 'BLRF_lu10',
+                    }[x['self'].bit(x['high'], 10)](x),
+                0x1b: lambda(x): {
+                    1: lambda(x): 'LDAPB_lu10',
+                    0: lambda(x): 'LDAPF_lu10',
+                    }[x['self'].bit(x['high'], 10)](x),
+                0x1c: lambda(x): {
+                    1: lambda(x): 'LDWCPL_lu10',
+                    0: lambda(x): 'BLACP_lu10',
+                    }[x['self'].bit(x['high'], 10)](x),
+                0x1d: lambda(x): {
+                    True: lambda(x): {
+                        0: lambda(x): 'SETC_lru6',
+                        }[x['self'].bit(x['high'], 10)](x),
+                    }[x['self'].test_ru6(x['high'])](x),
+                }[x['self'].bit_range(x['high'], 15, 11)](x),
+            }[x['self'].bit(x['low'], 10) == 0 and x['highvalid']](x),
+        #Extra operands
+        0x1f: lambda(x): {
+            True:  lambda(x): {
+                0x00: lambda(x): {
+                    6:  lambda(x): 'LMUL_l6r',
+                    5:  lambda(x): {
+                        1:  lambda(x): 'LADD_l5r',
+                        0:  lambda(x): 'LDIVU_l5r',
+                        }[x['self'].bit(x['high'], 4)](x),
+                    4:  lambda(x): {
+                        0x7e:   lambda(x): 'CRC8_l4r',
+                        0x7f:   lambda(x): 'MACCU_l4r',
+                        }[x['self'].bit_range(x['high'], 10, 4)](x),
+                    3:  lambda(x): {
+                        0x0c:  lambda(x): 'STW_l3r',
+                        }[x['self'].bit_range(x['high'], 3, 0)](x),
+                    2:  lambda(x): {
+                        0x0c:  lambda(x): 'BITREV_l2r',
+                        0x1c:  lambda(x): 'BYTEREV_l2r',
+                        }[ int(x['self'].bit(x['low'], 4) << 4)
+                            | x['self'].bit_range(x['high'], 3, 0)](x),
+                    }[x['self'].num_operands(x['low'], x['high'])](x),
+                0x01: lambda(x): {
+                    5:  lambda(x): {
+                        True: lambda(x): 'LSUB_l5r',
+                        False: lambda(x): 'ILLEGAL',
+                        }[x['self'].bit(x['high'], 4) == 0](x),
+                    4:  lambda(x): {
+                        0x7e:   lambda(x): 'MACCS_l4r',
+                        }[x['self'].bit_range(x['high'], 10, 4)](x),
+                    3:  lambda(x): {
+                        0x0c:  lambda(x): 'XOR_l3r',
+                        }[x['self'].bit_range(x['high'], 3, 0)](x),
+                    2:  lambda(x): {
+                        0x0c:  lambda(x): 'CLZ_l2r',
+                        0x1c:  lambda(x): 'SETCLK_l2r',
+                        }[ int(x['self'].bit(x['low'], 4) << 4)
+                            | x['self'].bit_range(x['high'], 3, 0)](x),
+                    }[x['self'].num_operands(x['low'], x['high'])](x),
+                0x02: lambda(x): {
+                    3:  lambda(x): {
+                        0x0c:  lambda(x): 'ASHR_l3r',
+                        }[x['self'].bit_range(x['high'], 3, 0)](x),
+                    2:  lambda(x): {
+                        0x0c:  lambda(x): 'TINITLR_l2r',
+                        0x1c:  lambda(x): 'GETPS_l2r',
+                        }[ int(x['self'].bit(x['low'], 4) << 4)
+                            | x['self'].bit_range(x['high'], 3, 0)](x),
+                    }[x['self'].num_operands(x['low'], x['high'])](x),
+                0x03: lambda(x): {
+                    3:  lambda(x): {
+                        0x0c:  lambda(x): 'LDAWF_l3r',
+                        }[x['self'].bit_range(x['high'], 3, 0)](x),
+                    2:  lambda(x): {
+                        0x0c:  lambda(x): 'SETPS_l2r',
+                        0x1c:  lambda(x): 'GETD_l2r',
+                        }[ int(x['self'].bit(x['low'], 4) << 4)
+                            | x['self'].bit_range(x['high'], 3, 0)](x),
+                    }[x['self'].num_operands(x['low'], x['high'])](x),
+                0x04: lambda(x): {
+                    3:  lambda(x): {
+                        0x0c:  lambda(x): 'LDAWB_l3r',
+                        }[x['self'].bit_range(x['high'], 3, 0)](x),
+                    2:  lambda(x): {
+                        0x0c:  lambda(x): 'TESTLCL_l2r',
+                        0x1c:  lambda(x): 'SETTW_l2r',
+                        }[ int(x['self'].bit(x['low'], 4) << 4)
+                            | x['self'].bit_range(x['high'], 3, 0)](x),
+                    }[x['self'].num_operands(x['low'], x['high'])](x),
+                0x05: lambda(x): {
+                    3:  lambda(x): {
+                        0x0c:  lambda(x): 'LDA16F_l3r',
+                        }[x['self'].bit_range(x['high'], 3, 0)](x),
+                    2:  lambda(x): {
+                        0x0c:  lambda(x): 'SETRDY_l2r',
+                        0x1c:  lambda(x): 'SETC_l2r',
+                        }[ int(x['self'].bit(x['low'], 4) << 4)
+                            | x['self'].bit_range(x['high'], 3, 0)](x),
+                    }[x['self'].num_operands(x['low'], x['high'])](x),
+                0x06: lambda(x): {
+                    3:  lambda(x): {
+                        0x0c:  lambda(x): 'LDA16B_l3r',
+                        }[x['self'].bit_range(x['high'], 3, 0)](x),
+                    2:  lambda(x): {
+                        0x0c:  lambda(x): 'SETN_l2r',
+                        0x1c:  lambda(x): 'GETN_l2r',
+                        }[ int(x['self'].bit(x['low'], 4) << 4)
+                            | x['self'].bit_range(x['high'], 3, 0)](x),
+                    }[x['self'].num_operands(x['low'], x['high'])](x),
+                0x07: lambda(x): {
+                    3:  lambda(x): {
+                        0x0c:  lambda(x): 'MUL_l3r',
+                        }[x['self'].bit_range(x['high'], 3, 0)](x),
+                    }[x['self'].num_operands(x['low'], x['high'])](x),
+                0x08: lambda(x): {
+                    3:  lambda(x): {
+                        0x0c:  lambda(x): 'DIVS_l3r',
+                        }[x['self'].bit_range(x['high'], 3, 0)](x),
+                    }[x['self'].num_operands(x['low'], x['high'])](x),
+                0x09: lambda(x): {
+                    3:  lambda(x): {
+                        0x0c:  lambda(x): 'DIVU_l3r',
+                        }[x['self'].bit_range(x['high'], 3, 0)](x),
+                    }[x['self'].num_operands(x['low'], x['high'])](x),
+                0x10: lambda(x): {
+                    3:  lambda(x): {
+                        0x0c:  lambda(x): 'ST16_l3r',
+                        }[x['self'].bit_range(x['high'], 3, 0)](x),
+                    }[x['self'].num_operands(x['low'], x['high'])](x),
+                0x11: lambda(x): {
+                    3:  lambda(x): {
+                        0x0c:  lambda(x): 'ST8_l3r',
+                        }[x['self'].bit_range(x['high'], 3, 0)](x),
+                    }[x['self'].num_operands(x['low'], x['high'])](x),
+                0x12: lambda(x): {
+                    3:  lambda(x): {
+                        0x0c:  lambda(x): 'ASHR_l2rus',
+                        0x0d:  lambda(x): 'OUTPW_l2rus',
+                        0x0e:  lambda(x): 'INPW_l2rus',
+                        }[x['self'].bit_range(x['high'], 3, 0)](x),
+                    }[x['self'].num_operands(x['low'], x['high'])](x),
+                0x13: lambda(x): {
+                    3:  lambda(x): {
+                        0x0c:  lambda(x): 'LDAWF_l2rus',
+                        }[x['self'].bit_range(x['high'], 3, 0)](x),
+                    }[x['self'].num_operands(x['low'], x['high'])](x),
+                0x14: lambda(x): {
+                    3:  lambda(x): {
+                        0x0c:  lambda(x): 'LDAWB_l2rus',
+                        }[x['self'].bit_range(x['high'], 3, 0)](x),
+                    }[x['self'].num_operands(x['low'], x['high'])](x),
+                0x15: lambda(x): {
+                    3:  lambda(x): {
+                        0x0c:  lambda(x): 'CRC_l3r',
+                        }[x['self'].bit_range(x['high'], 3, 0)](x),
+                    }[x['self'].num_operands(x['low'], x['high'])](x),
+                0x18: lambda(x): {
+                    3:  lambda(x): {
+                        0x0c:  lambda(x): 'REMS_l3r',
+                        }[x['self'].bit_range(x['high'], 3, 0)](x),
+                    }[x['self'].num_operands(x['low'], x['high'])](x),
+                0x19: lambda(x): {
+                    3:  lambda(x): {
+                        0x0c:  lambda(x): 'REMU_l3r',
+                        }[x['self'].bit_range(x['high'], 3, 0)](x),
+                    }[x['self'].num_operands(x['low'], x['high'])](x),
+                }[x['self'].bit_range(x['high'], 15, 11)](x),
+            }[x['highvalid']](x),
+    }
+
+    # Operands of every 3r and 2r packing, indexed by bits 10:0, built when
+    # operands are first extracted
+    fields_3r = None
+    fields_2r = None
+
+    # Operand extractors by encoding, taking (self, low, high) and returning
+    # the operands in field order: the prefix word's, then the second word's.
+    # Long immediates combine the prefix with the second word's immediate
+    operand_extractors = {
+        '':     lambda s, low, high: (),
+        '0r':   lambda s, low, high: (),
+        '1r':   lambda s, low, high: (low & 0xf,),
+        '2r':   lambda s, low, high: s.fields_2r[low & 0x7ff],
+        'rus':  lambda s, low, high: s.fields_2r[low & 0x7ff],
+        '3r':   lambda s, low, high: s.fields_3r[low & 0x7ff],
+        '2rus': lambda s, low, high: s.fields_3r[low & 0x7ff],
+        'ru6':  lambda s, low, high: (low >> 6 & 0xf, low & 0x3f),
+        'u6':   lambda s, low, high: (low & 0x3f,),
+        'u10':  lambda s, low, high: (low & 0x3ff,),
+        'lru6': lambda s, low, high: (high >> 6 & 0xf,
+                    (low & 0x3ff) << 6 | high & 0x3f),
+        'lu6':  lambda s, low, high: ((low & 0x3ff) << 6 | high & 0x3f,),
+        'lu10': lambda s, low, high: ((low & 0x3ff) << 10 | high & 0x3ff,),
+        'l2r':  lambda s, low, high: s.fields_2r[low & 0x7ff],
+        'l3r':  lambda s, low, high: s.fields_3r[low & 0x7ff],
+        'l2rus': lambda s, low, high: s.fields_3r[low & 0x7ff],
+        'l4r':  lambda s, low, high: s.fields_3r[low & 0x7ff] + (high & 0xf,),
+        'l5r':  lambda s, low, high: (s.fields_3r[low & 0x7ff]
+                    + s.fields_2r[high & 0x7ff]),
+        'l6r':  lambda s, low, high: (s.fields_3r[low & 0x7ff]
+                    + s.fields_3r[high & 0x7ff]),
+    }
+    # Register (r) or immediate (i) for each operand, by encoding
+    operand_kinds = {
+        '': '', '0r': '', '1r': 'r', '2r': 'rr', 'rus': 'ri', '3r': 'rrr',
+        '2rus': 'rri', 'ru6': 'ri', 'u6': 'i', 'u10': 'i', 'lru6': 'ri',
+        'lu6': 'i', 'lu10': 'i', 'l2r': 'rr', 'l3r': 'rrr', 'l2rus': 'rri',
+        'l4r': 'rrrr', 'l5r': 'rrrrr', 'l6r': 'rrrrrr',
+    }
+    # Operand extractor for each mnemonic, filled on first use
+    mnemonic_extractors = {}
+    # Mnemonic match for string constants in the decode_opc tree
+    mnemonicmatcher = re.compile(r'^[A-Z][A-Z0-9]*(_[0-9a-z]+)?$')
+    # Mnemonic names indexed by ID, ID 0 is reserved for undecodable words
+    mnemonics = _Catalogued('mnemonics')
+    # Mnemonic IDs indexed by name
+    mnemonic_ids = _Catalogued('mnemonic_ids')
+    # XS1Instruction for each mnemonic, indexed by ID (None for ID 0)
+    catalogue = _Catalogued('catalogue')
+    # XS1Stats being gathered, see enable_stats
+    stats = None
+    # Methods that enable_stats wraps
+    stats_methods = ('parse_line', 'decode_word', 'verify_decode',
+        'decode_instruction', 'verify_line', 'annotation', 'check_annotation')
+    # Instance overrides of those methods from before enable_stats
+    stats_saved = {}
+    # XS1Memos of decode_word and decode_line, see enable_memo
+    memos = None
+
+    def __init__(self, file_handle=None):
+        self.file = file_handle
+        # Result of check_annotation by (instr, encoding, mnemonic)
+        self.checked = {}
+
+    @classmethod
+    def mnemonic_names(cls):
+        """
+            All mnemonics that decode_opc can produce, sorted by name
+        """
+        names = set()
+        todo = [f.__code__ for f in cls.decode_opc.values()]
+        while todo:
+            for const in todo.pop().co_consts:
+                if hasattr(const, 'co_consts'):
+                    todo.append(const)
+                elif (isinstance(const, str)
+                        and cls.mnemonicmatcher.match(const)):
+                    names.add(const)
+        return sorted(names)
+
+    @classmethod
+    def set_mnemonics(cls, names):
+        """
+            Assign IDs to mnemonic names, starting at 1, and build the
+            catalogue
+        """
+        cls.mnemonics = [None] + list(names)
+        cls.mnemonic_ids = dict((n, i) for i, n in enumerate(cls.mnemonics))
+        cls.catalogue = [None] + [
+            XS1Instruction(mid, name, cls.operand_kinds)
+            for mid, name in enumerate(names, 1)]
+
+    @classmethod
+    def build_catalogue(cls):
+        """
+            Number the mnemonics of decode_opc, unless that is already done
+        """
+        return cls.catalogue
+
+    @classmethod
+    def instruction(cls, name):
+        """
+            The XS1Instruction for a mnemonic name
+        """
+        return cls.catalogue[cls.mnemonic_ids[name]]
+
+    @classmethod
+    def build_fields(cls):
+        """
+            Fill the 3r and 2r operand tables, unless they are already built
+        """
+        if cls.fields_3r is None:
+            XS1Decoder.fields_3r = [_fields_3r(v) for v in xrange(0x800)]
+            XS1Decoder.fields_2r = [_fields_2r(v) for v in xrange(0x800)]
+
+    def enable_stats(self, stats=None):
+        """
+            Start gathering statistics into stats, or a new XS1Stats, and
+            return it. Counting and timing versions of parse_line,
+            decode_word, decode_instruction, verify_decode and verify_line
+            are bound to this instance only, so decoders without statistics
+            pay nothing for them. The verify stage is the time spent in
+            annotation and check_annotation, as verify_line also parses and
+            decodes
+        """
+        self.disable_stats()
+        if stats is None:
+            stats = XS1Stats()
+        self.stats = stats
+        self.stats_saved = dict((name, self.__dict__[name])
+            for name in self.stats_methods if name in self.__dict__)
+        parse_line = stats.timed('parse', self.parse_line)
+        decode_word = stats.timed('decode', self.decode_word)
+        verify_decode = self.verify_decode
+        verify_line = self.verify_line
+        decode_instruction = stats.timed('decode', self.decode_instruction)
+        opcodes = stats.opcodes
+        mnemonics = stats.mnemonics
+        def counted_parse_line(line):
+            parsed = parse_line(line)
+            stats.lines += 1
+            if parsed:
+                stats.matched += 1
+            return parsed
+        def counted_decode_word(low, high, highvalid=False, operands=False):
+            try:
+                decoded = decode_word(low, high, highvalid, operands)
+            except:
+                stats.failures += 1
+                raise
+            name = decoded[0] if operands else decoded
+            opcodes[low >> 11] += 1
+            mnemonics[name] = mnemonics.get(name, 0) + 1
+            return decoded
+        def counted_verify_decode(line, decoded, span=None):
+            try:
+                return verify_decode(line, decoded, span)
+            except:
+                stats.failures += 1
+                raise
+        def counted_decode_instruction(low, high=0, highvalid=False):
+            instruction = decode_instruction(low, high, highvalid)
+            opcodes[low >> 11] += 1
+            mnemonics[instruction.name] = (
+                mnemonics.get(instruction.name, 0) + 1)
+            return instruction
+        def counted_verify_line(line):
+            result = verify_line(line)
+            if result is not None and not result[4]:
+                stats.failures += 1
+            return result
+        self.parse_line = counted_parse_line
+        self.decode_word = counted_decode_word
+        self.verify_decode = counted_verify_decode
+        self.decode_instruction = counted_decode_instruction
+        self.verify_line = counted_verify_line
+        self.annotation = stats.timed('verify', self.annotation)
+        self.check_annotation = stats.timed('verify', self.check_annotation)
+        return stats
+
+    def disable_stats(self):
+        """
+            Stop gathering statistics
+        """
+        if self.stats is None:
+            return
+        for name in self.stats_methods:
+            self.__dict__.pop(name, None)
+        self.__dict__.update(self.stats_saved)
+        self.stats_saved = {}
+        self.stats = None
+
+    def enable_memo(self, size, lines=False):
+        """
+            Memoise decode_word, which decode_bin and decode_line go through,
+            and decode_line itself if lines is set, each in an XS1Memo of
+            size entries bound to this instance only. Returns the memos.
+            Enable the memo before statistics so that they count every
+            decode; memoised lines skip parse_line and are not counted there
+        """
+        self.disable_memo()
+        decode_word = self.decode_word
+        words = XS1Memo(size)
+        lookup_word = words.memoize(decode_word)
+        def memo_decode_word(low, high, highvalid=False, operands=False):
+            # The high word only matters for long instructions
+            if not highvalid:
+                high = 0
+            return lookup_word((low, high, highvalid, operands),
+                low, high, highvalid, operands)
+        self.decode_word = memo_decode_word
+        self.memos = [words]
+        if lines:
+            decode_line = self.decode_line
+            line_memo = XS1Memo(size)
+            lookup_line = line_memo.memoize(decode_line)
+            def memo_decode_line(line, merge=None, replace=False, tup=False):
+                # tup results are dicts that the caller may change
+                if tup:
+                    return decode_line(line, merge, replace, tup)
+                return lookup_line((line.rstrip(), merge, replace),
+                    line, merge, replace)
+            self.decode_line = memo_decode_line
+            self.memos.append(line_memo)
+        return self.memos
+
+    def disable_memo(self):
+        """
+            Stop memoising. Disable statistics first
+        """
+        for name in ('decode_word', 'decode_line'):
+            self.__dict__.pop(name, None)
+        self.memos = None
+
+    def num_operands(self, low, high=None):
+        """
+            Calculate the number of operands for a long or short instruction.
+            We do not care if the operands are immediate or register.
+        """
+        ret = 0
+        # Long instruction decoding
+        if high is not None:
+            if (self.bit_range(low, 10, 6) < 27
+                    and self.bit_range(high, 10, 6) < 27):
+                ret = 6
+            elif (self.bit_range(low, 10, 6) < 27
+                    and (self.bit_range(high, 10, 6)
+                    - 27 + self.bit(high, 5) * 5) < 9):
+                ret = 5
+            elif (self.bit_range(low, 10, 6) < 27
+                    and self.bit_range(high, 3, 0) < 12 
+                    and self.bit_range(high, 10, 5) == 0x3f):
+                ret = 4
+            elif (self.bit_range(low, 10, 6) < 27
+                    and self.bit_range(high, 10, 4) == 0x7e):
+                ret = 3
+            elif (self.bit_range(low, 10, 6) - 27 + self.bit(low, 5) * 5 < 9
+                    and self.bit_range(high, 10, 4) == 0x7e):
+                ret = 2
+        # Short instruction decoding
+        elif self.bit_range(low, 10, 6) < 27:
+            ret = 3
+        elif self.bit_range(low, 10, 6) - 27 + self.bit(low, 5) * 5 < 9:
+            ret = 2
+        elif (self.bit_range(low, 10, 5) == 0x3f
+                and self.bit_range(low, 3, 0) < 12):
+            ret = 1
+        return ret
+
+    def test_ru6(self, value):
+        """
+            Test for unsigned immediate
+        """
+        return self.bit_range(value, 9, 6) < 12
+
+    def bits(self, value, shift, size):
+        """
+            Get a bit-field from the supplied value
+        """
+        return (value >> shift) & ((1 << size) - 1)
+
+    def bit_range(self, value, high, low):
+        """
+            Get from bit high to bit low
+        """
+        return self.bits(value, low, 1 + high - low)
+
+    def bit(self, value, shift):
+        """
+            Get a single bit from a value
+        """
+        return self.bits(value, shift, 1)
+
+    def decode_file(self, merge=None, file_handle=None, replace=False):
+        """
+            Decode a file of hex or objdump output. Return mnemonics, or...
+            Merge will produce line + merge + mnemonic
+            Replace will substitute old instruction "stw (l2rus)" with new
+            "STWCP_l2rus" in each line
+        """
+        return list(self.iter_decode(merge, file_handle, replace))
+
+    def iter_decode(self, merge=None, file_handle=None, replace=False,
+            tup=False, verify=False):
+        """
+            Generator version of decode_file, yielding the decode_line result
+            for each line as it is read, or the verify_line result if verify
+            is set
+        """
+        if not file_handle:
+            file_handle = self.file
+        assert file_handle
+        if verify:
+            verify_line = self.verify_line
+            for line in file_handle:
+                yield verify_line(line)
+            return
+        decode_line = self.decode_line
+        for line in file_handle:
+            yield decode_line(line, merge, replace, tup)
+
+    def iter_records(self, file_handle=None):
+        """
+            Yield (address, low, high, length, mnemonic) for each instruction
+            line of a file, where address is None for plain hex
+        """
+        if not file_handle:
+            file_handle = self.file
+        assert file_handle
+        parse_line = self.parse_line
+        decode_parsed = self.decode_parsed
+        for line in file_handle:
+            parsed = parse_line(line)
+            if parsed:
+                yield parsed[:4] + (decode_parsed(line, parsed),)
+
+    def diagnostic(self, text):
+        """
+            Report the context of a failure that is about to be raised, on
+            standard output. Callers that buffer their output replace this
+            to keep the report in order with it
+        """
+        print text
+
+    def decode_word(self, low, high, highvalid=False, operands=False):
+        """
+            Take a low (and possibly high) instruction word and return
+            the mnemonic for it as INSTR_ENCODING, e.g. add_3r, or a tuple of
+            the mnemonic and its operands if operands is set
+        """
+        try:
+            decoded = self.lookup_opc(low, high, highvalid)
+        except:
+            self.diagnostic("{:02x} {:02x} {:02x}".format(
+                low, high, self.bit_range(low, 15, 11)
+            ))
+            raise
+        if operands:
+            return decoded, self.decode_operands(decoded, low, high)
+        return decoded
+
+    def decode_operands(self, decoded, low, high=0):
+        """
+            Extract the operands of a decoded instruction from its words
+        """
+        try:
+            extract = self.mnemonic_extractors[decoded]
+        except KeyError:
+            self.build_fields()
+            extract = self.operand_extractors[
+                self.instruction(decoded).encoding]
+            self.mnemonic_extractors[decoded] = extract
+        return extract(self, low, high)
+
+    def decode_instruction(self, low, high=0, highvalid=False):
+        """
+            Take a low (and possibly high) instruction word and return its
+            XS1Instruction. Raises KeyError for words that do not decode,
+            without reporting them
+        """
+        return self.instruction(self.lookup_opc(low, high, highvalid))
+
+    def lookup_opc(self, low, high, highvalid=False):
+        """
+            Walk the decode_opc tree for an instruction word. Raises KeyError
+            for words that do not decode, without reporting them
+        """
+        opc = self.bit_range(low, 15, 11)
+        params = {
+                'self': self, 'low': low, 'high': high, 'highvalid': highvalid
+        }
+        return self.decode_opc[opc](params)
+
+    def decode_bin(self, instr, iwords=1):
+        """
+            Decode an instruction of 1 or 2 instruction words
+        """
+        assert iwords in [1, 2]
+        binstr = struct.pack('>I', instr)
+        high = 0
+        if iwords == 2:
+            low, high = struct.unpack('<HH', binstr)
+        else:
+            unused, low = struct.unpack('<HH', binstr)
+        return self.decode_word(low, high, iwords == 2)
+
+    def annotation(self, line, span=None):
+        """
+            xobjdump's own instruction and encoding for a line, e.g.
+            ('LDW', 'lru6') for "ldw (lru6)", or None if it has none
+        """
+        m = None
+        if span is not None:
+            paren = line.index('(', span[0])
+            if line[paren - 1].isspace():
+                m = line[span[0]:line.index(')', paren) + 1].split(' ')
+        if m is None:
+            match = self.verifmatcher.match(line)
+            if not match:
+                return None
+            m = match.group(1).split(' ')
+        return m[0].upper(), m[1][1:-1]
+
+    def check_annotation(self, instr, encoding, decoded):
+        """
+            Whether xobjdump's instruction and encoding agree with a decoded
+            mnemonic, allowing for the alias tables
+        """
+        key = instr, encoding, decoded
+        try:
+            return self.checked[key]
+        except KeyError:
+            pass
+        d = self.instruction(decoded)
+        ok = ((d.instr.startswith(instr)
+                or d.instr.startswith(self.instr_aliases.get(instr, instr))
+                or (instr[:1] in self.instr_families
+                    and d.instr[:1] == instr[:1]))
+            and self.encoding_aliases.get(encoding, encoding) == d.encoding)
+        self.checked[key] = ok
+        return ok
+
+    def verify_decode(self, line, decoded, span=None):
+        """
+            Check a decoded line against xobjdump's annotation of it, raising
+            DecodeMismatch if they disagree
+        """
+        instr, encoding = self.annotation(line, span)
+        if not self.check_annotation(instr, encoding, decoded):
+            # As print line, decoded would put it
+            self.diagnostic('{}{}{}'.format(
+                line, '' if line.endswith('\n') else ' ', decoded))
+            raise DecodeMismatch(line, decoded, instr, encoding)
+
+    def verify_line(self, line):
+        """
+            Decode an xobjdump line and check it against the annotation,
+            without raising. Returns None for lines that have no address or
+            annotation, else (address, instr, encoding, decoded, ok) where
+            decoded is None for words that do not decode
+        """
+        parsed = self.parse_line(line)
+        if not parsed or parsed[0] is None:
+            return None
+        address, low, high, length, span = parsed
+        annotation = self.annotation(line, span)
+        if annotation is None:
+            return None
+        instr, encoding = annotation
+        if length not in [2, 4]:
+            return address, instr, encoding, None, False
+        try:
+            decoded = self.decode_instruction(low, high, length == 4).name
+        except KeyError:
+            return address, instr, encoding, None, False
+        return (address, instr, encoding, decoded,
+            self.check_annotation(instr, encoding, decoded))
+
+    def parse_line(self, line):
+        """
+            Tokenize a line of hex or objdump output in a single match.
+            Returns None, or (address, low, high, length, span) where address
+            is None for plain hex, length is the instruction length in bytes
+            and span is the (start, end) of xobjdump's own "add (2rus)"
+            mnemonic, or None
+        """
+        match = self.linematcher.match(line)
+        if not match:
+            return None
+        address, b0, b1, b2, b3, nonarch = match.groups()
+        low = int(b1 + b0, 16)
+        high = 0
+        length = 2
+        if b2 is not None:
+            length = 3
+            if b3 is not None:
+                length = 4
+                high = int(b3 + b2, 16)
+        span = None
+        if address is not None:
+            address = int(address, 16)
+            if nonarch is not None:
+                span = match.span(6)
+        return address, low, high, length, span
+
+    def decode_line(self, line, merge=None, replace=False, tup=False):
+        """
+            Decode a line of hex or objdump output. Return mnemonic, or...
+            Merge will produce line + merge + mnemonic
+            Replace will substitute old instruction "stw (l2rus)" with new
+            "STWCP_l2rus" in the line
+        """
+        parsed = self.parse_line(line)
+        if parsed:
+            return self.decode_parsed(line, parsed, merge, replace, tup)
+        if merge is not None or replace:
+            return line.rstrip()
+        else:
+            return None
+
+    def decode_parsed(self, line, parsed, merge=None, replace=False,
+            tup=False):
+        """
+            decode_line for a line that parse_line has matched
+        """
+        address, low, high, length, span = parsed
+        prefix = ''
+        if merge is not None:
+            prefix = line.rstrip() + merge
+        assert length in [2, 4]
+        try:
+            decoded = self.decode_word(low, high, length == 4)
+            if tup:
+                return { address: decoded }
+            elif merge is not None:
+                self.verify_decode(line, decoded, span)
+                return line.rstrip() + merge + decoded
+            elif replace:
+                self.verify_decode(line, decoded, span)
+                start, end = span
+                return (line[:start] + decoded.ljust(end - start)
+                    + line[end:]).rstrip()
+            else:
+                return decoded
+        except:
+            self.diagnostic(prefix)
+            raise
+
+class XS1FastDecoder(XS1Decoder):
+    """
+        Table driven decoder. Instruction words are answered from flat tables
+        of mnemonic IDs that are built once from decode_opc, which remains the
+        reference implementation
+    """
+    # Version of the table file format
+    table_version = 3
+    # Tables that are saved to and loaded from a table file
+    table_names = ('short_table', 'pfix_table', 'eopr_kind', 'eopr_class',
+            'eopr_table')
+
+    # Hash of the module source and table version, see source_hash
+    table_hash = None
+    # File the tables were last loaded from or saved to, see use_table_file
+    table_file = None
+
+    # Mnemonic ID for every 16-bit short instruction word
+    short_table = None
+    # Mnemonic ID for PFIX (0x1e) long instructions, indexed by high[15:6]
+    pfix_table = None
+    # EOPR (0x1f) operand kind of low[10:5]: 0 none, 1 3r, 2 2r
+    eopr_kind = None
+    # EOPR operand class, indexed by kind << 11 | high[10:0]
+    eopr_class = None
+    # Mnemonic ID for EOPR long instructions, indexed by
+    # high[15:11] << 9 | class << 6 | low[4] << 5 | high[4:0]
+    eopr_table = None
+
+    def __init__(self, file_handle=None, table_file=None):
+        # The tables carry the mnemonic IDs, so load them before anything
+        # reads the catalogue and numbers them afresh
+        if table_file is not None:
+            self.use_table_file(table_file)
+        else:
+            try:
+                self.use_table_file(self.cache_path())
+            except (IOError, OSError, ValueError):
+                self.build_tables()
+        super(XS1FastDecoder, self).__init__(file_handle)
+
+    @classmethod
+    def source_hash(cls):
+        """
+            Hash of this module's source and the table version. Table files
+            written by a different decoder are rebuilt rather than loaded
+        """
+        if cls.table_hash is None:
+            path = os.path.splitext(os.path.abspath(__file__))[0] + '.py'
+            digest = hashlib.sha1(str(cls.table_version))
+            with open(path, 'rb') as f:
+                digest.update(f.read())
+            XS1FastDecoder.table_hash = digest.hexdigest()[:16]
+        return cls.table_hash
+
+    @classmethod
+    def cache_path(cls):
+        """
+            Table cache file in $XS1_DECODER_CACHE, or ~/.cache/xs1_decoder
+        """
+        directory = os.environ.get('XS1_DECODER_CACHE') or os.path.join(
+            os.path.expanduser('~'), '.cache', 'xs1_decoder')
+        return os.path.join(directory, 'tables-{}.bin'.format(
+            cls.source_hash()))
+
+    @classmethod
+    def build_tables(cls):
+        """
+            Fill the tables from decode_opc, unless they are already built
+        """
+        if cls.short_table is not None:
+            return
+        cls.set_mnemonics(cls.mnemonic_names())
+        ref = XS1Decoder()
+        short_table = array('H', [0]) * 0x10000
+        for low in xrange(0x10000):
+            try:
+                short_table[low] = cls.mnemonic_ids[
+                    ref.lookup_opc(low, 0, False)]
+            except KeyError:
+                pass
+        cls.short_table = short_table
+        cls.build_long_tables(ref)
+
+    @classmethod
+    def build_long_tables(cls, ref):
+        """
+            Fill the PFIX and EOPR tables. The EOPR decision only depends on
+            the operand class, high[15:11], high[4:0] and low[4], so one
+            representative word pair is decoded for each table entry
+        """
+        def lookup(low, high):
+            try:
+                return cls.mnemonic_ids[ref.lookup_opc(low, high, True)]
+            except KeyError:
+                return 0
+        cls.pfix_table = array('H', [
+            lookup(0xf000, high << 6) for high in xrange(0x400)])
+        # Representative low[10:5] for each operand kind
+        kind_low = {1: 0x00, 2: 27 << 1}
+        eopr_kind = array('B', [0]) * 0x40
+        for lowfield in xrange(0x40):
+            low = 0xf800 | lowfield << 5
+            if ref.bit_range(low, 10, 6) < 27:
+                eopr_kind[lowfield] = 1
+            elif ref.num_operands(low, 0x7e << 4) == 2:
+                eopr_kind[lowfield] = 2
+        eopr_class = array('B', [0]) * (3 << 11)
+        eopr_table = array('H', [0]) * (1 << 14)
+        seen = bytearray(len(eopr_table))
+        for kind, lowfield in kind_low.items():
+            low = 0xf800 | lowfield << 5
+            for highfield in xrange(0x800):
+                nops = ref.num_operands(low, highfield)
+                eopr_class[kind << 11 | highfield] = nops
+                for lowbit in (0, 0x10):
+                    for opc in xrange(0x20):
+                        index = (opc << 9 | nops << 6 | lowbit << 1
+                            | highfield & 0x1f)
+                        if not seen[index]:
+                            seen[index] = 1
+                            eopr_table[index] = lookup(
+                                low | lowbit, opc << 11 | highfield)
+        cls.eopr_kind = eopr_kind
+        cls.eopr_class = eopr_class
+        cls.eopr_table = eopr_table
+
+    @classmethod
+    def save_tables(cls, path):
+        """
+            Write the tables to a file that load_tables can read back
+        """
+        cls.build_tables()
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        # Write under a temporary name so concurrent readers never see a
+        # partial file
+        temp = '{}.{}.tmp'.format(path, os.getpid())
+        with open(temp, 'wb') as f:
+            f.write('XS1T {} {}\n{}\n'.format(cls.table_version,
+                cls.source_hash(), ' '.join(cls.mnemonics[1:])))
+            for name in cls.table_names:
+                table = getattr(cls, name)
+                f.write('{} {} {}\n'.format(name, table.typecode, len(table)))
+                table.tofile(f)
+        os.rename(temp, path)
+
+    @classmethod
+    def load_tables(cls, path):
+        """
+            Read tables previously written by save_tables
+        """
+        with open(path, 'rb') as f:
+            header = f.readline().split()
+            if header[:1] != ['XS1T']:
+                raise ValueError('{} is not a table file'.format(path))
+            if header != ['XS1T', str(cls.table_version), cls.source_hash()]:
+                raise StaleTables('{} is a table file for another decoder'
+                    .format(path))
+            try:
+                names = f.readline().split()
+                tables = {}
+                for name in cls.table_names:
+                    tname, typecode, length = f.readline().split()
+                    if tname != name:
+                        raise ValueError('expected table {}, found {}'.format(
+                            name, tname))
+                    tables[name] = array(typecode)
+                    tables[name].fromfile(f, int(length))
+            except (ValueError, EOFError) as e:
+                raise StaleTables('{} is damaged: {}'.format(path, e))
+        cls.set_mnemonics(names)
+        for name, table in tables.items():
+            setattr(cls, name, table)
+
+    @classmethod
+    def use_table_file(cls, path):
+        """
+            Load tables from path, generating the file first if it is
+            missing, or is a table file that was written by a different
+            decoder or is damaged. Raises ValueError for any other file,
+            which is never overwritten. Tables already in use are kept only
+            if they came from the same path
+        """
+        if cls.short_table is not None and path == cls.table_file:
+            return
+        try:
+            cls.load_tables(path)
+        except StaleTables:
+            cls.save_tables(path)
+        except IOError as e:
+            if e.errno != errno.ENOENT:
+                raise
+            cls.save_tables(path)
+        cls.table_file = path
+
+    def check_tables(self, long_step=1):
+        """
+            Differential test of the tables against decode_opc. Every short
+            word is checked, along with every PFIX and EOPR word pair that
+            differs in a bit decode_opc looks at (every long_step'th high word
+            when long_step > 1). Returns a list of (low, high, highvalid,
+            expected, found) for each disagreement
+        """
+        mismatches = []
+        def check(low, high, highvalid):
+            try:
+                expected = self.lookup_opc(low, high, highvalid)
+            except KeyError:
+                expected = None
+            found = self.mnemonics[self.decode_id(low, high, highvalid)]
+            if found != expected:
+                mismatches.append((low, high, highvalid, expected, found))
+        for low in xrange(0x10000):
+            check(low, 0, False)
+        # PFIX looks at low[10], EOPR at low[10:4], both at all of high
+        lows = [0xf000, 0xf400] + [0xf800 | l << 4 for l in xrange(0x80)]
+        for low in lows:
+            for high in xrange(0, 0x10000, long_step):
+                check(low, high, True)
+        return mismatches
+
+    def decode_id(self, low, high=0, highvalid=False):
+        """
+            Take a low (and possibly high) instruction word and return the
+            mnemonic ID for it, or 0 if it does not decode
+        """
+        if highvalid and low >= 0xf000:
+            if low < 0xf800:
+                if low & 0x400:
+                    return 0
+                return self.pfix_table[high >> 6]
+            nops = self.eopr_class[
+                self.eopr_kind[low >> 5 & 0x3f] << 11 | high & 0x7ff]
+            return self.eopr_table[
+                high >> 11 << 9 | nops << 6 | (low & 0x10) << 1 | high & 0x1f]
+        return self.short_table[low]
+
+    def decode_buffer(self, buf, offset=0, end=None, block_words=4096):
+        """
+            Walk raw little-endian code in a str, buffer, bytearray or mmap
+            from offset up to end (by default the end of buf), yielding
+            (offset, mnemonic ID, length in bytes). A PFIX or EOPR word takes
+            the following word as its high half, anything else is a short
+            instruction. Words are unpacked straight from buf, block_words
+            (at least 2) at a time, without slicing it
+        """
+        if end is None:
+            end = len(buf)
+        end = offset + ((end - offset) & ~1)
+        short_table = self.short_table
+        decode_id = self.decode_id
+        unpack_from = struct.unpack_from
+        while offset < end:
+            count = min(block_words, (end - offset) >> 1)
+            more = offset + 2 * count < end
+            words = unpack_from('<{}H'.format(count), buf, offset)
+            i = 0
+            while i < count:
+                low = words[i]
+                if low >= 0xf000:
+                    if i + 1 < count:
+                        yield (offset + 2 * i,
+                            decode_id(low, words[i + 1], True), 4)
+                        i += 2
+                        continue
+                    if more:
+                        # The high word is in the next block
+                        break
+                yield offset + 2 * i, short_table[low], 2
+                i += 1
+            offset += 2 * i
+
+    def decode_array(self, words, long_mask=None):
+        """
+            Decode a NumPy array of instruction words with vectorised table
+            lookups. A uint32 array holds the low word in bits 15:0 and the
+            high word in bits 31:16, as read little-endian from memory. A
+            uint16 array holds a stream of words as decode_buffer walks it,
+            where a long instruction takes the following entry as its high
+            word and that entry's ID is 0. long_mask marks the entries that
+            are long, by default those with a PFIX or EOPR low word, except
+            for the high word of another. Returns an array of mnemonic IDs,
+            0 where a word does not decode, and the list of mnemonic names
+            indexed by ID
+        """
+        import numpy
+        words = numpy.asarray(words)
+        if words.dtype == numpy.uint16:
+            if long_mask is None:
+                # A prefix word is long unless it is the high word of the
+                # prefix before it, so in a run of prefix words every other
+                # one is long, starting with the first
+                prefix = words >= 0xf000
+                position = numpy.arange(len(words))
+                run_start = numpy.maximum.accumulate(
+                    numpy.where(prefix, -1, position)) + 1
+                long_mask = prefix & ((position - run_start) % 2 == 0)
+            else:
+                long_mask = numpy.array(long_mask, dtype=bool)
+            # The last word has no high word to take
+            long_mask[-1:] = False
+            following = numpy.zeros(len(words), dtype=numpy.uint32)
+            following[:-1] = words[1:]
+            ids, mnemonics = self.decode_array(
+                words.astype(numpy.uint32) | following << 16, long_mask)
+            ids[1:][long_mask[:-1]] = 0
+            return ids, mnemonics
+        short_table = numpy.frombuffer(self.short_table, dtype=numpy.uint16)
+        if words.dtype != numpy.uint32:
+            raise TypeError(
+                'expected a uint16 or uint32 array, not {}'.format(words.dtype))
+        low = words & 0xffff
+        high = words >> 16
+        ids = short_table[low]
+        prefixed = low >= 0xf000
+        if long_mask is not None:
+            prefixed &= numpy.asarray(long_mask, dtype=bool)
+        pfix = prefixed & (low < 0xf800)
+        if pfix.any():
+            pfix_table = numpy.frombuffer(self.pfix_table, dtype=numpy.uint16)
+            ids[pfix] = numpy.where(low[pfix] & 0x400, 0,
+                pfix_table[high[pfix] >> 6])
+        eopr = prefixed & (low >= 0xf800)
+        if eopr.any():
+            eopr_kind = numpy.frombuffer(self.eopr_kind, dtype=numpy.uint8)
+            eopr_class = numpy.frombuffer(self.eopr_class, dtype=numpy.uint8)
+            eopr_table = numpy.frombuffer(self.eopr_table, dtype=numpy.uint16)
+            low = low[eopr]
+            high = high[eopr]
+            kind = eopr_kind[low >> 5 & 0x3f].astype(numpy.uint32)
+            nops = eopr_class[kind << 11 | high & 0x7ff].astype(numpy.uint32)
+            ids[eopr] = eopr_table[high >> 11 << 9 | nops << 6
+                | (low & 0x10) << 1 | high & 0x1f]
+        return ids, self.mnemonics
+
+    def decode_word(self, low, high, highvalid=False, operands=False):
+        """
+            Take a low (and possibly high) instruction word and return
+            the mnemonic for it as INSTR_ENCODING, e.g. add_3r, or a tuple of
+            the mnemonic and its operands if operands is set
+        """
+        mid = self.decode_id(low, high, highvalid)
+        if mid:
+            if operands:
+                decoded = self.mnemonics[mid]
+                return decoded, self.decode_operands(decoded, low, high)
+            return self.mnemonics[mid]
+        return XS1Decoder.decode_word(self, low, high, highvalid, operands)
+
+    def decode_instruction(self, low, high=0, highvalid=False):
+        """
+            Take a low (and possibly high) instruction word and return its
+            XS1Instruction from the catalogue
+        """
+        mid = self.decode_id(low, high, highvalid)
+        if mid:
+            return self.catalogue[mid]
+        raise KeyError(low if not highvalid else (low, high))
+
+class DecodedImage(object):
+    """
+        Decoded instructions of a whole program, held as addresses,
+        mnemonic IDs and instruction words (low | high << 16) in parallel
+        arrays sorted by address. Words are 0 for instructions added from
+        decode_line results, which do not carry them
+    """
+    def __init__(self, decoder=None, addresses=None, ids=None, words=None):
+        if decoder is None:
+            decoder = XS1FastDecoder()
+        self.decoder = decoder
+        self.mnemonics = decoder.mnemonics
+        self.addresses = array('I') if addresses is None else addresses
+        self.ids = array('H') if ids is None else ids
+        self.words = array('I') if words is None else words
+        self.sorted = True
+
+    @classmethod
+    def from_lines(cls, lines, decoder=None):
+        """
+            Decode every xobjdump line that has an address
+        """
+        image = cls(decoder)
+        parse_line = image.decoder.parse_line
+        decode_id = image.decoder.decode_id
+        addresses = image.addresses
+        ids = image.ids
+        words = image.words
+        for line in lines:
+            parsed = parse_line(line)
+            if parsed and parsed[0] is not None:
+                address, low, high, length, unused = parsed
+                assert length in [2, 4]
+                if addresses and address < addresses[-1]:
+                    image.sorted = False
+                addresses.append(address)
+                ids.append(decode_id(low, high, length == 4))
+                words.append(low | high << 16)
+        image.sort()
+        return image
+
+    def add(self, decoded):
+        """
+            Add the { address: mnemonic } result of decode_line in tup mode.
+            Lines without an address are skipped
+        """
+        mnemonic_ids = self.decoder.mnemonic_ids
+        for address, mnemonic in decoded.items():
+            if address is None:
+                continue
+            if self.addresses and address < self.addresses[-1]:
+                self.sorted = False
+            self.addresses.append(address)
+            self.ids.append(mnemonic_ids[mnemonic])
+            self.words.append(0)
+
+    def sort(self):
+        """
+            Restore address order after out of order additions
+        """
+        if not self.sorted:
+            order = sorted(xrange(len(self.addresses)),
+                key=self.addresses.__getitem__)
+            self.addresses = array('I', [self.addresses[i] for i in order])
+            self.ids = array('H', [self.ids[i] for i in order])
+            self.words = array('I', [self.words[i] for i in order])
+            self.sorted = True
+
+    def __len__(self):
+        return len(self.addresses)
+
+    def __iter__(self):
+        """
+            Iterate over (address, mnemonic ID) in address order
+        """
+        self.sort()
+        return izip(self.addresses, self.ids)
+
+    def names(self):
+        """
+            Iterate over (address, mnemonic) in address order
+        """
+        mnemonics = self.mnemonics
+        for address, mid in self:
+            yield address, mnemonics[mid]
+
+    def index(self, address):
+        """
+            Position of the instruction at address, or -1
+        """
+        self.sort()
+        i = bisect_left(self.addresses, address)
+        if i < len(self.addresses) and self.addresses[i] == address:
+            return i
+        return -1
+
+    def lookup_id(self, address):
+        """
+            Mnemonic ID of the instruction at address, 0 if there is none
+        """
+        i = self.index(address)
+        return self.ids[i] if i >= 0 else 0
+
+    def lookup(self, address):
+        """
+            Mnemonic of the instruction at address, None if there is none
+        """
+        return self.mnemonics[self.lookup_id(address)]
+
+    def lookup_instruction(self, address):
+        """
+            XS1Instruction at address, None if there is none
+        """
+        return self.decoder.catalogue[self.lookup_id(address)]
+
+    def slice(self, start, end):
+        """
+            A new DecodedImage of the instructions from start up to end
+        """
+        self.sort()
+        first = bisect_left(self.addresses, start)
+        last = bisect_left(self.addresses, end)
+        return DecodedImage(self.decoder, self.addresses[first:last],
+            self.ids[first:last], self.words[first:last])
+
+class XS1Stats(object):
+    """
+        Counters and stage timings gathered by XS1Decoder.enable_stats
+    """
+    stages = ('parse', 'decode', 'verify', 'output')
+
+    def __init__(self):
+        self.lines = 0
+        self.matched = 0
+        self.failures = 0
+        # Decoded instructions by 5-bit opcode and by mnemonic
+        self.opcodes = [0] * 0x20
+        self.mnemonics = {}
+        self.times = dict((stage, 0.0) for stage in self.stages)
+
+    def timed(self, stage, func):
+        """
+            Wrap func so that the time spent in it is added to stage
+        """
+        times = self.times
+        clock = time.time
+        def timed_func(*args):
+            start = clock()
+            try:
+                return func(*args)
+            finally:
+                times[stage] += clock() - start
+        return timed_func
+
+    def merge(self, other):
+        """
+            Add the counts and times from another XS1Stats
+        """
+        self.lines += other.lines
+        self.matched += other.matched
+        self.failures += other.failures
+        for opc, count in enumerate(other.opcodes):
+            self.opcodes[opc] += count
+        for name, count in other.mnemonics.items():
+            self.mnemonics[name] = self.mnemonics.get(name, 0) + count
+        for stage, seconds in other.times.items():
+            self.times[stage] += seconds
+
+    def encodings(self):
+        """
+            Decoded instructions by encoding class
+        """
+        XS1Decoder.build_catalogue()
+        counts = {}
+        for name, count in self.mnemonics.items():
+            encoding = XS1Decoder.instruction(name).encoding or name
+            counts[encoding] = counts.get(encoding, 0) + count
+        return counts
+
+    def report(self):
+        """
+            Human readable summary
+        """
+        lines = [
+            'lines {}, matched {}, decoded {}, failures {}'.format(
+                self.lines, self.matched, sum(self.opcodes), self.failures),
+            'time ' + ', '.join('{} {:.3f}s'.format(stage, self.times[stage])
+                for stage in self.stages),
+            'by opcode:',
+        ]
+        lines += ['    0x{:02x} {}'.format(opc, count)
+            for opc, count in enumerate(self.opcodes) if count]
+        lines.append('by encoding:')
+        lines += ['    {} {}'.format(encoding, count)
+            for encoding, count in sorted(self.encodings().items())]
+        return '\n'.join(lines)
+
+class XS1Memo(object):
+    """
+        Bounded memo with approximately least recently used eviction.
+        Entries live in two generations of at most size / 2 each: a hit in
+        the older generation moves the entry to the current one, and when
+        the current generation is full it becomes the older one, dropping
+        whatever was not used since. Hits in the current generation are a
+        single dictionary lookup
+    """
+    def __init__(self, size):
+        self.size = size
+        self.current = {}
+        self.previous = {}
+        self.hits = 0
+        self.misses = 0
+
+    def memoize(self, func):
+        """
+            Return memoized(key, *args), which answers func(*args) from the
+            memo by key
+        """
+        memo = self
+        current = self.current
+        previous = self.previous
+        limit = max(1, self.size / 2)
+        def memoized(key, *args):
+            try:
+                value = current[key]
+            except KeyError:
+                try:
+                    value = previous[key]
+                    memo.hits += 1
+                except KeyError:
+                    value = func(*args)
+                    memo.misses += 1
+                if len(current) >= limit:
+                    previous.clear()
+                    previous.update(current)
+                    current.clear()
+                current[key] = value
+                return value
+            memo.hits += 1
+            return value
+        return memoized
+
+    def __len__(self):
+        return len(self.current) + len(self.previous)
+
+    def report(self):
+        """
+            Human readable hit and miss counts
+        """
+        lookups = self.hits + self.misses
+        return 'hits {}, misses {} ({:.1f}% hits), entries {}'.format(
+            self.hits, self.misses, 100.0 * self.hits / (lookups or 1),
+            len(self))
+
+class XS1VerifySummary(object):
+    """
+        Results of verify_line over a dump: how many lines were checked and
+        the mismatches, grouped by xobjdump's annotation and the decoded
+        mnemonic
+    """
+    # Addresses kept for each kind of mismatch
+    max_addresses = 8
+
+    def __init__(self):
+        self.checked = 0
+        self.mismatched = 0
+        # [count, addresses] by (instr, encoding, decoded)
+        self.mismatches = {}
+
+    def add(self, result):
+        """
+            Count one verify_line result
+        """
+        if result is None:
+            return
+        address, instr, encoding, decoded, ok = result
+        self.checked += 1
+        if not ok:
+            self.mismatched += 1
+            entry = self.mismatches.setdefault(
+                (instr, encoding, decoded), [0, []])
+            entry[0] += 1
+            if len(entry[1]) < self.max_addresses:
+                entry[1].append(address)
+
+    def merge(self, other):
+        """
+            Add the counts and mismatches from another XS1VerifySummary
+        """
+        self.checked += other.checked
+        self.mismatched += other.mismatched
+        for key, (count, addresses) in other.mismatches.items():
+            entry = self.mismatches.setdefault(key, [0, []])
+            entry[0] += count
+            entry[1] = (entry[1] + addresses)[:self.max_addresses]
+
+    def report(self):
+        """
+            Human readable summary, most frequent mismatches first
+        """
+        lines = ['checked {}, mismatches {}'.format(
+            self.checked, self.mismatched)]
+        for (instr, encoding, decoded), (count, addresses) in sorted(
+                self.mismatches.items(),
+                key=lambda item: (-item[1][0], item[0])):
+            lines.append('    {} ({}) decoded as {}: {} at {}{}'.format(
+                instr.lower(), encoding, decoded or 'nothing', count,
+                ', '.join('0x{:08x}'.format(a) for a in addresses),
+                ', ...' if count > len(addresses) else ''))
+        return '\n'.join(lines)
+
+# Decoder for the current worker process of decode_parallel
+_WORKER_DECODER = None
+
+def _init_worker(decoder_class, table_file, memo):
+    """
+        Build the decoder (and its tables) once per worker process, with the
+        enable_memo arguments memo, if given
+    """
+    global _WORKER_DECODER
+    if table_file is not None:
+        _WORKER_DECODER = decoder_class(table_file=table_file)
+    else:
+        _WORKER_DECODER = decoder_class()
+    if memo is not None:
+        _WORKER_DECODER.enable_memo(*memo)
+
+def _workers_alive(pool, workers):
+    """
+        Whether every worker process of pool seen so far is still running.
+        The pool replaces a worker that exits and forgets it, so workers is
+        the set of those seen, updated here
+    """
+    workers.update(pool._pool)
+    return all(w.exitcode is None for w in workers)
+
+def _map_ordered(pool, func, tasks, jobs):
+    """
+        Apply func to each tuple of arguments in tasks in pool, yielding
+        (arguments, result) in task order with at most two tasks per worker
+        in flight, then shut the pool down. Pool.terminate deadlocks while
+        the pool's task handler is still feeding a task to the workers, so
+        however the caller stops, the outstanding tasks are waited for first.
+        A worker that dies takes its task with it, which would leave those
+        waits hanging, so they poll and raise WorkerLost instead
+    """
+    from collections import deque
+    pending = deque()
+    workers = set(pool._pool)
+    def wait(result):
+        while not result.ready():
+            if not _workers_alive(pool, workers):
+                raise WorkerLost('a worker process exited with exit code {} '
+                    'before finishing its task'.format(', '.join(
+                        str(w.exitcode) for w in workers
+                        if w.exitcode is not None)))
+            result.wait(0.1)
+    try:
+        for args in tasks:
+            pending.append((args, pool.apply_async(func, args)))
+            if len(pending) > 2 * jobs:
+                args, result = pending.popleft()
+                wait(result)
+                yield args, result.get()
+        while pending:
+            args, result = pending.popleft()
+            wait(result)
+            yield args, result.get()
+        pool.close()
+    finally:
+        try:
+            for unused, result in pending:
+                wait(result)
+        except WorkerLost:
+            pass
+        pool.terminate()
+        pool.join()
+
+def _decode_chunk(lines, merge, replace, tup, with_stats, verify):
+    """
+        Decode (or verify) a chunk of lines in a worker process. Returns the
+        results and the chunk's XS1Stats, if with_stats is set
+    """
+    stats = None
+    if with_stats:
+        stats = _WORKER_DECODER.enable_stats()
+    # Hand the results so far and the diagnostics back with a failure, for
+    # the parent to report in order with the output
+    results = []
+    diagnostics = []
+    _WORKER_DECODER.diagnostic = diagnostics.append
+    try:
+        if verify:
+            verify_line = _WORKER_DECODER.verify_line
+            return [verify_line(line) for line in lines], stats
+        decode_line = _WORKER_DECODER.decode_line
+        for line in lines:
+            results.append(decode_line(line, merge, replace, tup))
+        return results, stats
+    except Exception as e:
+        e.results = results
+        e.diagnostics = diagnostics
+        raise
+    finally:
+        _WORKER_DECODER.disable_stats()
+
+def decode_parallel(file_handle, jobs, merge=None, replace=False, tup=False,
+        decoder_class=XS1Decoder, table_file=None, chunk_lines=4096,
+        stats=None, verify=False, memo=None, diagnostic=None):
+    """
+        Decode a file in a pool of jobs worker processes, yielding the
+        decode_line result (or verify_line result, if verify is set) for each
+        line in input order. The file is read in chunks of chunk_lines lines,
+        with at most two chunks per worker in flight at once. Worker
+        statistics are merged into stats, if given. memo is a (size, lines)
+        tuple of enable_memo arguments for each worker. When a chunk fails,
+        the results before the failure are yielded and its diagnostics go
+        to diagnostic (by default XS1Decoder.diagnostic) before its
+        exception is raised again, as for a single process
+    """
+    import multiprocessing
+    from itertools import islice
+    pool = multiprocessing.Pool(jobs, _init_worker,
+        (decoder_class, table_file, memo))
+    chunks = iter(lambda: list(islice(file_handle, chunk_lines)), [])
+    tasks = ((chunk, merge, replace, tup, stats is not None, verify)
+        for chunk in chunks)
+    ordered = _map_ordered(pool, _decode_chunk, tasks, jobs)
+    try:
+        while True:
+            try:
+                unused, (results, chunk_stats) = next(ordered)
+            except StopIteration:
+                return
+            except Exception as e:
+                # Yielding clears the exception being handled, so keep it to
+                # raise again once the chunk's output is out
+                failure = sys.exc_info()
+                for decoded in getattr(e, 'results', ()):
+                    yield decoded
+                for text in getattr(e, 'diagnostics', ()):
+                    if diagnostic is None:
+                        print text
+                    else:
+                        diagnostic(text)
+                raise failure[0], failure[1], failure[2]
+            if chunk_stats is not None:
+                stats.merge(chunk_stats)
+            for decoded in results:
+                yield decoded
+    finally:
+        ordered.close()
+
+def _decode_span(path, start, end, limit):
+    """
+        Decode the code from start up to end of the file at path in a worker
+        process, as if start began an instruction, letting the last
+        instruction run on up to limit. Also decode from start + 2, for when
+        start is the high word of a long instruction, until that walk meets
+        the first one. Returns (ids, lengths) of the first walk and (ids,
+        lengths, meet) of the second, where meet is the index in the first
+        walk where they meet, or None if they do not meet before end
+    """
+    import mmap
+    with open(path, 'rb') as f:
+        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        decode_buffer = _WORKER_DECODER.decode_buffer
+        ids = array('H')
+        lengths = array('B')
+        for offset, mid, length in decode_buffer(buf, start, limit):
+            if offset >= end:
+                break
+            ids.append(mid)
+            lengths.append(length)
+        alt_ids = array('H')
+        alt_lengths = array('B')
+        meet = None
+        j = 0
+        position = start
+        for offset, mid, length in decode_buffer(buf, start + 2, limit):
+            if offset >= end:
+                break
+            while position < offset and j < len(lengths):
+                position += lengths[j]
+                j += 1
+            if position == offset:
+                meet = j
+                break
+            alt_ids.append(mid)
+            alt_lengths.append(length)
+        return (ids, lengths), (alt_ids, alt_lengths, meet)
+    finally:
+        buf.close()
+
+def decode_buffer_parallel(path, jobs, offset=0, end=None,
+        decoder_class=XS1FastDecoder, table_file=None, chunk_bytes=1 << 20):
+    """
+        XS1FastDecoder.decode_buffer over the file at path, split into chunks
+        of chunk_bytes decoded by a pool of jobs worker processes that each
+        map the file. A chunk may start on the high word of a long
+        instruction, so workers also decode from the second word until the
+        walks meet, and the chunks are joined in order from whichever walk
+        the previous chunk's last instruction leads into. Yields (offset,
+        mnemonic ID, length in bytes) exactly as decode_buffer would
+    """
+    import multiprocessing
+    if end is None:
+        end = os.path.getsize(path)
+    end = offset + ((end - offset) & ~1)
+    chunk_bytes = max(4, chunk_bytes & ~1)
+    pool = multiprocessing.Pool(jobs, _init_worker,
+        (decoder_class, table_file, None))
+    tasks = ((path, start, min(start + chunk_bytes, end), end)
+        for start in xrange(offset, end, chunk_bytes))
+    ordered = _map_ordered(pool, _decode_span, tasks, jobs)
+    try:
+        expect = offset
+        for (unused, start, unused, unused), walks in ordered:
+            (ids, lengths), (alt_ids, alt_lengths, meet) = walks
+            if expect == start + 2:
+                if meet is None:
+                    ids, lengths = alt_ids, alt_lengths
+                else:
+                    ids = alt_ids + ids[meet:]
+                    lengths = alt_lengths + lengths[meet:]
+            else:
+                assert expect == start
+            position = expect
+            for mid, length in izip(ids, lengths):
+                yield position, mid, length
+                position += length
+            expect = position
+    finally:
+        ordered.close()
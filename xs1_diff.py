@@ -0,0 +1,353 @@
+"""
+    Semantic diff of two builds for the XS1 Decoder
+
+    Compares the xobjdump output of two builds function by function, as
+    sequences of mnemonic IDs rather than text, so that shifted addresses
+    and changed immediates do not show up as differences. Functions are
+    matched by symbol. Identical sequences are recognised by comparing their
+    packed IDs; the occurrences of a repeated symbol (e.g. one per tile) are
+    matched by aligning these, and unmatched functions with identical
+    sequences are reported as renamed.
+    Changed functions are aligned with difflib, after stripping their
+    common prefix and suffix, and reported with their instruction mix
+    deltas.
+
+    Dumps are scanned through a memory map with one regular expression per
+    function, and each distinct instruction encoding is decoded only once.
+    Large dumps can be decoded by a pool of worker processes.
+"""
+
+import difflib
+import mmap
+import re
+from array import array
+from itertools import chain, izip
+
+import xs1_core
+from xs1_core import XS1Decoder, XS1FastDecoder
+
+# Section headers and function labels, e.g. "<main>:", at the start of the
+# file and after a newline. The patterns start with a literal and spell out
+# both cases of hex digits rather than use re.I, so that scanning is fast
+HEADER = r'(?:Disassembly of section ([^\s:]+)|{})'.format(
+    XS1Decoder.labelpattern)
+FIRST_BOUNDARY = re.compile(HEADER)
+BOUNDARY = re.compile(r'\n' + HEADER)
+# Instruction bytes of xobjdump lines, as XS1Decoder.linematcher captures
+# them, followed by the colon before xobjdump's own mnemonic
+WORDS = re.compile(
+    r'0x[0-9a-fA-F]+:[ \t]*([0-9a-fA-F]{2}[ \t]*[0-9a-fA-F]{2}'
+    r'(?:[ \t]*[0-9a-fA-F]{2}[ \t]*[0-9a-fA-F]{2})?)[ \t]*:')
+
+
+def word_id(decoder, word):
+    """
+        Mnemonic ID of the bytes of one instruction, e.g. "10 f0 40 6b"
+    """
+    h = ''.join(word.split())
+    if len(h) == 8:
+        return decoder.decode_id(
+            int(h[2:4] + h[:2], 16), int(h[6:8] + h[4:6], 16), True)
+    return decoder.decode_id(int(h[2:4] + h[:2], 16))
+
+
+def piece_ids(decoder, ids, buf, start, end):
+    """
+        Mnemonic IDs of the instructions in buf[start:end], decoding only
+        the instruction bytes not already in the dict ids
+    """
+    words = WORDS.findall(buf, start, end)
+    for word in set(words).difference(ids):
+        ids[word] = word_id(decoder, word)
+    return array('H', map(ids.__getitem__, words))
+
+
+# Mnemonic IDs by instruction bytes in a worker process of DumpFunctions
+_WORKER_IDS = {}
+
+
+def _decode_pieces(path, pieces):
+    """
+        piece_ids for each (start, end) of the file at path in a worker
+        process
+    """
+    with open(path, 'rb') as f:
+        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        decoder = xs1_core._WORKER_DECODER
+        return [piece_ids(decoder, _WORKER_IDS, buf, start, end)
+            for start, end in pieces]
+    finally:
+        buf.close()
+
+
+class DumpFunctions(object):
+    """
+        Mnemonic ID sequences (array('H')) of the functions of an xobjdump
+        file, by symbol in dump order. Code before the first label of a
+        section is keyed by the section name in brackets. A symbol seen
+        again is keyed as symbol#2, symbol#3 and so on, and groups lists
+        the keys of each symbol. With jobs > 1 the functions are decoded
+        by a pool of worker processes, in groups of about chunk_bytes
+    """
+    def __init__(self, path, decoder=None, jobs=1, table_file=None,
+            chunk_bytes=1 << 22):
+        if decoder is None:
+            decoder = XS1FastDecoder()
+        self.path = path
+        self.decoder = decoder
+        self.symbols = []
+        self.functions = {}
+        self.groups = {}
+        self.ids = {}
+        with open(path, 'rb') as f:
+            try:
+                buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # Empty file
+                return
+        try:
+            pieces = self.pieces(buf)
+            if jobs > 1:
+                self.decode_parallel(pieces, jobs, table_file, chunk_bytes)
+            else:
+                for symbol, start, end in pieces:
+                    self.add(symbol, piece_ids(
+                        decoder, self.ids, buf, start, end))
+        finally:
+            buf.close()
+
+    def pieces(self, buf):
+        """
+            Split the dump at its section headers and labels, returning
+            (symbol, start, end) of each piece
+        """
+        pieces = []
+        symbol = '[]'
+        start = 0
+        matches = BOUNDARY.finditer(buf)
+        first = FIRST_BOUNDARY.match(buf)
+        if first is not None:
+            matches = chain([first], matches)
+        for match in matches:
+            pieces.append((symbol, start, match.start()))
+            section, label = match.groups()
+            symbol = '[{}]'.format(section) if label is None else label
+            start = match.end()
+        pieces.append((symbol, start, len(buf)))
+        return pieces
+
+    def decode_parallel(self, pieces, jobs, table_file, chunk_bytes):
+        """
+            Decode the pieces in a pool of jobs worker processes that each
+            map the file, adding them in dump order
+        """
+        import multiprocessing
+        chunks = [[]]
+        size = 0
+        for piece in pieces:
+            if size >= chunk_bytes:
+                chunks.append([])
+                size = 0
+            chunks[-1].append(piece)
+            size += piece[2] - piece[1]
+        pool = multiprocessing.Pool(jobs, xs1_core._init_worker,
+            (type(self.decoder), table_file, None))
+        tasks = ((self.path, [(start, end) for unused, start, end in chunk])
+            for chunk in chunks)
+        ordered = xs1_core._map_ordered(pool, _decode_pieces, tasks, jobs)
+        try:
+            for chunk, (unused, result) in izip(chunks, ordered):
+                for (symbol, unused, unused), ids in zip(chunk, result):
+                    self.add(symbol, ids)
+        finally:
+            ordered.close()
+
+    def add(self, symbol, ids):
+        """
+            Add the mnemonic IDs of a piece as function symbol, unless it
+            has no instructions
+        """
+        if not ids:
+            return
+        keys = self.groups.setdefault(symbol, [])
+        key = symbol if not keys else '{}#{}'.format(symbol, len(keys) + 1)
+        keys.append(key)
+        self.symbols.append(key)
+        self.functions[key] = ids
+
+    def __len__(self):
+        return len(self.symbols)
+
+
+class FunctionChange(object):
+    """
+        How one function's instruction sequence changed, from symbol in the
+        old build to new_symbol (the same, unless it is a repeated symbol
+        whose occurrences moved) in the new one: the instructions
+        inserted, deleted and replaced by the alignment, its similarity
+        ratio and the change in count of each mnemonic ID
+    """
+    __slots__ = ('symbol', 'new_symbol', 'old', 'new', 'inserted',
+        'deleted', 'replaced', 'ratio', 'mix')
+
+    def __init__(self, symbol, new_symbol, old, new):
+        self.symbol = symbol
+        self.new_symbol = new_symbol
+        self.old = len(old)
+        self.new = len(new)
+        self.inserted = self.deleted = self.replaced = 0
+        # Only the middle that differs needs aligning
+        prefix = 0
+        limit = min(len(old), len(new))
+        while prefix < limit and old[prefix] == new[prefix]:
+            prefix += 1
+        suffix = 0
+        limit -= prefix
+        while suffix < limit and old[-1 - suffix] == new[-1 - suffix]:
+            suffix += 1
+        a = old[prefix:len(old) - suffix].tolist()
+        b = new[prefix:len(new) - suffix].tolist()
+        matcher = difflib.SequenceMatcher(None, a, b, autojunk=False)
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+            if tag == 'insert':
+                self.inserted += j2 - j1
+            elif tag == 'delete':
+                self.deleted += i2 - i1
+            elif tag == 'replace':
+                self.replaced += max(i2 - i1, j2 - j1)
+        same = prefix + suffix + sum(
+            size for unused, unused, size in matcher.get_matching_blocks())
+        self.ratio = 2.0 * same / (self.old + self.new)
+        self.mix = {}
+        for mid in a:
+            self.mix[mid] = self.mix.get(mid, 0) - 1
+        for mid in b:
+            self.mix[mid] = self.mix.get(mid, 0) + 1
+        for mid, delta in self.mix.items():
+            if not delta:
+                del self.mix[mid]
+
+
+class BuildDiff(object):
+    """
+        Function by function comparison of two DumpFunctions
+    """
+    def __init__(self, old, new):
+        self.old = old
+        self.new = new
+        self.mnemonics = old.decoder.mnemonics
+        self.unchanged = 0
+        self.changed = []
+        old_only = []
+        new_only = []
+        for symbol, old_keys in old.groups.items():
+            new_keys = new.groups.get(symbol, ())
+            for a, b in self.match(old_keys, new_keys, old_only, new_only):
+                self.changed.append(FunctionChange(
+                    a, b, old.functions[a], new.functions[b]))
+        for symbol, new_keys in new.groups.items():
+            if symbol not in old.groups:
+                new_only.extend(new_keys)
+        # Keep dump order in the report
+        order = dict((s, i) for i, s in enumerate(old.symbols))
+        old_only.sort(key=order.get)
+        order = dict((s, i) for i, s in enumerate(new.symbols))
+        new_only.sort(key=order.get)
+        # Unmatched functions with the same instructions were renamed
+        by_code = {}
+        for symbol in new_only:
+            by_code.setdefault(new.functions[symbol].tostring(), []).append(
+                symbol)
+        self.renamed = []
+        self.removed = []
+        for symbol in old_only:
+            candidates = by_code.get(old.functions[symbol].tostring())
+            if candidates:
+                self.renamed.append((symbol, candidates.pop(0)))
+            else:
+                self.removed.append(symbol)
+        renamed = set(b for a, b in self.renamed)
+        self.added = [s for s in new_only if s not in renamed]
+
+    def match(self, old_keys, new_keys, old_only, new_only):
+        """
+            Pair up the occurrences of one symbol in the two builds by
+            aligning their instruction sequences, counting identical pairs
+            as unchanged. Returns the pairs that differ, adding occurrences
+            left over to old_only and new_only
+        """
+        old_code = [self.old.functions[k].tostring() for k in old_keys]
+        new_code = [self.new.functions[k].tostring() for k in new_keys]
+        if len(old_keys) == len(new_keys) == 1:
+            if old_code == new_code:
+                self.unchanged += 1
+                return []
+            return [(old_keys[0], new_keys[0])]
+        pairs = []
+        matcher = difflib.SequenceMatcher(None, old_code, new_code,
+            autojunk=False)
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+            if tag == 'equal':
+                self.unchanged += i2 - i1
+                continue
+            count = min(i2 - i1, j2 - j1)
+            pairs.extend(zip(old_keys[i1:i1 + count], new_keys[j1:j1 + count]))
+            old_only.extend(old_keys[i1 + count:i2])
+            new_only.extend(new_keys[j1 + count:j2])
+        return pairs
+
+    def mix(self):
+        """
+            Change in count of each mnemonic ID over the whole build,
+            including added and removed functions
+        """
+        mix = {}
+        for change in self.changed:
+            for mid, delta in change.mix.items():
+                mix[mid] = mix.get(mid, 0) + delta
+        for sign, functions, symbols in (
+                (-1, self.old.functions, self.removed),
+                (1, self.new.functions, self.added)):
+            for symbol in symbols:
+                for mid in functions[symbol]:
+                    mix[mid] = mix.get(mid, 0) + sign
+        return dict((mid, delta) for mid, delta in mix.items() if delta)
+
+    def format_mix(self, mix):
+        return ' '.join('{:+d} {}'.format(delta, self.mnemonics[mid] or '??')
+            for mid, delta in sorted(mix.items(),
+                key=lambda item: (-abs(item[1]), item[0])))
+
+    def report(self):
+        """
+            Human readable summary, most changed functions first
+        """
+        lines = ['{} functions in {}, {} in {}: {} unchanged, {} changed, '
+            '{} renamed, {} added, {} removed'.format(len(self.old),
+                self.old.path, len(self.new), self.new.path, self.unchanged,
+                len(self.changed), len(self.renamed), len(self.added),
+                len(self.removed))]
+        for change in sorted(self.changed,
+                key=lambda c: (c.ratio, c.symbol)):
+            symbol = change.symbol
+            if change.new_symbol != symbol:
+                symbol += '> -> <' + change.new_symbol
+            lines.append('changed <{}>: {} -> {} instructions, {} inserted, '
+                '{} deleted, {} replaced, similarity {:.3f}'.format(
+                    symbol, change.old, change.new, change.inserted,
+                    change.deleted, change.replaced, change.ratio))
+            if change.mix:
+                lines.append('    ' + self.format_mix(change.mix))
+        for a, b in self.renamed:
+            lines.append('renamed <{}> -> <{}>'.format(a, b))
+        for symbol in self.added:
+            lines.append('added <{}>: {} instructions'.format(
+                symbol, len(self.new.functions[symbol])))
+        for symbol in self.removed:
+            lines.append('removed <{}>: {} instructions'.format(
+                symbol, len(self.old.functions[symbol])))
+        mix = self.mix()
+        if mix:
+            lines.append('mix ' + self.format_mix(mix))
+        return '\n'.join(lines)
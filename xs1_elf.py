@@ -0,0 +1,185 @@
+"""
+    ELF and .xe reader for the XS1 Decoder
+
+    Memory-maps an XCore ELF file, or an XMOS .xe container of ELF images,
+    finds the executable sections and decodes their little-endian 16-bit
+    instruction words directly, without going through xobjdump.
+"""
+
+import mmap
+import os
+import struct
+
+from xs1_core import XS1FastDecoder, decode_buffer_parallel
+
+# ELF identification and the fields we care about
+ELF_MAGIC = '\x7fELF'
+ELFCLASS32 = 1
+ELFDATA2LSB = 1
+EM_XCORE = 0xcb
+SHT_NOBITS = 8
+SHF_EXECINSTR = 0x4
+
+# .xe container magic
+XE_MAGIC = 'XMOS'
+
+
+class XS1Elf(object):
+    """
+        A little-endian ELF32 XCore image at some offset in a buffer
+    """
+    # e_ident, e_type, e_machine, e_version, e_entry, e_phoff, e_shoff,
+    # e_flags, e_ehsize, e_phentsize, e_phnum, e_shentsize, e_shnum,
+    # e_shstrndx
+    header = struct.Struct('<16sHHIIIIIHHHHHH')
+    # sh_name, sh_type, sh_flags, sh_addr, sh_offset, sh_size, sh_link,
+    # sh_info, sh_addralign, sh_entsize
+    section_header = struct.Struct('<IIIIIIIIII')
+
+    def __init__(self, buf, base=0):
+        self.buf = buf
+        self.base = base
+        if len(buf) - base < self.header.size:
+            raise ValueError('truncated ELF header at {:#x}'.format(base))
+        (ident, unused, machine, unused, unused, unused, shoff, unused,
+            unused, unused, unused, shentsize, shnum, shstrndx
+            ) = self.header.unpack_from(buf, base)
+        if (ident[:4] != ELF_MAGIC or ord(ident[4]) != ELFCLASS32
+                or ord(ident[5]) != ELFDATA2LSB):
+            raise ValueError('no ELF32 LSB image at {:#x}'.format(base))
+        if machine != EM_XCORE:
+            raise ValueError('ELF image at {:#x} is not XCore'.format(base))
+        if (shentsize != self.section_header.size or shstrndx >= shnum
+                or base + shoff + shnum * shentsize > len(buf)):
+            raise ValueError('bad section table at {:#x}'.format(base))
+        self.sections = [
+            self.section_header.unpack_from(buf, base + shoff + i * shentsize)
+            for i in xrange(shnum)]
+        self.strtab = base + self.sections[shstrndx][4]
+
+    def section_name(self, section):
+        """
+            Read a section name from the section header string table
+        """
+        start = self.strtab + section[0]
+        end = self.buf.find('\0', start)
+        return self.buf[start:end]
+
+    def code_sections(self):
+        """
+            Yield (name, address, file offset, size) for executable sections
+        """
+        for section in self.sections:
+            flags, addr, offset, size = section[2:6]
+            if (flags & SHF_EXECINSTR and section[1] != SHT_NOBITS
+                    and self.base + offset + size <= len(self.buf)):
+                yield (self.section_name(section), addr, self.base + offset,
+                    size)
+
+
+def map_file(path):
+    """
+        Memory-map the file at path for reading. mmap refuses empty files,
+        so those raise the ValueError of a file that is not ELF
+    """
+    with open(path, 'rb') as f:
+        if not os.fstat(f.fileno()).st_size:
+            raise ValueError('{}: empty, not an ELF or .xe file'.format(path))
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def find_images(buf):
+    """
+        Return the XCore ELF images in buf, which is either an ELF file or a
+        .xe container holding one ELF image per core
+    """
+    if buf[:4] == ELF_MAGIC:
+        return [XS1Elf(buf)]
+    if buf[:4] != XE_MAGIC:
+        raise ValueError('not an ELF or .xe file')
+    images = []
+    start = buf.find(ELF_MAGIC)
+    while start >= 0:
+        try:
+            images.append(XS1Elf(buf, start))
+        except ValueError:
+            pass
+        start = buf.find(ELF_MAGIC, start + 1)
+    return images
+
+
+def decode_elf(path, decoder=None, jobs=1, table_file=None):
+    """
+        Decode every code section of an ELF or .xe file. Yields (image
+        number, section name, address, mnemonic), where mnemonic is None for
+        words that do not decode. With jobs > 1 each section is decoded by
+        decode_buffer_parallel. The file is opened and checked here, so that
+        IOError and ValueError come from the call rather than the iteration
+    """
+    if decoder is None:
+        decoder = XS1FastDecoder()
+    buf = map_file(path)
+    try:
+        images = find_images(buf)
+    except ValueError:
+        buf.close()
+        raise
+    return _decode_images(buf, images, path, decoder, jobs, table_file)
+
+
+def _decode_images(buf, images, path, decoder, jobs, table_file):
+    """
+        The generator behind decode_elf, which closes buf when done
+    """
+    try:
+        for image, elf in enumerate(images):
+            for name, addr, offset, size in elf.code_sections():
+                if jobs > 1:
+                    walk = decode_buffer_parallel(path, jobs, offset,
+                        offset + size, type(decoder), table_file)
+                else:
+                    walk = decoder.decode_buffer(buf, offset, offset + size)
+                for position, mid, unused in walk:
+                    yield (image, name, addr + position - offset,
+                        decoder.mnemonics[mid])
+    finally:
+        buf.close()
+
+
+class XS1ElfCode(object):
+    """
+        Random access decoding of the code sections of an ELF or .xe file,
+        image by image. A .xe file holds one image per tile, in tile order
+    """
+    def __init__(self, path, decoder=None):
+        if decoder is None:
+            decoder = XS1FastDecoder()
+        self.decoder = decoder
+        self.buf = map_file(path)
+        # (start, end, file offset) of the code sections of each image
+        self.images = [
+            [(addr, addr + (size & ~1), offset)
+                for unused, addr, offset, size in elf.code_sections()]
+            for elf in find_images(self.buf)]
+
+    def decode_id(self, address, image=0):
+        """
+            Mnemonic ID of the instruction at address in the image'th image,
+            0 if it is outside that image's code sections or does not decode
+        """
+        if not 0 <= image < len(self.images):
+            return 0
+        for start, end, offset in self.images[image]:
+            if start <= address < end:
+                offset += address - start
+                stop = offset + min(4, end - address)
+                for unused, mid, unused in self.decoder.decode_buffer(
+                        self.buf, offset, stop):
+                    return mid
+        return 0
+
+    def close(self):
+        """
+            Unmap the file
+        """
+        self.buf.close()
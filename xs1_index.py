@@ -0,0 +1,180 @@
+"""
+    Address index for xobjdump output, for the XS1 Decoder
+
+    Decoding a few hundred instructions around an address should not mean
+    reading a dump of several gigabytes. DumpIndex scans a dump once,
+    through a memory map, and records for every block of about block_bytes
+    the file offset of its first line and the lowest and highest
+    instruction address in it. Blocks end after a line with an address, so
+    the labels and headers before an address are in its block. The index is kept next to the dump and is
+    rebuilt whenever the dump's size or modification time no longer match.
+
+    The index file is a header line "XS1I <version> <size> <mtime>
+    <block bytes> <blocks>", followed by one record per block of offset,
+    lowest and highest address, little-endian. Blocks without addresses
+    have a lowest address above their highest.
+"""
+
+import mmap
+import os
+import re
+import struct
+
+# Addresses of xobjdump lines, as XS1Decoder.xobjpattern matches them
+ADDRESS = re.compile(r'^(?:\.\w*)?[^\S\n]*0x([0-9a-f]+):', re.I | re.M)
+
+# offset, lowest address, highest address
+BLOCK = struct.Struct('<QII')
+
+
+class DumpIndex(object):
+    """
+        Block index of the addresses in an xobjdump file, loaded from the
+        sidecar file index_path (<path>.xs1idx by default) if it is up to
+        date, else built and saved there if possible
+    """
+    version = 2
+    suffix = '.xs1idx'
+
+    def __init__(self, path, index_path=None, block_bytes=1 << 16):
+        self.path = path
+        self.index_path = index_path or path + self.suffix
+        self.block_bytes = block_bytes
+        st = os.stat(path)
+        self.size = st.st_size
+        self.mtime = st.st_mtime
+        self.built = False
+        try:
+            self.load()
+        except (IOError, ValueError, struct.error):
+            self.build()
+            self.built = True
+            try:
+                self.save()
+            except (IOError, OSError, ValueError):
+                # A read-only dump directory, or addresses that do not fit
+                # the file, still get an index, for now
+                pass
+
+    def header(self):
+        return 'XS1I {} {} {!r} {} {}\n'.format(self.version, self.size,
+            self.mtime, self.block_bytes, len(self.offsets))
+
+    def load(self):
+        """
+            Load the index, raising ValueError if it does not belong to the
+            dump as it is now
+        """
+        with open(self.index_path, 'rb') as f:
+            fields = f.readline().split()
+            if (len(fields) != 6 or fields[0] != 'XS1I'
+                    or fields[1:4] != [str(self.version), str(self.size),
+                        repr(self.mtime)]):
+                raise ValueError('{} is out of date'.format(self.index_path))
+            self.block_bytes = int(fields[4])
+            blocks = int(fields[5])
+            data = f.read(blocks * BLOCK.size)
+        self.offsets = []
+        self.lows = []
+        self.highs = []
+        for i in xrange(blocks):
+            offset, low, high = BLOCK.unpack_from(data, i * BLOCK.size)
+            self.offsets.append(offset)
+            self.lows.append(low)
+            self.highs.append(high)
+
+    def save(self):
+        """
+            Write the index to index_path. Raises ValueError if an address
+            does not fit the 32 bits of a record
+        """
+        if self.highs and max(self.highs) > 0xffffffff:
+            raise ValueError('address 0x{:x} in {} does not fit an index '
+                'record'.format(max(self.highs), self.path))
+        tmp = self.index_path + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(self.header())
+            f.write(''.join(BLOCK.pack(*block) for block in zip(
+                self.offsets, self.lows, self.highs)))
+        os.rename(tmp, self.index_path)
+
+    def build(self):
+        """
+            Scan the dump, cutting it into blocks after the first line with
+            an address from every block_bytes on
+        """
+        self.offsets = []
+        self.lows = []
+        self.highs = []
+        if not self.size:
+            return
+        with open(self.path, 'rb') as f:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            findall = ADDRESS.findall
+            search = ADDRESS.search
+            start = 0
+            while start < self.size:
+                m = search(buf, buf.rfind('\n', start,
+                    start + self.block_bytes - 1) + 1 or start)
+                end = buf.find('\n', m.start()) + 1 if m else 0
+                if not end:
+                    end = self.size
+                addresses = findall(buf, start, end)
+                self.offsets.append(start)
+                if addresses:
+                    addresses = map(int, addresses, [16] * len(addresses))
+                    self.lows.append(min(addresses))
+                    self.highs.append(max(addresses))
+                else:
+                    self.lows.append(0xffffffff)
+                    self.highs.append(0)
+                start = end
+        finally:
+            buf.close()
+
+    def spans(self, low, high):
+        """
+            Byte ranges (start, end) of the dump whose blocks may hold
+            addresses from low up to high, joining adjacent blocks
+        """
+        spans = []
+        offsets = self.offsets
+        for i in xrange(len(offsets)):
+            if self.lows[i] < high and self.highs[i] >= low:
+                end = offsets[i + 1] if i + 1 < len(offsets) else self.size
+                if spans and spans[-1][1] == offsets[i]:
+                    spans[-1][1] = end
+                else:
+                    spans.append([offsets[i], end])
+        return spans
+
+    def lines(self, low, high):
+        """
+            Yield the lines of the dump with addresses from low up to high,
+            with the lines without an address (labels, section headers)
+            that come before or between them. Spans are read a line at a
+            time, so a wide range does not hold the dump in memory
+        """
+        match = ADDRESS.match
+        with open(self.path, 'rb') as f:
+            readline = f.readline
+            for start, end in self.spans(low, high):
+                f.seek(start)
+                position = start
+                pending = []
+                while position < end:
+                    line = readline()
+                    if not line:
+                        break
+                    position += len(line)
+                    m = match(line)
+                    if m is None:
+                        pending.append(line)
+                    elif low <= int(m.group(1), 16) < high:
+                        for p in pending:
+                            yield p
+                        pending = []
+                        yield line
+                    else:
+                        pending = []
@@ -0,0 +1,112 @@
+"""
+    Output stage for the XS1 Decoder
+
+    Collects output lines and writes them in large batches, or after every
+    line when the output is an interactive pipe. Decoded instructions can
+    also be written as records: JSON lines, CSV, or a compact binary format
+    of fixed size records that read_records reads back.
+
+    The binary format starts with a header line "XS1R <version>", a line of
+    the mnemonic names for IDs 1 and up, and then one record per instruction
+    of address (0xffffffff for none), low word, high word, length in bytes
+    and mnemonic ID, all little-endian.
+"""
+
+import struct
+
+# Version of the binary record format
+RECORD_VERSION = 1
+# address, low, high, length, mnemonic ID
+RECORD = struct.Struct('<IHHBH')
+# Address of records for plain hex lines
+NO_ADDRESS = 0xffffffff
+
+FORMATS = ('text', 'jsonl', 'csv', 'binary')
+
+
+class XS1Writer(object):
+    """
+        Buffered writer of output lines and instruction records in one of
+        FORMATS. Text output is lines, record output is formatted per format
+    """
+    def __init__(self, stream, fmt='text', mnemonics=None, line_buffered=False,
+            buffer_lines=8192):
+        if fmt not in FORMATS:
+            raise ValueError('unknown output format {!r}'.format(fmt))
+        self.stream = stream
+        self.format = fmt
+        self.line_buffered = line_buffered
+        self.limit = 1 if line_buffered else buffer_lines
+        self.buffer = []
+        self.mnemonic_ids = None
+        if fmt == 'csv':
+            self.buffer.append('address,low,high,length,mnemonic\n')
+        elif fmt == 'binary':
+            self.mnemonic_ids = dict(
+                (name, mid) for mid, name in enumerate(mnemonics))
+            self.buffer.append('XS1R {}\n{}\n'.format(
+                RECORD_VERSION, ' '.join(mnemonics[1:])))
+        self.record = getattr(self, 'record_' + fmt)
+
+    def line(self, text):
+        """
+            Write a line of text
+        """
+        self.buffer.append(text + '\n')
+        if len(self.buffer) >= self.limit:
+            self.flush()
+
+    def record_text(self, address, low, high, length, mnemonic):
+        self.line(mnemonic)
+
+    def record_jsonl(self, address, low, high, length, mnemonic):
+        self.line('{{"address": {}, "low": {}, "high": {}, "length": {}, '
+            '"mnemonic": "{}"}}'.format('null' if address is None else address,
+                low, high, length, mnemonic))
+
+    def record_csv(self, address, low, high, length, mnemonic):
+        self.line('{},{},{},{},{}'.format('' if address is None else address,
+            low, high, length, mnemonic))
+
+    def record_binary(self, address, low, high, length, mnemonic):
+        self.buffer.append(RECORD.pack(
+            NO_ADDRESS if address is None else address, low, high, length,
+            self.mnemonic_ids[mnemonic]))
+        if len(self.buffer) >= self.limit:
+            self.flush()
+
+    def flush(self):
+        """
+            Write out the buffered output
+        """
+        if self.buffer:
+            self.stream.write(''.join(self.buffer))
+            del self.buffer[:]
+        self.stream.flush()
+
+
+def read_records(f):
+    """
+        Read a binary record file, yielding (address, low, high, length,
+        mnemonic) with address None for plain hex lines
+    """
+    magic, version = f.readline().split()
+    if magic != 'XS1R' or int(version) != RECORD_VERSION:
+        raise ValueError('not an XS1R version {} file'.format(RECORD_VERSION))
+    mnemonics = [None] + f.readline().split()
+    size = RECORD.size
+    data = ''
+    while True:
+        more = f.read(size * 4096)
+        if not more:
+            break
+        data += more
+        end = len(data) - len(data) % size
+        for offset in xrange(0, end, size):
+            address, low, high, length, mid = RECORD.unpack_from(data, offset)
+            if address == NO_ADDRESS:
+                address = None
+            yield address, low, high, length, mnemonics[mid]
+        data = data[end:]
+    if data:
+        raise ValueError('truncated record at end of file')
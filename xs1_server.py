@@ -0,0 +1,154 @@
+"""
+    Decode server for the XS1 Decoder
+
+    Keeps one decoder, with its tables built, in a long running process that
+    listens on a Unix socket, so that tools which decode often do not pay for
+    interpreter start-up and table building on every call.
+
+    The protocol is one JSON object per line in each direction. A request
+    holds a batch of lines of hex or xobjdump output and how to decode them:
+
+        {"lines": ["dd a6", ...], "mode": "default"}
+
+    where mode is "default", "sub" or "merge" (which also takes a "merge"
+    prefix), as for the command line. The response holds one result per
+    line, in the same order, null where a line does not decode:
+
+        {"results": ["MKMSK_rus", ...]}
+
+    A request that cannot be handled at all gets {"error": "..."} instead.
+"""
+
+import errno
+import json
+import os
+import socket
+import SocketServer
+import stat
+
+
+class XS1RequestHandler(SocketServer.StreamRequestHandler):
+    """
+        Answer requests on one connection until the client closes it
+    """
+    def handle(self):
+        for request in iter(self.rfile.readline, ''):
+            try:
+                response = {'results': self.server.decode(json.loads(request))}
+            except Exception as e:
+                response = {'error': '{}: {}'.format(type(e).__name__, e)}
+            self.wfile.write(json.dumps(response) + '\n')
+            self.wfile.flush()
+
+
+class XS1DecodeServer(SocketServer.ThreadingMixIn,
+        SocketServer.UnixStreamServer):
+    """
+        Decode server on a Unix socket, with a thread per connection sharing
+        one decoder
+    """
+    daemon_threads = True
+
+    def __init__(self, path, decoder):
+        self.path = path
+        self.decoder = decoder
+        # Lines that fail are answered with null rather than reported on
+        # the server's standard output
+        decoder.diagnostic = lambda text: None
+        self.remove_stale_socket()
+        SocketServer.UnixStreamServer.__init__(self, path, XS1RequestHandler)
+
+    def remove_stale_socket(self):
+        """
+            Remove a socket left at path by a server that is no longer
+            running. Raises socket.error if path is anything else, or a
+            server still answers on it
+        """
+        try:
+            mode = os.lstat(self.path).st_mode
+        except OSError:
+            return
+        if not stat.S_ISSOCK(mode):
+            raise socket.error(errno.EEXIST,
+                '{} exists and is not a socket'.format(self.path))
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(self.path)
+        except socket.error:
+            os.unlink(self.path)
+            return
+        finally:
+            probe.close()
+        raise socket.error(errno.EADDRINUSE,
+            'a server is already listening on {}'.format(self.path))
+
+    def decode(self, request):
+        """
+            Decode the lines of a request, returning their results in order
+        """
+        mode = request.get('mode', 'default')
+        if mode == 'default':
+            merge, replace = None, False
+        elif mode == 'sub':
+            merge, replace = None, True
+        elif mode == 'merge':
+            merge, replace = request.get('merge', ''), False
+        else:
+            raise ValueError('unknown mode {!r}'.format(mode))
+        decode_line = self.decoder.decode_line
+        results = []
+        for line in request['lines']:
+            try:
+                results.append(
+                    decode_line(line.encode('utf-8'), merge, replace))
+            except Exception:
+                results.append(None)
+        return results
+
+    def server_close(self):
+        SocketServer.UnixStreamServer.server_close(self)
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+class XS1Client(object):
+    """
+        Connection to an XS1DecodeServer, which may be reused for any number
+        of requests
+    """
+    def __init__(self, path):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(path)
+        self.rfile = self.sock.makefile('rb')
+
+    def decode(self, lines, mode='default', merge=None):
+        """
+            Decode a batch of lines, returning a list of results in the same
+            order, with None for lines that do not decode
+        """
+        request = {'lines': list(lines), 'mode': mode}
+        if merge is not None:
+            request['merge'] = merge
+        self.sock.sendall(json.dumps(request) + '\n')
+        response = json.loads(self.rfile.readline())
+        if 'error' in response:
+            raise RuntimeError(response['error'])
+        return response['results']
+
+    def close(self):
+        """
+            Close the connection
+        """
+        self.rfile.close()
+        self.sock.close()
+
+
+def decode_remote(path, lines, mode='default', merge=None):
+    """
+        Decode a batch of lines with the server at path, in one connection
+    """
+    client = XS1Client(path)
+    try:
+        return client.decode(lines, mode, merge)
+    finally:
+        client.close()
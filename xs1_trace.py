@@ -0,0 +1,147 @@
+"""
+    Instruction mix of xsim instruction traces for the XS1 Decoder
+
+    Reads the output of xsim --trace and counts the executed instructions per
+    hardware thread. Each program counter of each tile is decoded once, from
+    that tile's image in the program's ELF file or its xobjdump output, and
+    counted by mnemonic ID, so memory stays constant however long the trace
+    is.
+"""
+
+import re
+from array import array
+
+# Tile number of a trace's core name, e.g. 1 for "tile[1]" or "stdcore[1]"
+TILE = re.compile(r'.*\[(\d+)\]$')
+
+
+def dump_lookup(lines, decoder=None):
+    """
+        lookup_id for InstructionMix from xobjdump output, decoding each
+        tile's program on its own with dump_programs. A dump without
+        "Loadable" headers is the program of every core
+    """
+    from xs1_cfg import dump_programs
+    programs = dump_programs(lines, decoder)
+    images = dict((tile, image) for tile, image, unused in programs)
+    shared = images.get(None)
+    def lookup_id(core, pc):
+        image = images.get(core, shared)
+        return image.lookup_id(pc) if image is not None else 0
+    return lookup_id
+
+
+def elf_lookup(code):
+    """
+        lookup_id for InstructionMix from an XS1ElfCode, decoding the
+        image of the tile numbered in the core name. An ELF file of a single
+        image is the program of every core
+    """
+    def lookup_id(core, pc):
+        if len(code.images) == 1:
+            return code.decode_id(pc)
+        m = TILE.match(core)
+        return code.decode_id(pc, int(m.group(1))) if m else 0
+    return lookup_id
+
+
+class InstructionMix(object):
+    """
+        Executed instruction counts per thread, indexed by mnemonic ID
+    """
+    # Trace line, e.g.
+    # tile[0]@1- -A-.----00010004 (_start + 4) : ldw r0, sp[0x1] @1290
+    # capturing the core, the thread and the program counter
+    tracematcher = re.compile(
+        r'\s*(\S+?)@(\d+)-.*?([0-9a-f]{8})\s*\(', re.I)
+
+    def __init__(self, lookup_id, catalogue):
+        """
+            lookup_id maps a core name, e.g. "tile[0]", and a program counter
+            to a mnemonic ID, which indexes the decoder's catalogue of
+            XS1Instructions. See dump_lookup and elf_lookup
+        """
+        self.lookup_id = lookup_id
+        self.catalogue = catalogue
+        self.memo = {}
+        self.threads = {}
+        self.lines = 0
+        self.unmatched = 0
+
+    def add_trace(self, lines):
+        """
+            Count the instructions executed in an iterable of trace lines
+        """
+        match = self.tracematcher.match
+        memo = self.memo
+        threads = self.threads
+        lookup_id = self.lookup_id
+        size = len(self.catalogue)
+        for line in lines:
+            self.lines += 1
+            m = match(line)
+            if not m:
+                self.unmatched += 1
+                continue
+            core, thread, pc = m.groups()
+            pc = int(pc, 16)
+            mid = memo.get((core, pc))
+            if mid is None:
+                mid = memo[core, pc] = lookup_id(core, pc)
+            key = core, int(thread)
+            counts = threads.get(key)
+            if counts is None:
+                counts = threads[key] = array('L', [0]) * size
+            counts[mid] += 1
+
+    def overall(self):
+        """
+            Counts summed over all threads
+        """
+        total = array('L', [0]) * len(self.catalogue)
+        for counts in self.threads.values():
+            for mid, count in enumerate(counts):
+                total[mid] += count
+        return total
+
+    def histogram(self, counts):
+        """
+            Lines of a histogram by mnemonic and by encoding, most executed
+            first. Instructions at addresses that do not decode are counted
+            as (unknown)
+        """
+        total = sum(counts) or 1
+        by_name = {}
+        by_encoding = {}
+        for mid, count in enumerate(counts):
+            if count:
+                instruction = self.catalogue[mid]
+                if instruction is None:
+                    name = encoding = '(unknown)'
+                else:
+                    name = instruction.name
+                    encoding = instruction.encoding or name
+                by_name[name] = by_name.get(name, 0) + count
+                by_encoding[encoding] = by_encoding.get(encoding, 0) + count
+        lines = ['  executed {}'.format(sum(counts))]
+        for title, table in (('mnemonic', by_name), ('encoding', by_encoding)):
+            lines.append('  by {}:'.format(title))
+            lines += ['    {:<16} {:>12} {:>7.2f}%'.format(
+                    key, count, 100.0 * count / total)
+                for key, count in sorted(table.items(),
+                    key=lambda item: (-item[1], item[0]))]
+        return lines
+
+    def report(self):
+        """
+            Histogram for each thread, then overall
+        """
+        lines = []
+        for core, thread in sorted(self.threads):
+            lines.append('{}@{}:'.format(core, thread))
+            lines += self.histogram(self.threads[core, thread])
+        lines.append('overall ({} trace lines, {} not instructions, {} '
+            'distinct tile addresses):'.format(
+                self.lines, self.unmatched, len(self.memo)))
+        lines += self.histogram(self.overall())
+        return '\n'.join(lines)